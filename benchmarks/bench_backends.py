@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Сравнение --backend kubernetes и --backend lite на одном наборе манифестов.
+
+Для каждого backend в отдельном процессе замеряется время импорта и подключения (connect),
+затем для каждого документа из файлов - LIST коллекции его kind и GET самого объекта
+(только чтение, кластер не меняется). Нужен рабочий kubeconfig.
+
+    python benchmarks/bench_backends.py -n NAMESPACE [--runs N] FILE...
+
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+BACKEND_NAMES = ('kubernetes', 'lite')
+
+
+def run_backend(backend_name, namespace, filenames):
+    """ Выполняется в дочернем процессе: печатает JSON с временами в мс """
+    t0 = time.perf_counter()
+    from dotdict import LazyDotDict
+    from kube_deploy.backend import backend
+    from kube_deploy.kube import ApiError
+    from kube_deploy.manifests import load_files
+    from kube_deploy.options import Options
+    from kube_deploy.resources import RESOURCE_TYPES
+    Options.backend = backend_name
+    backend().connect()
+    t1 = time.perf_counter()
+
+    docs = [LazyDotDict(doc) for file_docs in load_files(filenames, jobs=1) for doc in file_docs if doc]
+    requests = 0
+    for doc in docs:
+        resource_type = RESOURCE_TYPES.get(doc.kind)
+        if resource_type is None:
+            continue
+        resource_type.list(namespace)
+        try:
+            resource_type.read(namespace, doc.metadata.name)
+        except ApiError as exc:
+            if exc.status != 404:
+                raise
+        requests += 2
+    t2 = time.perf_counter()
+    print(json.dumps({'startup_ms': (t1 - t0) * 1000, 'requests_ms': (t2 - t1) * 1000, 'requests': requests}))
+
+
+def measure(backend_name, namespace, filenames):
+    output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--child', backend_name,
+                                      '-n', namespace] + filenames, cwd=REPO_DIR, universal_newlines=True)
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--namespace', '-n', required=True)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--child', choices=BACKEND_NAMES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_backend(args.child, args.namespace, args.files)
+        return
+
+    print('%-12s %14s %14s %10s' % ('backend', 'startup, ms', 'requests, ms', 'requests'))
+    for backend_name in BACKEND_NAMES:
+        measure(backend_name, args.namespace, args.files)  # прогрев .pyc и соединения
+        results = [measure(backend_name, args.namespace, args.files) for __ in range(args.runs)]
+        print('%-12s %14.1f %14.1f %10d' % (backend_name,
+                                            statistics.median(r['startup_ms'] for r in results),
+                                            statistics.median(r['requests_ms'] for r in results),
+                                            results[0]['requests']))
+
+
+if __name__ == '__main__':
+    main()
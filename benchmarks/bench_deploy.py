@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Сквозной бенчмарк на заглушке API сервера (kube_lite.fake_apiserver), без кластера.
+
+Для каждой нагрузки и размера (по умолчанию 10, 100 и 1000 ресурсов) замеряются wall time,
+число запросов к API (по счетчику сервера) и пиковая память (max RSS) процесса-клиента:
+
+    super_apply - выкатка набора ConfigMap + Deployment + Service в пустой namespace (super_apply.main)
+    kube_api    - KubernetesApi: POST каждого ConfigMap, постраничный LIST, GET каждого, deletecollection
+
+Сервер работает в процессе бенчмарка, нагрузка - в новом дочернем процессе, поэтому память
+сервера в замер не попадает. Клиентское ограничение частоты запросов по умолчанию выключено
+(--qps 0), иначе на больших размерах замер показывает только его.
+
+    python benchmarks/bench_deploy.py [--sizes 10,100,1000] [--workloads super_apply,kube_api] [--runs N]
+                                      [--latency SECONDS] [--qps N] [--check] [--record]
+
+С --check код возврата 1, если медиана хуже ориентира из deploy_baseline.json больше, чем на допуск
+(время и память) или число запросов выросло. С --record результат записывается в deploy_baseline.json.
+
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+BASELINE_FILE = os.path.join(BENCH_DIR, 'deploy_baseline.json')
+sys.path.insert(0, REPO_DIR)
+
+WORKLOADS = ('super_apply', 'kube_api')
+SIZES = (10, 100, 1000)
+NAMESPACE = 'bench'
+# допустимое ухудшение относительно ориентира, доли
+TOLERANCE = {'wall_ms': 0.5, 'peak_rss_kb': 0.2, 'requests': 0}
+RESULT_PREFIX = 'BENCH '
+
+
+def write_bundle(path, size):
+    """ size документов: тройки ConfigMap, Deployment (читает ConfigMap) и Service со своей меткой app """
+    docs = []
+    for i in range(size):
+        group, kind = divmod(i, 3)
+        name = 'svc-%s' % group
+        labels = {'app': name}
+        if kind == 0:
+            docs.append({'apiVersion': 'v1', 'kind': 'ConfigMap', 'metadata': {'name': name, 'labels': labels},
+                         'data': {'index': str(group)}})
+        elif kind == 1:
+            container = {'name': 'app', 'image': 'registry.local/app:1', 'envFrom': [{'configMapRef': {'name': name}}]}
+            docs.append({'apiVersion': 'extensions/v1beta1', 'kind': 'Deployment',
+                         'metadata': {'name': name, 'labels': labels},
+                         'spec': {'selector': {'matchLabels': labels},
+                                  'template': {'metadata': {'labels': labels}, 'spec': {'containers': [container]}}}})
+        else:
+            docs.append({'apiVersion': 'v1', 'kind': 'Service', 'metadata': {'name': name, 'labels': labels},
+                         'spec': {'selector': labels, 'ports': [{'port': 80}]}})
+    with open(path, 'w') as f:
+        # JSON - подмножество YAML
+        f.write('\n---\n'.join(json.dumps(doc) for doc in docs))
+
+
+def run_super_apply(size, workdir, args):
+    import super_apply
+    super_apply.main([os.path.join(workdir, 'bundle.yaml'), '--app-name', 'bench', '--namespace', NAMESPACE,
+                      '--backend', args.backend, '--qps', str(args.qps), '--parallelism', '8', '--wait', '300',
+                      '--no-manifest-cache', '--quiet'])
+
+
+def run_kube_api(size, workdir, args):
+    from kube_lite.direct_api import KubernetesApi
+    from kube_lite.document import Document
+    from kube_lite.flowcontrol import FlowControl
+    KubernetesApi.flow_control = FlowControl(qps=args.qps)
+    KubernetesApi.init_from_kubeconfig()
+    for i in range(size):
+        KubernetesApi.create(Document({'apiVersion': 'v1', 'kind': 'ConfigMap',
+                                       'metadata': {'name': 'cm-%s' % i, 'namespace': NAMESPACE,
+                                                    'labels': {'app': 'bench'}},
+                                       'data': {'index': str(i)}}))
+    names = [item['metadata']['name'] for item in KubernetesApi.iter_list('configmap', namespace=NAMESPACE,
+                                                                         page_size=100)]
+    assert len(names) == size, len(names)
+    for name in names:
+        KubernetesApi.get('configmap', name, namespace=NAMESPACE)
+    KubernetesApi.call('DELETE', KubernetesApi.kind_path('configmap', namespace=NAMESPACE),
+                       params={'labelSelector': 'app=bench'})
+
+
+def run_child(workload, size, workdir, args):
+    """ Выполняется в дочернем процессе: последней строкой печатает результат в JSON """
+    import resource
+    t = time.perf_counter()
+    {'super_apply': run_super_apply, 'kube_api': run_kube_api}[workload](size, workdir, args)
+    wall_ms = (time.perf_counter() - t) * 1000
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(RESULT_PREFIX + json.dumps({'wall_ms': wall_ms, 'peak_rss_kb': peak_rss_kb}), flush=True)
+
+
+def measure(workload, size, args):
+    from kube_lite.fake_apiserver import FakeApiServer
+    with tempfile.TemporaryDirectory(prefix='bench_deploy-') as workdir, \
+            FakeApiServer(latency=args.latency, ready_delay=args.ready_delay) as server:
+        kubeconfig = server.write_kubeconfig(os.path.join(workdir, 'kubeconfig'), namespace=NAMESPACE)
+        if workload == 'super_apply':
+            write_bundle(os.path.join(workdir, 'bundle.yaml'), size)
+        env = dict(os.environ, KUBECONFIG=kubeconfig, XDG_CACHE_HOME=os.path.join(workdir, 'cache'))
+        output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--child', workload,
+                                          '--child-size', str(size), '--child-workdir', workdir,
+                                          '--backend', args.backend, '--qps', str(args.qps)],
+                                         cwd=REPO_DIR, env=env, universal_newlines=True)
+        result = json.loads([line for line in output.splitlines() if line.startswith(RESULT_PREFIX)][-1]
+                            [len(RESULT_PREFIX):])
+        # discovery зависит от кеша на диске, а не от нагрузки
+        result['requests'] = server.request_count - server.request_counts['discovery']
+        return result
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                                       universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def check(key, result, baseline):
+    """ Сообщения о регрессиях result относительно baseline """
+    regressions = []
+    for metric, tolerance in TOLERANCE.items():
+        if result[metric] > baseline[metric] * (1 + tolerance):
+            regressions.append('%s %s: %.0f > baseline %.0f (+%d%%)' % (key, metric, result[metric], baseline[metric],
+                                                                      tolerance * 100))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default=','.join(map(str, SIZES)))
+    parser.add_argument('--workloads', default=','.join(WORKLOADS))
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--backend', default='lite', help='super_apply --backend')
+    parser.add_argument('--latency', type=float, default=0, metavar='SECONDS',
+                        help='Delay every API request by SECONDS on the server')
+    parser.add_argument('--qps', type=float, default=0, metavar='N',
+                        help='Client rate limit (super_apply --qps), 0 - unlimited')
+    parser.add_argument('--ready-delay', type=float, default=0.01, metavar='SECONDS',
+                        help='Time for a pod to become ready on the fake server')
+    parser.add_argument('--check', action='store_true', help='Exit with 1 on a regression against %s' % BASELINE_FILE)
+    parser.add_argument('--record', action='store_true', help='Save the results to %s' % BASELINE_FILE)
+    parser.add_argument('--child', choices=WORKLOADS, help=argparse.SUPPRESS)
+    parser.add_argument('--child-size', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--child-workdir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.child_size, args.child_workdir, args)
+        return
+
+    try:
+        with open(BASELINE_FILE) as f:
+            baseline = json.load(f)
+    except OSError:
+        baseline = {'results': {}}
+
+    results = {}
+    print('%-24s %12s %10s %14s' % ('workload', 'wall, ms', 'requests', 'peak RSS, MB'))
+    for workload in args.workloads.split(','):
+        for size in map(int, args.sizes.split(',')):
+            runs = [measure(workload, size, args) for __ in range(args.runs)]
+            key = '%s/%s' % (workload, size)
+            results[key] = {metric: statistics.median(run[metric] for run in runs)
+                            for metric in ('wall_ms', 'requests', 'peak_rss_kb')}
+            print('%-24s %12.1f %10d %14.1f' % (key, results[key]['wall_ms'], results[key]['requests'],
+                                                results[key]['peak_rss_kb'] / 1024), flush=True)
+
+    regressions = []
+    for key, result in results.items():
+        if key in baseline['results']:
+            regressions.extend(check(key, result, baseline['results'][key]))
+    for message in regressions:
+        print('REGRESSION: %s' % message)
+
+    if args.record:
+        baseline = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'revision': git_revision(),
+                    'python': platform.python_version(), 'latency': args.latency, 'qps': args.qps,
+                    'results': dict(baseline['results'], **results)}
+        with open(BASELINE_FILE, 'w') as f:
+            json.dump(baseline, f, indent=4, sort_keys=True)
+            f.write('\n')
+    if args.check and regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Сравнение DotDict и LazyDotDict на типичном для read_docs сценарии:
+документы загружаются целиком, а читаются только kind, metadata и пара полей spec.
+
+    python benchmarks/bench_dotdict.py [--docs N] [--keys N]
+
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from dotdict import DotDict, LazyDotDict
+
+
+def make_docs(n_docs, n_keys):
+    docs = []
+    for i in range(n_docs):
+        docs.append({'apiVersion': 'v1', 'kind': 'ConfigMap',
+                     'metadata': {'name': 'config-%s' % i, 'labels': {'app': 'bench'}},
+                     'data': {'key-%s' % k: {'value': 'x' * 40, 'items': [{'n': k}, {'n': k + 1}]}
+                              for k in range(n_keys)}})
+    return docs
+
+
+def touch(doc):
+    # то, что делают index_resources/apply_document с большинством документов
+    return doc.kind, doc.metadata.name, doc.metadata.labels.app
+
+
+def measure(cls, n_docs, n_keys):
+    raw = make_docs(n_docs, n_keys)
+    tracemalloc.start()
+    t = time.perf_counter()
+    docs = [cls(d) for d in raw]
+    for doc in docs:
+        touch(doc)
+    elapsed = time.perf_counter() - t
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, current, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--docs', type=int, default=200)
+    parser.add_argument('--keys', type=int, default=500)
+    args = parser.parse_args()
+
+    print('%d documents x %d keys' % (args.docs, args.keys))
+    print('%-12s %10s %14s %14s' % ('class', 'time, s', 'retained, KiB', 'peak, KiB'))
+    for cls in (DotDict, LazyDotDict):
+        elapsed, current, peak = measure(cls, args.docs, args.keys)
+        print('%-12s %10.3f %14d %14d' % (cls.__name__, elapsed, current // 1024, peak // 1024))
+
+
+if __name__ == '__main__':
+    main()
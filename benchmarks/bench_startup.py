@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Время холодного старта super_apply: wall time запуска команды из startup_budget.json
+в новом процессе и разбивка импортов по данным python -X importtime.
+
+    python benchmarks/bench_startup.py [--runs N] [--top N] [--record]
+
+Код возврата 1, если медиана превышает бюджет. С --record результат дописывается
+в startup_history.jsonl, чтобы видеть изменения от коммита к коммиту.
+
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+BUDGET_FILE = os.path.join(BENCH_DIR, 'startup_budget.json')
+HISTORY_FILE = os.path.join(BENCH_DIR, 'startup_history.jsonl')
+
+
+def run(command, importtime=False):
+    args = [sys.executable]
+    if importtime:
+        args += ['-X', 'importtime']
+    t = time.perf_counter()
+    result = subprocess.run(args + command, cwd=REPO_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            universal_newlines=True)
+    return (time.perf_counter() - t) * 1000, result.stderr
+
+
+def parse_importtime(stderr):
+    """ [(module, self_us, cumulative_us, depth)] в порядке вывода """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                                       universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--top', type=int, default=15, help='Show N slowest top-level imports')
+    parser.add_argument('--record', action='store_true', help='Append the result to %s' % HISTORY_FILE)
+    args = parser.parse_args()
+
+    with open(BUDGET_FILE) as f:
+        budget = json.load(f)
+    command = budget['command']
+
+    run(command)  # прогрев файлового кеша и .pyc
+    wall_ms = statistics.median(run(command)[0] for __ in range(args.runs))
+    __, stderr = run(command, importtime=True)
+    rows = parse_importtime(stderr)
+    top_level = [row for row in rows if row[3] == 0]
+    import_ms = sum(row[2] for row in top_level if row[0] != 'site') / 1000
+
+    print('command: python %s' % ' '.join(command))
+    print('%-40s %12s' % ('top-level import', 'cumul, ms'))
+    for name, __, cumulative_us, __ in sorted(top_level, key=lambda row: -row[2])[:args.top]:
+        print('%-40s %12.1f' % (name, cumulative_us / 1000))
+    print()
+    print('wall time (median of %d): %.1f ms, budget %s ms' % (args.runs, wall_ms, budget['wall_ms']))
+    print('imports (without site):   %.1f ms, budget %s ms' % (import_ms, budget['import_ms']))
+
+    if args.record:
+        with open(HISTORY_FILE, 'a') as f:
+            f.write(json.dumps({'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'revision': git_revision(),
+                                'python': sys.version.split()[0], 'wall_ms': round(wall_ms, 1),
+                                'import_ms': round(import_ms, 1)}) + '\n')
+
+    over_budget = wall_ms > budget['wall_ms'] or import_ms > budget['import_ms']
+    if over_budget:
+        print('OVER BUDGET')
+    return 1 if over_budget else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
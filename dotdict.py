@@ -66,3 +66,73 @@ class DotDict(dict):
         return DotDict(data)
 
 
+
+
+class LazyDotDict(DotDict):
+    """
+    DotDict that wraps nested mappings on first access instead of converting the whole tree
+    in the constructor. Attribute and default semantics are the same as in DotDict,
+    but nodes do not keep the _user_defined_attrs set.
+
+    Nested dicts and lists are wrapped into new containers that replace the originals in
+    this node, so the same object is returned on repeated access and changes to it are kept.
+    The data passed to the constructor is not modified.
+
+    """
+    _default = None
+
+    def __init__(self, data_dict=None, default=None, *args, **kwargs):
+        dict.__init__(self, data_dict or kwargs)
+        if default is not None:
+            self._default = default
+
+    def __setattr__(self, k, v):
+        if k[0] == '_' or k in self.__dict__:
+            return object.__setattr__(self, k, v)
+        else:
+            self[k] = v
+
+    def __getitem__(self, k):
+        v = dict.__getitem__(self, k)
+        wrapped = LazyDotDict._wrap(v)
+        if wrapped is not v:
+            dict.__setitem__(self, k, wrapped)
+        return wrapped
+
+    @staticmethod
+    def _wrap(v):
+        if isinstance(v, dict):
+            if not isinstance(v, DotDict):
+                return LazyDotDict(v)
+        elif isinstance(v, list):
+            for i, item in enumerate(v):
+                wrapped = LazyDotDict._wrap(item)
+                if wrapped is not item:
+                    # the caller's list is left as is; an already wrapped list is returned unchanged
+                    return v[:i] + [wrapped] + [LazyDotDict._wrap(rest) for rest in v[i + 1:]]
+        return v
+
+    def get(self, k, default=None):
+        if k in self:
+            return self[k]
+        return default
+
+    def setdefault(self, k, default=None):
+        if k not in self:
+            dict.__setitem__(self, k, default)
+        return self[k]
+
+    def pop(self, k, *args):
+        return LazyDotDict._wrap(dict.pop(self, k, *args))
+
+    def _wrap_all(self):
+        for k in self:
+            self[k]
+
+    def items(self):
+        self._wrap_all()
+        return dict.items(self)
+
+    def values(self):
+        self._wrap_all()
+        return dict.values(self)
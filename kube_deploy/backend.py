@@ -0,0 +1,396 @@
+import contextvars
+import functools
+import json
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+
+from dotdict import LazyDotDict
+from kube_deploy.kube import ApiError
+from kube_deploy.log import DEBUG, LOG_CHUNK_SIZE, iter_log_lines
+from kube_deploy.options import Options
+from kube_deploy.tracing import api_span
+
+WATCH_TIMEOUT = 300
+CONNECT_TIMEOUT = 10
+# watch, открытые во время выкатки: Deployment, ReplicaSet и Pod (RolloutTracker)
+WATCH_CONNECTIONS = 3
+
+
+def _json_default(value):
+    # даты из YAML (SafeLoader) - в том виде, в каком их ждет сервер
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def to_json(doc):
+    return json.dumps(doc, default=_json_default)
+
+
+class Backend:
+    """
+    Транспорт до API сервера. Ответы - JSON-документы (LazyDotDict) с именами полей как в API
+    (camelCase), ошибки - ApiError; сами запросы строятся в Resource и NamespaceController.
+
+    """
+    name = NotImplemented
+    # kube_lite.flowcontrol.FlowControl этого подключения, создается в connect()
+    flow_control = None
+
+    def __init__(self, context=None):
+        # context - имя контекста kubeconfig, None - текущий
+        self.context = context
+
+    def connect(self):
+        raise NotImplementedError
+
+    def current_namespace(self):
+        raise NotImplementedError
+
+    def request(self, method, path, params=None, body=None, content_type='application/json'):
+        """ -> (документ, HTTP status, заголовки ответа) """
+        raise NotImplementedError
+
+    def stream(self, method, path, params=None, timeout=None, on_open=None):
+        """
+        Генератор кусков тела ответа по мере поступления. on_open(abort) вызывается, когда ответ получен:
+        abort() из другого потока обрывает соединение, и чтение в генераторе сразу заканчивается
+
+        """
+        raise NotImplementedError
+
+    def call(self, method, path, params=None, body=None, content_type='application/json'):
+        return self.request(method, path, params, body, content_type)[0]
+
+    def get(self, path, **params):
+        return self.call('GET', path, params)
+
+    def watch(self, path, label_selector=None, field_selector=None):
+        return Watch(self, path, label_selector, field_selector)
+
+
+def metrics_collector():
+    """ kube_lite.metrics.Metrics текущего запуска или None, если --metrics-out не задан """
+    if not Options.metrics_out:
+        return None
+    from kube_lite import metrics
+    return metrics.current()
+
+
+def _body_size(body):
+    if body is None:
+        return 0
+    return len((body if isinstance(body, str) else to_json(body)).encode('utf-8'))
+
+
+def _abort_response(response):
+    """ Обрывает соединение потокового ответа urllib3; close() не будит поток, который ждет в recv """
+    sock = getattr(response.connection, 'sock', None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+def _pool_size():
+    """ Соединений в пуле: по одному на поток выкатки (--parallelism) или предзагрузки и на каждый watch """
+    from kube_deploy.resources import PREFETCH_THREADS
+    return max(getattr(Options, 'parallelism', None) or 1, PREFETCH_THREADS) + WATCH_CONNECTIONS
+
+
+def _flow_control():
+    from kube_lite.flowcontrol import FlowControl
+    return FlowControl(Options.qps, Options.burst)
+
+
+class Watch:
+    """
+    Поток событий ?watch=1 по коллекции path, по интерфейсу как kubernetes.watch.Watch:
+    stream() отдает (тип события, объект), resource_version - последняя увиденная версия.
+    Если версия устарела, stream() бросает ApiError со статусом 410
+
+    """
+    def __init__(self, backend, path, label_selector=None, field_selector=None):
+        self.backend = backend
+        self.path = path
+        self.label_selector = label_selector
+        self.field_selector = field_selector
+        self.resource_version = None
+        self._stopped = False
+        self._abort = None
+
+    def stop(self):
+        """ Можно вызвать из другого потока: соединение обрывается, не дожидаясь следующего события """
+        self._stopped = True
+        abort = self._abort
+        if abort is not None:
+            abort()
+
+    def _opened(self, abort):
+        self._abort = abort
+        # stop() мог прийти, пока соединение открывалось
+        if self._stopped:
+            abort()
+
+    def stream(self, resource_version=None, timeout_seconds=WATCH_TIMEOUT):
+        if self._stopped:
+            return
+        if resource_version:
+            self.resource_version = resource_version
+        params = {'watch': 'true', 'allowWatchBookmarks': 'true', 'timeoutSeconds': timeout_seconds,
+                  'labelSelector': self.label_selector, 'fieldSelector': self.field_selector,
+                  'resourceVersion': self.resource_version}
+        chunks = self.backend.stream('GET', self.path, params, timeout=timeout_seconds + CONNECT_TIMEOUT,
+                                     on_open=self._opened)
+        try:
+            for line in iter_log_lines(chunks):
+                # после обрыва может прийти недописанная строка
+                if self._stopped:
+                    return
+                if not line.strip():
+                    continue
+                event = json.loads(line)
+                obj = LazyDotDict(event['object'])
+                if event['type'] == 'ERROR':
+                    raise ApiError(obj.code, obj.reason, obj.message)
+                if obj.metadata and obj.metadata.resourceVersion:
+                    self.resource_version = obj.metadata.resourceVersion
+                if event['type'] == 'BOOKMARK':
+                    continue
+                yield event['type'], obj
+                if self._stopped:
+                    return
+        except (ConnectionError, OSError):
+            # соединение оборвал stop()
+            if not self._stopped:
+                raise
+        finally:
+            self._abort = None
+            chunks.close()
+
+
+class KubernetesClientBackend(Backend):
+    """ Пакет kubernetes: ApiClient.call_api без десериализации в модели """
+    name = 'kubernetes'
+
+    def __init__(self, context=None):
+        super().__init__(context)
+        self.api_client = None
+        self._config_file = None
+
+    def connect(self):
+        import os
+        import urllib3
+        from kubernetes import client, config
+        from kube_deploy.kube import DEFAULT_KUBE_CONFIG
+        if 'KUBECONFIG' in os.environ:
+            self._config_file = os.environ['KUBECONFIG']
+        elif os.path.exists(DEFAULT_KUBE_CONFIG):
+            self._config_file = DEFAULT_KUBE_CONFIG
+        else:
+            Options.parser.error('Kubernetes configuration not found in ~/.kube')
+        # своя конфигурация и свой пул соединений у каждого backend
+        configuration = client.Configuration()
+        configuration.connection_pool_maxsize = max(configuration.connection_pool_maxsize, _pool_size())
+        try:
+            config.load_kube_config(self._config_file, context=self.context, client_configuration=configuration)
+        except config.ConfigException as e:
+            Options.parser.error(str(e))
+        self.api_client = client.ApiClient(configuration)
+        self.flow_control = _flow_control()
+        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+    def current_namespace(self):
+        from kubernetes.config import list_kube_config_contexts
+        contexts, current_context = list_kube_config_contexts(self._config_file)
+        if self.context:
+            current_context = next(c for c in contexts if c['name'] == self.context)
+        return current_context['context'].get('namespace')
+
+    def _send(self, method, path, query_params, body, content_type, timeout):
+        """ -> недочитанный ответ urllib3; статус не 2xx - ApiException """
+        from kubernetes.client.rest import ApiException
+        header_params = {'Content-Type': content_type, 'Accept': 'application/json'}
+        if not hasattr(self.api_client, 'param_serialize'):
+            # клиент, сгенерированный openapi-generator до 7.0: call_api сам собирает запрос
+            return self.api_client.call_api(
+                path, method,
+                query_params=query_params,
+                header_params=header_params,
+                body=body,
+                auth_settings=['BearerToken'],
+                _return_http_data_only=True,
+                _preload_content=False,
+                _request_timeout=timeout)
+        request = self.api_client.param_serialize(method, path, query_params=query_params,
+                                                  header_params=header_params, body=body,
+                                                  auth_settings=['BearerToken'])
+        resp = self.api_client.call_api(*request[:4], _request_timeout=timeout).response
+        if not 200 <= resp.status <= 299:
+            raise ApiException(http_resp=resp)
+        return resp
+
+    def _call_api(self, method, path, params, body, content_type, timeout=None):
+        import urllib3
+        from kubernetes.client.rest import ApiException
+        query_params = [(k, v) for k, v in (params or {}).items() if v is not None]
+        collector = metrics_collector()
+        attempt = 0
+        while 1:
+            self.flow_control.acquire(method)
+            if collector is not None:
+                start = time.perf_counter()
+            try:
+                with api_span(method, path):
+                    resp = self._send(method, path, query_params, body, content_type, timeout)
+                if collector is not None:
+                    # потоковый ответ (timeout задан только для него) не дочитываем
+                    bytes_in = int(resp.headers.get('Content-Length') or 0) if timeout else len(resp.data)
+                    collector.observe_request(method, path, resp.status, time.perf_counter() - start,
+                                              bytes_in, _body_size(body))
+                return resp
+            except ApiException as exc:
+                if collector is not None:
+                    collector.observe_request(method, path, exc.status, time.perf_counter() - start,
+                                              len(exc.body or ''), _body_size(body))
+                delay = self.flow_control.retry_delay(method, attempt, exc.status,
+                                                      (exc.headers or {}).get('Retry-After'))
+                if delay is None:
+                    raise ApiError(exc.status, exc.reason, exc.body) from exc
+                error = exc.status
+            except urllib3.exceptions.HTTPError as exc:
+                if collector is not None:
+                    collector.observe_request(method, path, 'error', time.perf_counter() - start,
+                                              bytes_out=_body_size(body))
+                delay = self.flow_control.retry_delay(method, attempt)
+                if delay is None:
+                    raise ConnectionError(exc) from exc
+                error = exc
+            DEBUG('%s %s: %s, retry in %.1f s' % (method, path, error, delay))
+            time.sleep(delay)
+            attempt += 1
+
+    def request(self, method, path, params=None, body=None, content_type='application/json'):
+        resp = self._call_api(method, path, params, body, content_type)
+        return LazyDotDict(json.loads(resp.data or '{}')), resp.status, resp.headers
+
+    def stream(self, method, path, params=None, timeout=None, on_open=None):
+        import urllib3
+        resp = self._call_api(method, path, params, None, 'application/json', timeout=(CONNECT_TIMEOUT, timeout))
+        if on_open is not None:
+            on_open(functools.partial(_abort_response, resp))
+        try:
+            yield from resp.stream(LOG_CHUNK_SIZE)
+        except urllib3.exceptions.HTTPError as exc:
+            raise ConnectionError(exc) from exc
+        finally:
+            resp.release_conn()
+
+
+class LiteBackend(Backend):
+    """ kube_lite.KubernetesApi: requests и JSON, без пакета kubernetes """
+    name = 'lite'
+
+    def __init__(self, context=None):
+        super().__init__(context)
+        self.api = None
+        self._kubeconfig = None
+
+    def connect(self):
+        from kube_lite import KubernetesApi
+        from kube_lite.kubeconfig import KubeConfigError
+        from kube_lite.transport import TransportStats
+        # настройки KubernetesApi - атрибуты класса: у каждого backend свой подкласс со своим пулом
+        self.flow_control = _flow_control()
+        self.api = type('KubernetesApi', (KubernetesApi,), {'_session': None, 'stats': TransportStats(),
+                                                            'flow_control': self.flow_control})
+        try:
+            self._kubeconfig = self.api.init_from_kubeconfig(_pool_size(), context=self.context)
+        except KubeConfigError as e:
+            Options.parser.error(str(e))
+
+    def current_namespace(self):
+        return self._kubeconfig and self._kubeconfig.namespace
+
+    def request(self, method, path, params=None, body=None, content_type='application/json'):
+        from kube_lite import KubernetesError
+        data = body if body is None or isinstance(body, str) else to_json(body)
+        try:
+            r = self.api.call(method, path, data=data, params=params, headers={'Content-Type': content_type})
+        except KubernetesError as exc:
+            raise ApiError(exc.response.status_code, exc.response.reason, exc.response.text) from exc
+        return LazyDotDict(json.loads(r.text or '{}')), r.status_code, r.headers
+
+    def stream(self, method, path, params=None, timeout=None, on_open=None):
+        from kube_lite import KubernetesError
+        try:
+            r = self.api.call(method, path, params=params, stream=True, timeout=(CONNECT_TIMEOUT, timeout))
+        except KubernetesError as exc:
+            raise ApiError(exc.response.status_code, exc.response.reason, exc.response.text) from exc
+        if on_open is not None:
+            on_open(functools.partial(_abort_response, r.raw))
+        try:
+            yield from r.iter_content(chunk_size=None)
+        finally:
+            r.close()
+
+
+BACKENDS = {backend.name: backend for backend in (KubernetesClientBackend, LiteBackend)}
+_backend = None
+# backend цели, которую обслуживает текущий поток (см. use_backend)
+_current = contextvars.ContextVar('backend', default=None)
+
+
+def create_backend(context=None):
+    DEBUG('backend: %s, context: %s' % (Options.backend, context or '(current)'))
+    return BACKENDS[Options.backend](context)
+
+
+def backend():
+    """ Транспорт текущей цели, а вне use_backend - выбранный --backend для текущего контекста """
+    current = _current.get()
+    if current is not None:
+        return current
+    global _backend
+    if _backend is None or _backend.name != Options.backend:
+        _backend = create_backend()
+    return _backend
+
+
+# подключенные backend по (--backend, контекст, --qps, --burst), если их можно переиспользовать
+# (см. share_connections): ограничение частоты задается при подключении, у каждого запуска в демоне свое
+_connected = None
+_connected_lock = threading.Lock()
+
+
+def share_connections():
+    """ Для долгоживущего процесса: connected_backend() отдает одно подключение на контекст всем запускам """
+    global _connected
+    _connected = {}
+
+
+def connected_backend(context=None):
+    if _connected is None:
+        connected = create_backend(context)
+        connected.connect()
+        return connected
+    key = (Options.backend, context, Options.qps, Options.burst)
+    with _connected_lock:
+        if key not in _connected:
+            connected = create_backend(context)
+            connected.connect()
+            _connected[key] = connected
+        return _connected[key]
+
+
+@contextmanager
+def use_backend(target_backend):
+    token = _current.set(target_backend)
+    try:
+        yield target_backend
+    finally:
+        _current.reset(token)
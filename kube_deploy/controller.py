@@ -1,10 +1,13 @@
+import contextvars
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-from kube_deploy.kube import ResourceAlreadyExists, DeployTimeoutError, WaitTimeoutError
+from kube_deploy.failures import FailureClassifier
+from kube_deploy.kube import ApiError, ResourceAlreadyExists, DeployTimeoutError, WaitTimeoutError
 from kube_deploy.log import CONSOLE, DEBUG
 from kube_deploy.options import Options
-from kube_deploy.resources import RESOURCE_TYPES, supports_versions, Deployment, Pod
-from kubernetes import client
+from kube_deploy.resources import RESOURCE_TYPES, supports_versions, Deployment, Pod, ReplicaSet
+from kube_deploy.rollout import RolloutTracker
 
 
 # def owned_by_uid(doc, owner_uid):
@@ -18,54 +21,85 @@ class NamespaceController:
 
 
     def delete_resources(self, resource_type, selector, propagation_policy='Background', grace_period=None):
-        list_resp = resource_type.list(label_selector=selector, namespace=self.namespace)
-        for item in list_resp.items:
-            if not item.kind:
-                item.kind = resource_type.kind
+        for item in resource_type.iter_list(self.namespace, label_selector=selector):
             resource = resource_type(item)
             resource.delete(propagation_policy=propagation_policy, grace_period=grace_period)
 
 
-    def print_pod_errors(self, selector, seen_messages):
-        api = client.CoreV1Api()
-        response = api.list_namespaced_pod(namespace=self.namespace,
-                                           label_selector=selector)
-        for pod_doc in response.items:
+    def delete_collections(self, targets, propagation_policy='Background', grace_period=None,
+                           wait=False, timeout=120):
+        """
+        Удаляет объекты по списку (resource_type, selector): повторяющиеся пары пропускаются,
+        разные kind удаляются параллельно, по возможности - одним DELETE на коллекцию
+
+        """
+        targets = list(dict.fromkeys(targets))
+
+        def delete(target):
+            resource_type, selector = target
+            if not resource_type.delete_collection_supported:
+                self.delete_resources(resource_type, selector, propagation_policy, grace_period)
+            else:
+                resource_type.delete_collection(self.namespace, selector, propagation_policy, grace_period)
+            if wait and not Options.dry_run:
+                self.wait_until_deleted(resource_type, selector, timeout=timeout)
+
+        with ThreadPoolExecutor(max_workers=len(targets) or 1) as pool:
+            futures = [pool.submit(contextvars.copy_context().run, delete, target) for target in targets]
+            for future in futures:
+                future.result()
+
+
+    def print_pod_errors(self, selector, seen_messages, classifier=None):
+        for pod_doc in Pod.iter_list(self.namespace, label_selector=selector):
             Pod(pod_doc).print_status(pod_doc, seen_messages)
+            failure = classifier and classifier.check_pod(pod_doc)
+            if failure:
+                CONSOLE('#### Abort: %s' % failure)
+                raise failure
+
+
+    def rollout_tracker(self, selector, min_ready_replicas=1):
+        return RolloutTracker(self.namespace, selector, min_ready_replicas=min_ready_replicas)
 
 
     def wait_for_deployment(self, selector, timeout=None, min_ready_replicas=1):
         if timeout is None:
             timeout = Options.wait
-        api = client.ExtensionsV1beta1Api()
         start_t = time.time()
 
         seen_messages = set()
+        classifier = FailureClassifier.from_options()
 
         CONSOLE('#### Waiting for deployment(s) to start:', selector)
         while 1:
             rs = self._get_spawned_replica_set(selector)
             if rs:
-                response = api.read_namespaced_replica_set_status(rs.metadata.name, namespace=self.namespace)
-                if (response.status.ready_replicas or 0) >= min_ready_replicas:
+                response = ReplicaSet.read(self.namespace, rs.metadata.name + '/status')
+                if (response.status.readyReplicas or 0) >= min_ready_replicas:
                     return
-                DEBUG('Waiting for %s: ready_replicas=%s' % (rs.metadata.name, response.status.ready_replicas))
-                self.print_pod_errors(selector, seen_messages)
+                DEBUG('Waiting for %s: ready_replicas=%s' % (rs.metadata.name, response.status.readyReplicas))
+                self.print_pod_errors(selector, seen_messages, classifier)
+                if classifier:
+                    for owner in rs.metadata.ownerReferences or []:
+                        if owner.kind == 'Deployment':
+                            failure = classifier.check_deployment(Deployment.read(self.namespace, owner.name))
+                            if failure:
+                                raise failure
 
             if time.time() >= start_t + timeout:
                 raise DeployTimeoutError(selector)
             time.sleep(1)
 
     def _get_pods(self, selector):
-        api = client.CoreV1Api()
-        response = api.list_namespaced_pod(namespace=self.namespace,
-                                           label_selector=selector)
-        return response.items[-1] if response.items else None
+        pod = None
+        for pod in Pod.iter_list(self.namespace, label_selector=selector):
+            pass
+        return pod
 
     def wait_for_pod(self, selector, timeout=None):
         if timeout is None:
             timeout = Options.wait
-        api = client.CoreV1Api()
         start_t = time.time()
         seen_messages = set()
 
@@ -73,7 +107,7 @@ class NamespaceController:
         while 1:
             pod = self._get_pods(selector)
             if pod:
-                response = api.read_namespaced_pod_status(pod.metadata.name, namespace=self.namespace)
+                response = Pod.read(self.namespace, pod.metadata.name + '/status')
                 if response.status.phase == 'Succeeded':
                     return
                 DEBUG('Waiting for %s: phase=%s' % (pod.metadata.name, response.status.phase))
@@ -85,24 +119,41 @@ class NamespaceController:
 
 
     def _get_spawned_replica_set(self, selector):
-        api = client.ExtensionsV1beta1Api()
-        response = api.list_namespaced_replica_set(namespace=self.namespace,
-                                                   label_selector=selector)
-        return response.items[-1] if response.items else None
+        rs = None
+        for rs in ReplicaSet.iter_list(self.namespace, label_selector=selector):
+            pass
+        return rs
+
 
+    def _list_names(self, resource_type, selector):
+        """ Имена объектов и resourceVersion списка; сами объекты не накапливаются """
+        names = set()
+        resource_version = None
+        for page in resource_type.iter_pages(self.namespace, label_selector=selector):
+            names.update(item.metadata.name for item in page.get('items') or [])
+            resource_version = page.metadata.resourceVersion
+        return names, resource_version
 
     def wait_until_deleted(self, resource_type, selector, timeout=120):
-        start_t = time.time()
-        printed = False
-        while 1:
-            resp = resource_type.list(namespace=self.namespace, label_selector=selector)
-            if not resp.items:
-                break
-            if not printed:
-                CONSOLE('Waiting for %s %s to terminate' % (resource_type.kind, selector))
-                printed = True
-            else:
-                DEBUG('Waiting for %s %s to terminate' % (resource_type.kind, selector))
-            if time.time() >= start_t + timeout:
+        deadline = time.time() + timeout
+        remaining, resource_version = self._list_names(resource_type, selector)
+        if remaining:
+            CONSOLE('Waiting for %s %s to terminate' % (resource_type.kind, selector))
+
+        while remaining:
+            timeout_seconds = int(deadline - time.time())
+            if timeout_seconds <= 0:
                 raise WaitTimeoutError(resource_type.kind, selector)
-            time.sleep(1)
+            w = resource_type.watch(self.namespace, label_selector=selector)
+            try:
+                for event_type, obj in w.stream(resource_version=resource_version, timeout_seconds=timeout_seconds):
+                    if event_type == 'DELETED':
+                        remaining.discard(obj.metadata.name)
+                        DEBUG('Waiting for %s %s to terminate: %s left' % (resource_type.kind, selector, len(remaining)))
+                    if not remaining:
+                        w.stop()
+                resource_version = w.resource_version
+            except ApiError as e:
+                if e.status != 410:
+                    raise
+                remaining, resource_version = self._list_names(resource_type, selector)
@@ -0,0 +1,183 @@
+"""
+Демон super_apply: держит подключения к кластерам, импортированные модули и кеши между запусками.
+Клиент передает по Unix-сокету аргументы командной строки и текущий каталог, демон выполняет
+запуск в отдельном потоке и пересылает клиенту его stdout/stderr и код возврата.
+
+Протокол - JSON по строке: запрос {"argv": [...], "cwd": "..."}, ответы {"stream": "out"|"err", "data": "..."}
+и последним {"exit": код}.
+
+Модуль импортируется клиентом, поэтому на верхнем уровне - только стандартная библиотека.
+
+"""
+import contextvars
+import json
+import os
+import socket
+import sys
+import threading
+
+DEFAULT_SOCKET = os.path.join(os.environ.get('XDG_RUNTIME_DIR') or
+                              os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+                                           'super_apply'),
+                              'super_apply.sock')
+
+# соединение с клиентом запуска, который выполняется в текущем контексте
+_job_connection = contextvars.ContextVar('job_connection', default=None)
+
+
+class DaemonNotRunning(Exception):
+    pass
+
+
+def _send(f, message):
+    f.write(json.dumps(message) + '\n')
+    f.flush()
+
+
+def run_client(argv, path=DEFAULT_SOCKET):
+    """ Выполняет super_apply argv в демоне; возвращает код возврата """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError as e:
+        sock.close()
+        raise DaemonNotRunning('super_apply daemon is not running at %s: %s' % (path, e))
+    with sock, sock.makefile('rw', encoding='utf-8') as f:
+        _send(f, {'argv': argv, 'cwd': os.getcwd()})
+        for line in f:
+            message = json.loads(line)
+            if 'exit' in message:
+                return message['exit']
+            stream = sys.stdout if message['stream'] == 'out' else sys.stderr
+            stream.write(message['data'])
+            stream.flush()
+    print('super_apply daemon closed the connection', file=sys.stderr)
+    return 1
+
+
+class _Connection:
+    def __init__(self, f):
+        self.f = f
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def send(self, message):
+        with self.lock:
+            if self.closed:
+                return
+            try:
+                self.f.write((json.dumps(message) + '\n').encode('utf-8'))
+                self.f.flush()
+            except (OSError, ValueError):
+                # клиент ушел; запуск доводим до конца, вывод теряется
+                self.closed = True
+
+
+class _JobOutput:
+    """ sys.stdout/sys.stderr демона: запись уходит клиенту запуска, в контексте которого она сделана """
+    def __init__(self, stream_name, default):
+        self.stream_name = stream_name
+        self.default = default
+
+    def write(self, data):
+        connection = _job_connection.get()
+        if connection is None:
+            return self.default.write(data)
+        if data:
+            connection.send({'stream': self.stream_name, 'data': data})
+        return len(data)
+
+    def flush(self):
+        if _job_connection.get() is None:
+            self.default.flush()
+
+    def isatty(self):
+        return False
+
+    def __getattr__(self, name):
+        return getattr(self.default, name)
+
+
+def run_job(job, argv, cwd, connection):
+    """ job(argv, cwd) со своими Options и выводом; возвращает код возврата """
+    import traceback
+    from kube_deploy.options import job_options
+
+    _job_connection.set(connection)
+    with job_options():
+        try:
+            job(argv, cwd)
+        except SystemExit as e:
+            if e.code is None or isinstance(e.code, int):
+                return e.code or 0
+            print(e.code, file=sys.stderr)
+            return 1
+        except Exception:
+            traceback.print_exc()
+            return 1
+    return 0
+
+
+def _check_not_running(path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        # сокет остался от завершившегося демона
+        if os.path.exists(path):
+            os.unlink(path)
+        return
+    finally:
+        sock.close()
+    sys.exit('super_apply daemon is already running at %s' % path)
+
+
+def serve(job, path=DEFAULT_SOCKET, warm_up=None):
+    """
+    Принимает запуски, пока процесс не остановят. Запуски выполняются параллельно,
+    в один namespace - по очереди (см. kube_deploy.targets.Target.lock)
+
+    """
+    import signal
+    import socketserver
+    from kube_deploy import log
+    from kube_deploy.backend import share_connections
+
+    share_connections()
+    sys.stdout = _JobOutput('out', sys.stdout)
+    sys.stderr = _JobOutput('err', sys.stderr)
+    log.CONSOLE_FILE = log.DEBUG_FILE = log.ERROR_FILE = sys.stderr
+    if warm_up is not None:
+        warm_up()
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            connection = _Connection(self.wfile)
+            try:
+                request = json.loads(self.rfile.readline().decode('utf-8'))
+                argv, cwd = request['argv'], request.get('cwd')
+            except (ValueError, KeyError) as e:
+                connection.send({'stream': 'err', 'data': 'bad request: %s\n' % e})
+                connection.send({'exit': 2})
+                return
+            # у нового потока пустой контекст; копия - чтобы ничего не протекло между запусками
+            code = contextvars.copy_context().run(run_job, job, argv, cwd, connection)
+            connection.send({'exit': code})
+
+    class Server(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    _check_not_running(path)
+    server = Server(path, Handler)
+    os.chmod(path, 0o600)
+    # по SIGTERM - как по Ctrl+C: закрыть сервер и удалить сокет
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    print('super_apply daemon: listening on %s' % path, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(path)
@@ -0,0 +1,66 @@
+import time
+
+from kube_deploy.kube import RolloutFailedError
+from kube_deploy.options import Options
+
+# состояния контейнера, из которых он сам не выйдет
+FATAL_WAITING_REASONS = {'CrashLoopBackOff', 'ImagePullBackOff', 'ErrImagePull', 'InvalidImageName',
+                         'CreateContainerConfigError', 'CreateContainerError', 'RunContainerError'}
+
+
+class FailureClassifier:
+    """
+    Определяет по статусам Pod и Deployment, что выкатка уже не завершится успешно.
+
+    Причина из FATAL_WAITING_REASONS считается ошибкой, если держится дольше grace_period секунд;
+    max_restarts - допустимое число перезапусков контейнера.
+
+    """
+    def __init__(self, max_restarts=None, grace_period=0, fatal_reasons=FATAL_WAITING_REASONS):
+        self.max_restarts = max_restarts
+        self.grace_period = grace_period
+        self.fatal_reasons = fatal_reasons
+        self.first_seen = {}
+
+    @classmethod
+    def from_options(cls, **kwargs):
+        if not Options.fail_fast:
+            return None
+        kwargs.setdefault('max_restarts', Options.max_restarts)
+        kwargs.setdefault('grace_period', Options.failure_grace)
+        return cls(**kwargs)
+
+    def check_pod(self, pod):
+        name = pod.metadata.name
+        if pod.status.phase == 'Failed':
+            return RolloutFailedError('Pod', name, pod.status.reason or 'Failed', pod.status.message)
+
+        for c_status in (pod.status.containerStatuses or []) + (pod.status.initContainerStatuses or []):
+            waiting = c_status.state.waiting
+            if waiting and waiting.reason in self.fatal_reasons:
+                first_seen = self.first_seen.setdefault((name, c_status.name, waiting.reason), time.time())
+                if time.time() - first_seen >= self.grace_period:
+                    return RolloutFailedError('Pod', name, waiting.reason, waiting.message, container=c_status.name)
+
+            if self.max_restarts is not None and c_status.restartCount >= self.max_restarts:
+                return RolloutFailedError('Pod', name, 'RestartCount',
+                                          'restarted %s times' % c_status.restartCount, container=c_status.name)
+
+            terminated = c_status.state.terminated
+            if terminated and terminated.exitCode and pod.spec.restartPolicy == 'Never':
+                return RolloutFailedError('Pod', name, terminated.reason or 'Error',
+                                          'exit code %s' % terminated.exitCode, container=c_status.name)
+        return None
+
+    def check_deployment(self, deployment):
+        # статус относится к предыдущей версии spec
+        if (deployment.status.observedGeneration or 0) < (deployment.metadata.generation or 0):
+            return None
+
+        for condition in deployment.status.conditions or []:
+            if condition.type == 'Progressing' and condition.status == 'False' \
+                    and condition.reason == 'ProgressDeadlineExceeded':
+                return RolloutFailedError('Deployment', deployment.metadata.name, condition.reason, condition.message)
+            if condition.type == 'ReplicaFailure' and condition.status == 'True':
+                return RolloutFailedError('Deployment', deployment.metadata.name, condition.reason, condition.message)
+        return None
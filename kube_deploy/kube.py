@@ -1,12 +1,8 @@
 # -*- coding: utf-8 -*-
 import os
 import sys
-import urllib3
-
-from kubernetes import config
 
 from kube_deploy.options import Options
-from kubernetes.config import list_kube_config_contexts
 
 DEFAULT_KUBE_CONFIG = os.environ['HOME'] + '/.kube/config'
 #TOKEN_FILE = '/var/run/secrets/kubernetes.io/serviceaccount/token'
@@ -16,28 +12,43 @@ NAMESPACE_FILE = '/var/run/secrets/kubernetes.io/serviceaccount/namespace'
 class ResourceAlreadyExists(Exception):
     pass
 
+class ApiError(Exception):
+    """ Ошибка API сервера, одинаковая для всех backend """
+    def __init__(self, status, reason=None, body=None):
+        super().__init__(status, reason, body)
+        self.status = status
+        self.reason = reason
+        self.body = body
+
+    def __str__(self):
+        return '(%s) %s: %s' % (self.status, self.reason, self.body)
+
 class DeployTimeoutError(Exception):
     pass
 
 class WaitTimeoutError(Exception):
     pass
 
+class RolloutFailedError(Exception):
+    def __init__(self, kind, name, reason, message=None, container=None):
+        super().__init__(kind, name, reason, message, container)
+        self.kind = kind
+        self.name = name
+        self.reason = reason
+        self.message = message
+        self.container = container
+
+    def __str__(self):
+        name = self.name if not self.container else '%s/%s' % (self.name, self.container)
+        text = '%s %s: %s' % (self.kind, name, self.reason)
+        if self.message:
+            text += ' (%s)' % self.message
+        return text
+
 
 def init_kube_connection():
-    if 'KUBECONFIG' in os.environ:
-        config.load_kube_config(os.environ['KUBECONFIG'])
-    elif os.path.exists(DEFAULT_KUBE_CONFIG):
-        config.load_kube_config(DEFAULT_KUBE_CONFIG)
-    else:
-        Options.parser.error('Kubernetes configuration not found in ~/.kube')
-        # api_key = open(TOKEN_FILE).read()
-        # kube_host = 'https://%(KUBERNETES_SERVICE_HOST)s:%(KUBERNETES_SERVICE_PORT)s' % os.environ
-        #
-        # kubernetes.client.configuration.api_key['authorization'] = api_key
-        # kubernetes.client.configuration.host = kube_host
-        # #kubernetes.client.configuration.verify_ssl = False
-        # kubernetes.client.configuration.api_key_prefix['authorization'] = 'Bearer'
-    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+    from kube_deploy.backend import backend
+    backend().connect()
 
 
 def get_namespace():
@@ -48,8 +59,8 @@ def get_namespace():
         with open(NAMESPACE_FILE) as f:
             namespace = f.read()
     else:
-        __contexts, current_context = list_kube_config_contexts()
-        namespace = current_context['context']['namespace']
+        from kube_deploy.backend import backend
+        namespace = backend().current_namespace()
 
     if not namespace:
         print('Unable to determine namespace from Kubernetes API. Use --namespace option.', file=sys.stderr)
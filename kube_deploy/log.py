@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+import codecs
+import contextvars
 import logging
 import sys
 from kube_deploy.options import Options
@@ -6,6 +8,8 @@ from kube_deploy.options import Options
 CONSOLE_FILE = sys.stderr
 DEBUG_FILE = sys.stderr
 ERROR_FILE = sys.stderr
+# метка цели (контекст/namespace) перед каждой строкой, когда выкатываем на несколько целей сразу
+LOG_PREFIX = contextvars.ContextVar('log_prefix', default='')
 
 def setup_logging(console_file=None, debug_file=None,):
     logger = logging.getLogger()
@@ -13,7 +17,8 @@ def setup_logging(console_file=None, debug_file=None,):
         logger.setLevel(logging.DEBUG)
     else:
         logger.setLevel(logging.INFO)
-    logger.addHandler(logging.StreamHandler())
+    if not logger.handlers:
+        logger.addHandler(logging.StreamHandler())
     if console_file:
         global CONSOLE_FILE
         CONSOLE_FILE = console_file
@@ -21,12 +26,18 @@ def setup_logging(console_file=None, debug_file=None,):
         global DEBUG_FILE
         DEBUG_FILE = debug_file
 
+def _prefixed(text):
+    prefix = LOG_PREFIX.get()
+    if not prefix:
+        return text
+    return prefix + text.replace('\n', '\n' + prefix)
+
 def CONSOLE(*args):
     if not Options.quiet:
-        print(' '.join(str(s) for s in args), file=CONSOLE_FILE, flush=True)
+        print(_prefixed(' '.join(str(s) for s in args)), file=CONSOLE_FILE, flush=True)
 
 def ERROR(*args):
-    print(' '.join(str(s) for s in args), file=ERROR_FILE, flush=True)
+    print(_prefixed(' '.join(str(s) for s in args)), file=ERROR_FILE, flush=True)
 
 def DEBUG(*args, level=1):
     if Options.debug < level:
@@ -36,7 +47,7 @@ def DEBUG(*args, level=1):
         if hasattr(arg, '__call__'):
             arg = arg()
         parts.append(str(arg))
-    print(' '.join(parts), file=DEBUG_FILE, flush=True)
+    print(_prefixed(' '.join(parts)), file=DEBUG_FILE, flush=True)
 
 def indent_multiline(msg, prepend='#     '):
     parts = []
@@ -44,7 +55,45 @@ def indent_multiline(msg, prepend='#     '):
         parts.append(prepend + line)
     return '\n'.join(parts)
 
-def print_container_log(log, pod_name, container_name):
+LOG_CHUNK_SIZE = 64 * 1024
+LOG_LINE_LIMIT = 64 * 1024
+
+
+def iter_log_lines(chunks, line_limit=LOG_LINE_LIMIT):
+    """
+    Разбивает поток байтовых кусков на строки по мере поступления.
+    Строка длиннее line_limit отдается частями, так что в памяти не копится больше одного куска
+    и одной строки
+
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    buffer = ''
+    for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split('\n')
+        yield from lines
+        while len(buffer) > line_limit:
+            yield buffer[:line_limit]
+            buffer = buffer[line_limit:]
+    buffer += decoder.decode(b'', final=True)
+    if buffer:
+        yield buffer
+
+
+def print_container_log(log, pod_name, container_name, spool_file=None, prepend='#     '):
+    """
+    log - весь лог строкой или итератор строк (например, из stream_log);
+    итератор печатается построчно по мере поступления и дублируется в spool_file
+
+    """
     CONSOLE('# ---------- %s/%s' % (pod_name, container_name))
-    CONSOLE(indent_multiline(log.rstrip()))
+    if isinstance(log, str):
+        if spool_file is not None:
+            spool_file.write(log)
+        CONSOLE(indent_multiline(log.rstrip(), prepend))
+    else:
+        for line in log:
+            if spool_file is not None:
+                spool_file.write(line + '\n')
+            CONSOLE(prepend + line.rstrip())
     CONSOLE('# ---------- end')
@@ -0,0 +1,137 @@
+import hashlib
+import os
+import pickle
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import yaml
+
+from kube_deploy.log import DEBUG
+
+try:
+    from yaml import CSafeLoader as Loader
+except ImportError:
+    from yaml import SafeLoader as Loader
+
+# файлы разбираются в пуле процессов, только если их суммарный размер больше этого
+PARALLEL_MIN_BYTES = 1024 * 1024
+
+# меняется при изменении формата кеша; версия PyYAML и загрузчик тоже входят в ключ
+CACHE_FORMAT = 1
+LOADER_VERSION = '%s/%s/%s' % (CACHE_FORMAT, yaml.__version__, Loader.__name__)
+DEFAULT_CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+                                 'super_apply', 'manifests')
+DEFAULT_CACHE_SIZE = 256 * 1024 * 1024
+
+
+def load_file(filename):
+    """ Документы одного файла в виде обычных dict/list (без DotDict, чтобы передавать между процессами) """
+    with open(filename, 'rb') as f:
+        return list(yaml.load_all(f, Loader=Loader))
+
+
+class ManifestCache:
+    """
+    Разобранные документы на диске (pickle), ключ - sha256 содержимого файла и версия загрузчика.
+    Размер ограничен max_bytes: при превышении удаляются записи, которые дольше всех не читались
+
+    """
+    def __init__(self, path=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_SIZE):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.writable = True
+
+    @staticmethod
+    def key(filename):
+        h = hashlib.sha256(LOADER_VERSION.encode())
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(block)
+        return h.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key + '.pickle')
+
+    def get(self, key):
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, 'rb') as f:
+                docs = pickle.load(f)
+            os.utime(entry_path)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return docs
+
+    def put(self, key, docs):
+        if not self.writable:
+            return
+        tmp_path = None
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(docs, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._entry_path(key))
+        except OSError as e:
+            # кеш включен по умолчанию: нет HOME или он только для чтения - работаем без кеша
+            DEBUG('manifest cache disabled: %s' % e)
+            self.writable = False
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def evict(self):
+        try:
+            entries = [entry for entry in os.scandir(self.path) if entry.name.endswith('.pickle')]
+        except OSError:
+            return
+        entries = [(entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in entries]
+        total = sum(size for __, size, __ in entries)
+        for __, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+
+    def __str__(self):
+        return 'manifest cache: hits=%s misses=%s' % (self.hits, self.misses)
+
+
+def load_files(filenames, jobs=None, cache=None):
+    """
+    Возвращает списки документов в том же порядке, что и filenames.
+    Файлы, найденные в cache, не разбираются; остальные при большом объеме
+    разбираются в jobs процессах (по умолчанию - по числу CPU)
+
+    """
+    filenames = list(filenames)
+    results = [None] * len(filenames)
+    keys = {}
+    if cache is not None:
+        for i, filename in enumerate(filenames):
+            keys[i] = cache.key(filename)
+            results[i] = cache.get(keys[i])
+    missing = [i for i, docs in enumerate(results) if docs is None]
+
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, len(missing))
+    if jobs <= 1 or sum(os.path.getsize(filenames[i]) for i in missing) < PARALLEL_MIN_BYTES:
+        parsed = [load_file(filenames[i]) for i in missing]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            parsed = list(pool.map(load_file, [filenames[i] for i in missing]))
+
+    for i, docs in zip(missing, parsed):
+        results[i] = docs
+        if cache is not None:
+            cache.put(keys[i], docs)
+    if cache is not None and missing:
+        cache.evict()
+    return results
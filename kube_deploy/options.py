@@ -1,6 +1,27 @@
 import argparse
+import contextvars
+from contextlib import contextmanager
 
-class Options(argparse.Namespace):
+# значения Options, заданные внутри job_options(): у каждого запуска в демоне свои
+_job_values = contextvars.ContextVar('job_options', default=None)
+
+
+class _OptionsType(type):
+    def __getattribute__(cls, name):
+        values = _job_values.get()
+        if values is not None and name in values:
+            return values[name]
+        return type.__getattribute__(cls, name)
+
+    def __setattr__(cls, name, value):
+        values = _job_values.get()
+        if values is not None:
+            values[name] = value
+        else:
+            type.__setattr__(cls, name, value)
+
+
+class Options(argparse.Namespace, metaclass=_OptionsType):
     parser = argparse.ArgumentParser()
     debug = 0
     verbose = False
@@ -10,4 +31,30 @@ class Options(argparse.Namespace):
     overwrite = None
     force_version = None
     no_version = None
+    fail_fast = True
+    max_restarts = 3
+    failure_grace = 10
+    server_side = False
+    field_manager = 'super_apply'
+    force_conflicts = False
+    backend = 'kubernetes'
+    list_page_size = 500
+    qps = 50
+    burst = 100
+    metrics_out = None
+    trace_out = None
+    profile = None
+
+
+@contextmanager
+def job_options():
+    """
+    Options, присвоенные внутри блока, видны только в его контексте (и в потоках, которым
+    этот контекст передан); вне блока - значения по умолчанию, заданные на классе
 
+    """
+    token = _job_values.set({})
+    try:
+        yield
+    finally:
+        _job_values.reset(token)
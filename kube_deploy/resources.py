@@ -1,11 +1,89 @@
 # -*- coding: utf-8 -*-
+import hashlib
+import json
+import contextvars
+import functools
 import pprint
+import threading
 import time
-from kubernetes import client
-from kubernetes.client import CoreV1Api
-from kube_deploy.log import CONSOLE, DEBUG, indent_multiline
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from kube_deploy.log import CONSOLE, DEBUG, indent_multiline, iter_log_lines
 from kube_deploy.options import Options
-from kube_deploy.kube import ResourceAlreadyExists
+from kube_deploy.backend import backend, metrics_collector, to_json
+from kube_deploy.kube import ApiError, ResourceAlreadyExists
+from kube_deploy.failures import FailureClassifier
+from kube_deploy.tracing import span
+
+
+FINGERPRINT_ANNOTATION = 'super-apply/fingerprint'
+# метки, которые меняются при каждом запуске и не должны менять отпечаток
+VOLATILE_LABELS = ('update-id',)
+
+CREATED = 'created'
+UPDATED = 'updated'
+UNCHANGED = 'unchanged'
+
+PREFETCH_THREADS = 8
+
+
+def content_fingerprint(doc):
+    data = json.loads(json.dumps(doc, default=str))
+    metadata = data.get('metadata') or {}
+    annotations = metadata.get('annotations') or {}
+    annotations.pop(FINGERPRINT_ANNOTATION, None)
+    if not annotations:
+        # пустые annotations остаются после того, как отпечаток добавлен в документ без аннотаций
+        metadata.pop('annotations', None)
+    for metadata in (data.get('metadata'), ((data.get('spec') or {}).get('template') or {}).get('metadata')):
+        for label in VOLATILE_LABELS:
+            ((metadata or {}).get('labels') or {}).pop(label, None)
+    text = json.dumps(data, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class LiveView:
+    """
+    Последнее известное состояние объектов на сервере, чтобы не перечитывать их перед записью.
+    None - объекта на сервере нет. Объекты разных кластеров (backend) не смешиваются.
+
+    """
+    def __init__(self):
+        self._objects = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, kind, namespace, name):
+        key = (backend(), kind, namespace, name)
+        with self._lock:
+            return key in self._objects, self._objects.get(key)
+
+    def remember(self, kind, namespace, name, doc):
+        key = (backend(), kind, namespace, name)
+        with self._lock:
+            self._objects[key] = doc
+
+    def forget(self, kind, namespace, name=None):
+        prefix = (backend(), kind, namespace)
+        with self._lock:
+            if name is not None:
+                self._objects.pop(prefix + (name,), None)
+                return
+            for key in [key for key in self._objects if key[:3] == prefix]:
+                del self._objects[key]
+
+    def clear(self, namespace=None):
+        with self._lock:
+            if namespace is None:
+                self._objects.clear()
+                return
+            current = backend()
+            for key in [key for key in self._objects if key[0] is current and key[2] == namespace]:
+                del self._objects[key]
+
+
+LIVE_VIEW = LiveView()
 
 
 def supports_versions(doc):
@@ -18,17 +96,52 @@ def supports_versions(doc):
     return bool(doc.metadata.labels and doc.metadata.labels.get('version'))
 
 
+def api_params(kwargs):
+    """ label_selector=... -> labelSelector=... """
+    params = {}
+    for k, v in kwargs.items():
+        head, *tail = k.split('_')
+        params[head + ''.join(part.title() for part in tail)] = v
+    return params
+
+
+def timed(operation):
+    """
+    Время операции над ресурсом (со всеми ее запросами) в семейство метрик resource_operation,
+    по operation, kind и исходу: ok, код ApiError или error
+
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(resource, *args, **kwargs):
+            collector = metrics_collector()
+            if collector is None:
+                return method(resource, *args, **kwargs)
+            outcome = 'error'
+            start = time.perf_counter()
+            try:
+                result = method(resource, *args, **kwargs)
+                outcome = 'ok'
+                return result
+            except ApiError as exc:
+                outcome = exc.status
+                raise
+            finally:
+                collector.observe('super_apply_resource_operation', operation, resource.kind, outcome,
+                                  time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
 class Resource:
     kind = NotImplemented
-    api = NotImplemented
-    _list = NotImplemented
-    _read = NotImplemented
-    _patch = NotImplemented
-    _create = NotImplemented
-    _delete = NotImplemented
-    
+    # путь к объекту; путь к коллекции - без последнего /{name}
+    _path = NotImplemented
+    # коллекцию можно удалить одним запросом (verb deletecollection)
+    delete_collection_supported = True
+    skip_unchanged = True
+
     def __init__(self, doc):
-        self.api = self.api()
         self.doc = doc
 
     @property
@@ -53,50 +166,156 @@ class Resource:
         return self.doc.spec
 
     @classmethod
+    def object_path(cls, namespace, name):
+        return cls._path.format(namespace=namespace, name=name)
+
+    @classmethod
+    def collection_path(cls, namespace):
+        return cls._path.rsplit('/', 1)[0].format(namespace=namespace)
+
+    @classmethod
+    @timed('read')
     def read(cls, namespace, name, **kwargs):
-        resp = cls._read(cls.api(), name=name, namespace=namespace, **kwargs)
+        resp = backend().call('GET', cls.object_path(namespace, name), api_params(kwargs))
         DEBUG(resp, level=2)
         return resp
 
     @classmethod
+    @timed('list')
     def list(cls, namespace, **kwargs):
-        resp = cls._list(cls.api(), namespace=namespace, **kwargs)
+        resp = backend().call('GET', cls.collection_path(namespace), api_params(kwargs))
         DEBUG(resp, level=2)
         return resp
 
+    @classmethod
+    def iter_pages(cls, namespace, page_size=None, **kwargs):
+        """
+        LIST по страницам через limit/continue (по умолчанию --list-page-size объектов):
+        в памяти одновременно одна страница. Все страницы - срез одной resourceVersion
+
+        """
+        params = api_params(kwargs)
+        params['limit'] = page_size or Options.list_page_size
+        while 1:
+            page = backend().call('GET', cls.collection_path(namespace), params)
+            DEBUG('list %s: %s items' % (cls.kind, len(page.get('items') or [])), level=2)
+            yield page
+            token = page.metadata.get('continue')
+            if not token:
+                return
+            params = dict(params, **{'continue': token})
+
+    @classmethod
+    def iter_list(cls, namespace, page_size=None, **kwargs):
+        """ Объекты коллекции по мере получения страниц; kind заполнен (в ответе LIST его нет) """
+        for page in cls.iter_pages(namespace, page_size, **kwargs):
+            for item in page.get('items') or []:
+                item.kind = item.kind or cls.kind
+                yield item
+
+    @classmethod
+    def watch(cls, namespace, label_selector=None, field_selector=None):
+        return backend().watch(cls.collection_path(namespace), label_selector, field_selector)
+
+    @timed('patch')
     def patch(self, **kwargs):
         if Options.dry_run:
             return {}
-        cls = self.__class__
-        old = cls._read(cls.api(), name=self.name, namespace=self.namespace, **kwargs)
-        new = cls._patch(self.api, name=self.name, body=self.doc, namespace=self.namespace, **kwargs)
+        path = self.object_path(self.namespace, self.name)
+        old = backend().call('GET', path, api_params(kwargs))
+        new = backend().call('PATCH', path, api_params(kwargs), self.doc,
+                             content_type='application/strategic-merge-patch+json')
         DEBUG(new, level=2)
-        if new.metadata.resource_version == old.metadata.resource_version:
+        if new.metadata.resourceVersion == old.metadata.resourceVersion:
             CONSOLE('# %s %s not modified' % (self.doc.kind, self.name))
         else:
             CONSOLE('# %s %s updated' % (self.doc.kind, self.name))
+        LIVE_VIEW.remember(self.kind, self.namespace, self.name, new)
         return new
 
+    @timed('create')
     def create(self, **kwargs):
         if Options.dry_run:
             return {}
-        cls = self.__class__
-        resp = cls._create(self.api, body=self.doc, namespace=self.namespace, **kwargs)
+        resp = backend().call('POST', self.collection_path(self.namespace), api_params(kwargs), self.doc)
         DEBUG(resp, level=2)
         CONSOLE('# %s %s created' % (self.doc.kind, self.name))
+        LIVE_VIEW.remember(self.kind, self.namespace, self.name, resp)
         return resp
 
+    def server_side_apply(self, old_resource_version=None, old_generation=None):
+        """
+        Server-side apply: создает или обновляет ресурс одним запросом PATCH application/apply-patch+yaml
+
+        """
+        return self._server_side_apply(old_resource_version, old_generation)[0]
+
+    @timed('apply')
+    def _server_side_apply(self, old_resource_version=None, old_generation=None):
+        """ (ответ сервера, CREATED / UPDATED / UNCHANGED) """
+        if Options.dry_run:
+            return {}, None
+        params = {'fieldManager': Options.field_manager}
+        if Options.force_conflicts:
+            params['force'] = 'true'
+        # JSON - подмножество YAML
+        resp, status, headers = backend().request('PATCH', self.object_path(self.namespace, self.name), params,
+                                                  to_json(self.doc), content_type='application/apply-patch+yaml')
+        DEBUG(resp, level=2)
+        if status == 201:
+            outcome = CREATED
+        elif self._was_modified(resp, headers, old_resource_version, old_generation):
+            outcome = UPDATED
+        else:
+            outcome = UNCHANGED
+        CONSOLE('# %s %s %s' % (self.doc.kind, self.name, 'not modified' if outcome == UNCHANGED else outcome))
+        LIVE_VIEW.remember(self.kind, self.namespace, self.name, resp)
+        return resp, outcome
+
+    @staticmethod
+    def _was_modified(resp, headers, old_resource_version=None, old_generation=None):
+        if old_resource_version is not None:
+            if resp.metadata.resourceVersion == old_resource_version:
+                return False
+            if old_generation is not None and resp.metadata.generation != old_generation:
+                return True
+            # resourceVersion меняют и чужие записи (status, метки) - решает запись managedFields
+        # запись managedFields нашего fieldManager получает новое время только при изменении полей
+        server_time = parsedate_to_datetime(headers['Date'])
+        for entry in resp.metadata.get('managedFields') or []:
+            if entry.get('manager') == Options.field_manager and entry.get('operation') == 'Apply':
+                applied_at = datetime.strptime(entry['time'], '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=timezone.utc)
+                return applied_at >= server_time - timedelta(seconds=1)
+        return True
+
     def _delete_options(self, propagation_policy, grace_period_seconds):
-        kwargs = {'body': client.V1DeleteOptions(propagation_policy=propagation_policy,
-                                                 grace_period_seconds=grace_period_seconds)}
-        return kwargs
+        return {'kind': 'DeleteOptions', 'apiVersion': 'v1',
+                'propagationPolicy': propagation_policy, 'gracePeriodSeconds': grace_period_seconds}
+
+    @classmethod
+    @timed('deletecollection')
+    def delete_collection(cls, namespace, label_selector, propagation_policy=None, grace_period=None):
+        """
+        Удаляет все объекты по селектору одним запросом DELETE на коллекцию
+
+        """
+        if Options.dry_run:
+            return {}
+        params = {'labelSelector': label_selector, 'propagationPolicy': propagation_policy,
+                  'gracePeriodSeconds': grace_period}
+        resp = backend().call('DELETE', cls.collection_path(namespace), params)
+        LIVE_VIEW.forget(cls.kind, namespace)
+        DEBUG(resp, level=2)
+        CONSOLE('# %s %s deleted' % (cls.kind, label_selector))
+        return resp
 
+    @timed('delete')
     def delete(self, propagation_policy=None, grace_period=None, **kwargs):
         if Options.dry_run:
             return {}
-        cls = self.__class__
-        kwargs.update(self._delete_options(propagation_policy, grace_period))
-        resp = cls._delete(self.api, name=self.name, namespace=self.namespace, **kwargs)
+        body = self._delete_options(propagation_policy, grace_period)
+        resp = backend().call('DELETE', self.object_path(self.namespace, self.name), api_params(kwargs), body)
+        LIVE_VIEW.forget(self.kind, self.namespace, self.name)
         DEBUG(resp, level=2)
         CONSOLE('# %s %s deleted' % (self.doc.kind, self.name or kwargs.get('label_selector')))
         return resp
@@ -106,52 +325,107 @@ class Resource:
             doc = self.doc
             DEBUG('---')
             DEBUG(pprint.pformat(doc))
-        self._apply_resource()
+        with span('apply %s/%s' % (self.doc.kind, self.name)):
+            return self._apply_resource()
 
     @classmethod
     def _read_resource_if_exists(cls, namespace, name):
+        known, resource_doc = LIVE_VIEW.lookup(cls.kind, namespace, name)
+        if known:
+            return resource_doc
         try:
-            return cls.read(namespace=namespace, name=name)
-        except client.rest.ApiException as exc:
-            if exc.status == 404:
-                return None
-            raise
+            resource_doc = cls.read(namespace=namespace, name=name)
+        except ApiError as exc:
+            if exc.status != 404:
+                raise
+            resource_doc = None
+        LIVE_VIEW.remember(cls.kind, namespace, name, resource_doc)
+        return resource_doc
+
+    def _is_unchanged(self, resource_doc):
+        if not self.skip_unchanged or resource_doc is None:
+            return False
+        fingerprint = (self.metadata.get('annotations') or {}).get(FINGERPRINT_ANNOTATION)
+        live_fingerprint = (resource_doc.metadata.annotations or {}).get(FINGERPRINT_ANNOTATION)
+        if fingerprint is None or fingerprint != live_fingerprint:
+            return False
+        CONSOLE('# %s %s unchanged, skipped' % (self.doc.kind, self.name))
+        self.metadata.uid = resource_doc.metadata.uid
+        return True
+
+    def _apply_resource(self, retried=False):
+        if Options.server_side:
+            return self._server_side_apply_resource()
 
-    def _apply_resource(self):
         resource_doc = self._read_resource_if_exists(self.namespace, self.name)
         if resource_doc is not None:
             # если ресурс - не версионный, то без перезаписи обновить его невозможно
             if supports_versions(resource_doc) and not Options.overwrite:
                 raise ResourceAlreadyExists(self.name)
+            if self._is_unchanged(resource_doc):
+                return UNCHANGED
             self.metadata.uid = resource_doc.metadata.uid
             if not Options.dry_run:
                 self.patch()
+            return UPDATED
         else:
             if not Options.dry_run:
-                resp = self.create()
+                try:
+                    resp = self.create()
+                except ApiError as exc:
+                    if exc.status != 409 or retried:
+                        raise
+                    # объект есть, но не попал в снимок prefetch_live_state (LIST был по метке app);
+                    # перечитываем его один раз - если кто-то снова удалил и создал объект, ошибка уходит наверх
+                    LIVE_VIEW.forget(self.kind, self.namespace, self.name)
+                    return self._apply_resource(retried=True)
                 self.metadata.uid = resp.metadata.uid
+            return CREATED
+
+    def _server_side_apply_resource(self):
+        # без GET: пропустить запись можно, только если состояние объекта уже известно
+        known, resource_doc = LIVE_VIEW.lookup(self.kind, self.namespace, self.name)
+        if known and self._is_unchanged(resource_doc) \
+                and (Options.overwrite or not supports_versions(resource_doc)):
+            return UNCHANGED
+        if Options.dry_run:
+            return None
+        if supports_versions(self.doc) and not Options.overwrite:
+            if not known or resource_doc is None:
+                # версионный ресурс создаем через POST, чтобы сервер сам отказал, если он уже есть
+                try:
+                    resp = self.create()
+                    self.metadata.uid = resp.metadata.uid
+                    return CREATED
+                except ApiError as exc:
+                    if exc.status != 409:
+                        raise
+                resource_doc = self.read(namespace=self.namespace, name=self.name)
+            if supports_versions(resource_doc):
+                raise ResourceAlreadyExists(self.name)
+        if resource_doc is not None:
+            resp, outcome = self._server_side_apply(resource_doc.metadata.resourceVersion,
+                                                    resource_doc.metadata.generation)
+        else:
+            resp, outcome = self._server_side_apply()
+        self.metadata.uid = resp.metadata.uid
+        return outcome
 
 
 class Pod(Resource):
     kind = 'Pod'
-    api = client.CoreV1Api
-
-    _list = api.list_namespaced_pod
-    _read = api.read_namespaced_pod
-    _patch = api.patch_namespaced_pod
-    _create = api.create_namespaced_pod
-    _delete = api.delete_namespaced_pod
+    # Pod - разовая задача, его пересоздаем всегда
+    skip_unchanged = False
+    _path = '/api/v1/namespaces/{namespace}/pods/{name}'
 
     def _print_state(self, pod_name, c_status, state_name, state, seen_messages):
         reason = state.get('reason')
         message = state.get('message')
-        started_at = state.get('started_at')
-        finished_at = state.get('finished_at')
-        restart_count = state.get('restart_count')
+        started_at = state.get('startedAt')
         if state_name == 'terminated' and started_at is None:
             return
-        status_change_key = (c_status.container_id, state_name, reason)
-        message_key = (c_status.container_id, message)
+        status_change_key = (c_status.containerID, state_name, reason)
+        message_key = (c_status.containerID, message)
         
         if status_change_key not in seen_messages:
             DEBUG(state)
@@ -166,36 +440,45 @@ class Pod(Resource):
             seen_messages.add(message_key)
             
     def print_status(self, doc, seen_messages):
-        for c_status in (doc.status.container_statuses or []) + (doc.status.init_container_statuses or []):
+        for c_status in (doc.status.containerStatuses or []) + (doc.status.initContainerStatuses or []):
 
-            if getattr(c_status.last_state, 'terminated', None):
-                state = c_status.last_state.terminated
-                self._print_state(doc.metadata.name, c_status, 'terminated',
-                                  state and state.to_dict(), seen_messages)
+            state = (c_status.lastState or {}).get('terminated')
+            if state:
+                self._print_state(doc.metadata.name, c_status, 'terminated', state, seen_messages)
 
-            for state_name, state in c_status.state.to_dict().items():
+            for state_name, state in (c_status.state or {}).items():
                 if state:
                     self._print_state(doc.metadata.name, c_status, state_name, state, seen_messages)
 
 
     def wait_for_container(self, container_name, expected_state, expected_exit_code=None, max_restarts=None, timeout=None):
+        """ expected_state - имя состояния контейнера или кортеж имен (дождаться любого из них) """
         start_t = time.time()
+        expected_states = (expected_state,) if isinstance(expected_state, str) else expected_state
         if timeout is None:
             timeout = Options.wait
 
         seen_messages = set()
+        # max_restarts здесь - условие завершения ожидания, а не ошибки
+        classifier = FailureClassifier.from_options(max_restarts=None)
         CONSOLE('#### Waiting for container %s/%s' % (self.name, container_name))
         while 1:
-            pod_doc = CoreV1Api().read_namespaced_pod(name=self.name, namespace=self.namespace)
+            pod_doc = self.read(self.namespace, self.name)
             self.print_status(pod_doc, seen_messages)
-            for cs in pod_doc.status.container_statuses or []:
+            for cs in pod_doc.status.containerStatuses or []:
                 if cs.name == container_name:
-                    if max_restarts is not None and cs.restart_count >= max_restarts:
-                        CONSOLE('#### Abort due to pod restart count: %s' % cs.restart_count)
-                        return getattr(cs.state, expected_state)
-                    if getattr(cs.state, expected_state, False):
-                        if expected_exit_code is None or expected_exit_code == getattr(cs.state, expected_state).exit_code:
-                            return getattr(cs.state, expected_state)
+                    if max_restarts is not None and cs.restartCount >= max_restarts:
+                        CONSOLE('#### Abort due to pod restart count: %s' % cs.restartCount)
+                        return cs.state.get(expected_states[0])
+                    for state_name in expected_states:
+                        state = cs.state.get(state_name)
+                        if state and (expected_exit_code is None or expected_exit_code == state.get('exitCode')):
+                            return state
+
+            failure = classifier and classifier.check_pod(pod_doc)
+            if failure:
+                CONSOLE('#### Abort: %s' % failure)
+                raise failure
 
             if time.time() >= start_t + timeout:
                 from kube_deploy.controller import WaitTimeoutError
@@ -203,42 +486,113 @@ class Pod(Resource):
             time.sleep(1)
 
 
+    def wait_for_exit(self, container_name, timeout=None):
+        """
+        Состояние terminated контейнера, когда оно появится в статусе (например, после конца лога).
+        Без FailureClassifier: вызывающему нужен и ненулевой код выхода. Если контейнер уже
+        перезапущен, код выхода - из lastState
+
+        """
+        deadline = time.time() + (Options.wait if timeout is None else timeout)
+        while 1:
+            pod_doc = self.read(self.namespace, self.name)
+            for cs in pod_doc.status.containerStatuses or []:
+                if cs.name == container_name:
+                    terminated = cs.state.get('terminated') or (cs.restartCount and
+                                                                (cs.get('lastState') or {}).get('terminated'))
+                    if terminated:
+                        return terminated
+            if time.time() >= deadline:
+                from kube_deploy.kube import WaitTimeoutError
+                raise WaitTimeoutError(self.name)
+            time.sleep(1)
+
+    def _log_params(self, container_name, **kwargs):
+        params = {'container': container_name}
+        params.update((k, v) for k, v in api_params(kwargs).items() if v)
+        return params
+
     def read_log(self, container_name):
-        return CoreV1Api().read_namespaced_pod_log(self.name, namespace=self.namespace, container=container_name)
+        path = self.object_path(self.namespace, self.name) + '/log'
+        return b''.join(backend().stream('GET', path, self._log_params(container_name))).decode('utf-8', 'replace')
+
+    def stream_log(self, container_name, follow=True, since_seconds=None, limit_bytes=None,
+                   timestamps=False, previous=False):
+        """
+        Генератор строк лога по мере их поступления: при follow=True поток заканчивается
+        вместе с контейнером, весь лог в памяти не собирается
+
+        """
+        path = self.object_path(self.namespace, self.name) + '/log'
+        params = self._log_params(container_name, follow=follow and 'true', since_seconds=since_seconds,
+                                  limit_bytes=limit_bytes, timestamps=timestamps and 'true',
+                                  previous=previous and 'true')
+        yield from iter_log_lines(backend().stream('GET', path, params))
 
 
 class Deployment(Resource):
     kind = 'Deployment'
-    api = client.ExtensionsV1beta1Api
-    _list = api.list_namespaced_deployment
-    _read = api.read_namespaced_deployment
-    _patch = api.patch_namespaced_deployment
-    _create = api.create_namespaced_deployment
-    _delete = api.delete_namespaced_deployment
+    _path = '/apis/extensions/v1beta1/namespaces/{namespace}/deployments/{name}'
+
+
+class ReplicaSet(Resource):
+    kind = 'ReplicaSet'
+    _path = '/apis/extensions/v1beta1/namespaces/{namespace}/replicasets/{name}'
 
 
 class ConfigMap(Resource):
     kind = 'ConfigMap'
-    api = client.CoreV1Api
-    _list = api.list_namespaced_config_map
-    _read = api.read_namespaced_config_map
-    _patch = api.patch_namespaced_config_map
-    _create = api.create_namespaced_config_map
-    _delete = api.delete_namespaced_config_map
+    _path = '/api/v1/namespaces/{namespace}/configmaps/{name}'
 
 
 class Service(Resource):
     kind = 'Service'
-    api = client.CoreV1Api
-    _list = api.list_namespaced_service
-    _read = api.read_namespaced_service
-    _patch = api.patch_namespaced_service
-    _create = api.create_namespaced_service
-    _delete = api.delete_namespaced_service
+    _path = '/api/v1/namespaces/{namespace}/services/{name}'
+    # services не поддерживают deletecollection
+    delete_collection_supported = False
 
     def _delete_options(self, *args, **kwargs):
-        return {}
+        return None
 
 
 RESOURCE_TYPES = {name: cls for name, cls in globals().items()
                   if isinstance(cls, type) and issubclass(cls, Resource) and cls is not Resource}
+
+
+def prefetch_live_state(namespace, docs):
+    """
+    Заполняет LIVE_VIEW одним LIST на каждый kind из docs (kind'ы - параллельно), чтобы
+    create/patch, проверка версии и uid решались без GET на каждый документ.
+    LIST фильтруется по метке app, если она одна и та же у всех документов этого kind
+
+    """
+    docs_by_kind = defaultdict(list)
+    for doc in docs:
+        if doc.kind in RESOURCE_TYPES:
+            docs_by_kind[RESOURCE_TYPES[doc.kind]].append(doc)
+
+    def fetch(resource_type):
+        kind_docs = docs_by_kind[resource_type]
+        apps = {(doc.metadata.get('labels') or {}).get('app') for doc in kind_docs}
+        selector = 'app=%s' % apps.pop() if len(apps) == 1 and None not in apps else None
+        names = {doc.metadata.name for doc in kind_docs}
+        live = {}
+        try:
+            # запоминаем только объекты из набора, остальные страницы не держим
+            for item in resource_type.iter_list(namespace, label_selector=selector):
+                if item.metadata.name in names:
+                    live[item.metadata.name] = item
+        except ApiError as exc:
+            # например, нет прав на list: останутся GET по каждому документу
+            DEBUG('prefetch %s: %s' % (resource_type.kind, exc))
+            return
+        for doc in kind_docs:
+            LIVE_VIEW.remember(resource_type.kind, namespace, doc.metadata.name, live.get(doc.metadata.name))
+        DEBUG('prefetch %s %s: %s of %s exist' % (resource_type.kind, selector or '',
+                                                   sum(doc.metadata.name in live for doc in kind_docs),
+                                                   len(kind_docs)))
+
+    with ThreadPoolExecutor(max_workers=min(len(docs_by_kind), PREFETCH_THREADS) or 1) as pool:
+        futures = [pool.submit(contextvars.copy_context().run, fetch, resource_type) for resource_type in docs_by_kind]
+        for future in futures:
+            future.result()
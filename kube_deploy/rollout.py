@@ -0,0 +1,203 @@
+import contextvars
+import queue
+import threading
+import time
+
+from kube_deploy.failures import FailureClassifier
+from kube_deploy.kube import ApiError, DeployTimeoutError
+from kube_deploy.log import CONSOLE, DEBUG
+from kube_deploy.tracing import span
+from kube_deploy.options import Options
+from kube_deploy.resources import Deployment, Pod, ReplicaSet
+
+WATCH_TIMEOUT = 300
+RECONNECT_DELAY = 1
+
+
+class KindWatcher(threading.Thread):
+    """
+    Поток, который держит один watch на все объекты kind с заданным селектором
+    и складывает события в общую очередь
+
+    """
+    def __init__(self, resource_type, namespace, selector, events):
+        super().__init__(name='watch-%s' % resource_type.kind, daemon=True)
+        self.kind = resource_type.kind
+        self.resource_type = resource_type
+        self.namespace = namespace
+        self.selector = selector
+        self.events = events
+        self._stopped = False
+        self._watch = None
+        # backend и префикс лога - те же, что у потока, который запустил watch
+        self._context = contextvars.copy_context()
+
+    def run(self):
+        self._context.run(self._run)
+
+    def _run(self):
+        resource_version = None
+        while not self._stopped:
+            self._watch = self.resource_type.watch(self.namespace, label_selector=self.selector)
+            # stop() мог прочитать _watch до присваивания
+            if self._stopped:
+                break
+            try:
+                for event_type, obj in self._watch.stream(resource_version=resource_version,
+                                                          timeout_seconds=WATCH_TIMEOUT):
+                    self.events.put((self.kind, event_type, obj))
+                resource_version = self._watch.resource_version
+            except ApiError as e:
+                if e.status != 410:
+                    self.events.put((self.kind, 'ERROR', e))
+                    return
+                # история устарела - начинаем заново, сервер пришлет ADDED по всем объектам
+                DEBUG('watch %s: resourceVersion %s expired' % (self.kind, resource_version))
+                resource_version = None
+            except (ConnectionError, OSError) as e:
+                if self._stopped:
+                    break
+                DEBUG('watch %s: %s, reconnecting' % (self.kind, e))
+                time.sleep(RECONNECT_DELAY)
+
+    def stop(self):
+        """ Обрывает открытый watch сразу, а не после следующего события (в демоне потоки копятся) """
+        self._stopped = True
+        watch = self._watch
+        if watch is not None:
+            watch.stop()
+
+
+class RolloutTracker:
+    """
+    Ожидание готовности сразу всех Deployment, выкаченных с одним update-id:
+    по одному watch на Deployment, ReplicaSet и Pod вместо опроса каждого по очереди
+
+    """
+    def __init__(self, namespace, selector, min_ready_replicas=1):
+        self.namespace = namespace
+        self.selector = selector
+        self.min_ready_replicas = min_ready_replicas
+        self.pending = set()
+        self.ready_replicas = {}
+        # ReplicaSet -> Deployment, которому он принадлежит
+        self.replica_set_owners = {}
+        self.pods = {}
+        self.classifier = FailureClassifier.from_options()
+        self.seen_messages = set()
+        self.events = queue.Queue()
+        self.watchers = []
+        self._lock = threading.Lock()
+        self._wait_lock = threading.Lock()
+
+    def register(self, deployment_name):
+        with self._lock:
+            self.pending.add(deployment_name)
+            self._start()
+
+    def _start(self):
+        if self.watchers:
+            return
+        for resource_type in (Deployment, ReplicaSet, Pod):
+            watcher = KindWatcher(resource_type, self.namespace, self.selector, self.events)
+            watcher.start()
+            self.watchers.append(watcher)
+
+    def close(self):
+        with self._lock:
+            for watcher in self.watchers:
+                watcher.stop()
+            self.watchers = []
+
+    def waiting_for(self, names=None):
+        self._update_pending()
+        with self._lock:
+            if names is None:
+                return set(self.pending)
+            return self.pending.intersection(names)
+
+    def wait(self, names=None, timeout=None):
+        """
+        Ждет готовности Deployment из names (по умолчанию - всех зарегистрированных).
+        События обрабатывает только один поток, остальные ждут на блокировке
+
+        """
+        with self._wait_lock:
+            if not self.waiting_for(names):
+                return
+            if timeout is None:
+                timeout = Options.wait
+            deadline = time.time() + timeout
+
+            deployments = ', '.join(sorted(self.waiting_for(names)))
+            CONSOLE('#### Waiting for deployment(s) to start: %s (%s)' % (deployments, self.selector))
+            with span('wait_for_deployment', deployments=deployments):
+                while self.waiting_for(names):
+                    remaining = max(deadline - time.time(), 0)
+                    try:
+                        # раз в секунду перепроверяем ошибки, которые ждут окончания grace period
+                        kind, event_type, obj = self.events.get(
+                            timeout=min(remaining, 1) if self.classifier else remaining)
+                    except queue.Empty:
+                        if time.time() >= deadline:
+                            raise DeployTimeoutError(self.selector, sorted(self.waiting_for(names)))
+                        self.check_pods()
+                        continue
+                    self.handle_event(kind, event_type, obj)
+
+    def handle_event(self, kind, event_type, obj):
+        if event_type == 'ERROR':
+            raise obj
+
+        if kind == 'ReplicaSet':
+            for owner in obj.metadata.ownerReferences or []:
+                if owner.kind == 'Deployment':
+                    self.replica_set_owners[obj.metadata.name] = owner.name
+                    self.ready_replicas[owner.name] = obj.status.readyReplicas or 0
+                    DEBUG('Waiting for %s: ready_replicas=%s' % (obj.metadata.name, obj.status.readyReplicas))
+            self._update_pending()
+
+        elif kind == 'Deployment':
+            DEBUG('Deployment %s: %s' % (obj.metadata.name, event_type))
+            if self.classifier and obj.metadata.name in self.waiting_for():
+                failure = self.classifier.check_deployment(obj)
+                if failure:
+                    raise failure
+
+        elif kind == 'Pod':
+            if event_type == 'DELETED':
+                self.pods.pop(obj.metadata.name, None)
+            else:
+                Pod(obj).print_status(obj, self.seen_messages)
+                self.pods[obj.metadata.name] = obj
+                self.check_pods()
+
+    def _deployment_of(self, pod):
+        for owner in pod.metadata.ownerReferences or []:
+            if owner.kind == 'ReplicaSet':
+                return self.replica_set_owners.get(owner.name)
+        return None
+
+    def check_pods(self):
+        """
+        Проверяет только Pod ожидаемых Deployment: с тем же update-id выкачены и Pod-задачи,
+        их код выхода получает process_pod_results, а не ожидание Deployment
+
+        """
+        if not self.classifier:
+            return
+        pending = self.waiting_for()
+        for pod in list(self.pods.values()):
+            if self._deployment_of(pod) not in pending:
+                continue
+            failure = self.classifier.check_pod(pod)
+            if failure:
+                CONSOLE('#### Abort: %s' % failure)
+                raise failure
+
+    def _update_pending(self):
+        with self._lock:
+            for name in list(self.pending):
+                if self.ready_replicas.get(name, 0) >= self.min_ready_replicas:
+                    CONSOLE('# Deployment %s is ready' % name)
+                    self.pending.discard(name)
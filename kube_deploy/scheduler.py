@@ -0,0 +1,59 @@
+import bisect
+import contextvars
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+class DependencyCycleError(Exception):
+    pass
+
+
+class ApplyScheduler:
+    """
+    Выполняет task(node) для всех узлов графа на пуле из parallelism потоков.
+
+    Узел запускается, когда выполнены все его зависимости; из готовых узлов первым
+    берется тот, что раньше в списке, поэтому при parallelism=1 порядок совпадает с исходным.
+    После первой ошибки новые задачи не запускаются, дожидаемся уже запущенных и
+    пробрасываем ошибку. Задачи выполняются в контексте (contextvars) вызвавшего run потока.
+
+    """
+    def __init__(self, parallelism=1):
+        self.parallelism = max(parallelism or 1, 1)
+
+    def run(self, nodes, dependencies, task):
+        remaining = {i: set(dependencies.get(i, ())) for i in range(len(nodes))}
+        dependents = defaultdict(set)
+        for i, deps in remaining.items():
+            for j in deps:
+                dependents[j].add(i)
+
+        ready = [i for i, deps in remaining.items() if not deps]
+        running = {}
+        done_count = 0
+        error = None
+
+        with ThreadPoolExecutor(max_workers=self.parallelism) as pool:
+            while 1:
+                while ready and error is None and len(running) < self.parallelism:
+                    i = ready.pop(0)
+                    running[pool.submit(contextvars.copy_context().run, task, nodes[i])] = i
+                if not running:
+                    break
+
+                finished, __ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    i = running.pop(future)
+                    if future.exception() is not None:
+                        error = error or future.exception()
+                        continue
+                    done_count += 1
+                    for j in dependents[i]:
+                        remaining[j].discard(i)
+                        if not remaining[j]:
+                            bisect.insort(ready, j)
+
+        if error is not None:
+            raise error
+        if done_count < len(nodes):
+            raise DependencyCycleError([nodes[i] for i, deps in remaining.items() if deps])
@@ -0,0 +1,121 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from kube_deploy.backend import connected_backend, use_backend
+from kube_deploy.kube import get_namespace
+from kube_deploy.log import CONSOLE, ERROR, LOG_PREFIX
+
+
+# одновременно в один namespace выкатывает только один запуск (важно для демона)
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+class Target:
+    """ Куда выкатываем: контекст kubeconfig (None - текущий) и namespace; у каждой цели свой backend """
+    def __init__(self, context, namespace, backend):
+        self.context = context
+        self.namespace = namespace
+        self.backend = backend
+
+    @property
+    def lock(self):
+        with _locks_lock:
+            return _locks.setdefault((self.context, self.namespace), threading.Lock())
+
+    @property
+    def label(self):
+        if self.context:
+            return '%s/%s' % (self.context, self.namespace)
+        return self.namespace
+
+    @contextmanager
+    def activate(self, prefix=False):
+        """ Запросы внутри блока идут через backend цели; prefix - помечать вывод меткой цели """
+        token = LOG_PREFIX.set('[%s] ' % self.label if prefix else '')
+        try:
+            with use_backend(self.backend):
+                yield self
+        finally:
+            LOG_PREFIX.reset(token)
+
+    def __str__(self):
+        return self.label
+
+
+def init_targets(contexts=None, namespaces=None):
+    """
+    Цели - все сочетания contexts x namespaces. Без namespaces берется namespace контекста.
+    Подключаемся ко всем заранее, чтобы ошибка в конфигурации не проявилась посреди выкатки
+
+    """
+    targets = []
+    for context in contexts or [None]:
+        for namespace in namespaces or [None]:
+            backend = connected_backend(context)
+            if namespace is None:
+                with use_backend(backend):
+                    namespace = get_namespace()
+            targets.append(Target(context, namespace, backend))
+    # одна и та же цель, заданная дважды, выкатывается один раз
+    unique = {}
+    for target in targets:
+        unique.setdefault((target.context, target.namespace), target)
+    return list(unique.values())
+
+
+class TargetResult:
+    def __init__(self, target, error=None, elapsed=None, skipped=False):
+        self.target = target
+        self.error = error
+        self.elapsed = elapsed
+        self.skipped = skipped
+
+    @property
+    def ok(self):
+        return self.error is None and not self.skipped
+
+    def __str__(self):
+        if self.skipped:
+            return '%s: skipped' % self.target
+        if self.error is not None:
+            return '%s: FAILED (%.1f s): %s' % (self.target, self.elapsed, self.error)
+        return '%s: ok (%.1f s)' % (self.target, self.elapsed)
+
+
+def run_targets(targets, task, parallelism, stop_on_failure=False):
+    """
+    Выполняет task(target) для всех целей, не больше parallelism одновременно.
+    Ошибка одной цели не прерывает остальные; со stop_on_failure после первой ошибки
+    новые цели не начинаются. Возвращает TargetResult в порядке targets
+
+    """
+    failed = threading.Event()
+
+    def run(target):
+        if stop_on_failure and failed.is_set():
+            return TargetResult(target, skipped=True)
+        start_t = time.time()
+        with target.activate(prefix=True):
+            try:
+                task(target)
+            except Exception as e:
+                failed.set()
+                ERROR('#### Failed: %s' % e)
+                return TargetResult(target, error=e, elapsed=time.time() - start_t)
+        return TargetResult(target, elapsed=time.time() - start_t)
+
+    with ThreadPoolExecutor(max_workers=max(parallelism or 1, 1)) as pool:
+        futures = [pool.submit(contextvars.copy_context().run, run, target) for target in targets]
+        return [future.result() for future in futures]
+
+
+def print_results(results):
+    CONSOLE('#### Targets: %s ok, %s failed, %s skipped'
+            % (sum(r.ok for r in results), sum(r.error is not None for r in results),
+               sum(r.skipped for r in results)))
+    for result in results:
+        CONSOLE('# %s' % result)
@@ -0,0 +1,73 @@
+"""
+Интервалы временной шкалы запуска (--trace-out, см. kube_lite.trace) и cProfile (--profile).
+Без --trace-out kube_lite не импортируется, а span() отдает пустой контекстный менеджер.
+
+"""
+import functools
+import threading
+from contextlib import contextmanager, nullcontext
+
+from kube_deploy.options import Options
+
+_NO_SPAN = nullcontext()
+
+
+def span(name, cat='phase', **args):
+    if not Options.trace_out:
+        return _NO_SPAN
+    from kube_lite import trace
+    return trace.span(name, cat, **args)
+
+
+def api_span(method, path):
+    if not Options.trace_out:
+        return _NO_SPAN
+    from kube_lite import trace
+    return trace.api_span(method, path)
+
+
+def traced(name=None):
+    """ Декоратор: весь вызов функции - интервал name (по умолчанию - имя функции) """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name or function.__name__):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def profiled(path):
+    """
+    cProfile блока во всех потоках, которые в нем запущены (apply, rollout, цели); результат -
+    один файл pstats. Профилировщик потока включается при первом событии в нем (threading.setprofile),
+    поэтому в демоне в профиль попадут и потоки параллельных запусков
+
+    """
+    import cProfile
+    import pstats
+
+    profiles = []
+    lock = threading.Lock()
+
+    def start_thread_profile(*args):
+        profile = cProfile.Profile()
+        with lock:
+            profiles.append(profile)
+        # заменяет start_thread_profile в этом потоке
+        profile.enable()
+
+    main_profile = cProfile.Profile()
+    threading.setprofile(start_thread_profile)
+    main_profile.enable()
+    try:
+        yield
+    finally:
+        main_profile.disable()
+        threading.setprofile(None)
+        stats = pstats.Stats(main_profile)
+        with lock:
+            for profile in profiles:
+                stats.add(profile)
+        stats.dump_stats(path)
@@ -1,2 +1,2 @@
-from .direct_api import KubernetesApi, KubernetesError, NotFoundError
+from .direct_api import KubernetesApi, KubernetesError, NotFoundError, GoneError
 from .options import Options
@@ -0,0 +1,272 @@
+import asyncio
+import json
+import math
+import time
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from kube_lite.direct_api import KubernetesApi, GoneError
+from kube_lite.document import Document
+from kube_lite.log import DEBUG, CONSOLE
+from kube_lite.options import Options
+from kube_lite.transport import TransportStats, build_ssl_context
+from kube_lite.util import to_json
+from kube_lite.wait import ObjectDeletedError, WaitTimeoutError
+from kube_lite.watch import Watch, ResourceExpired, WATCH_TIMEOUT, CONNECT_TIMEOUT, RECONNECT_DELAY
+
+
+class Response(object):
+    """ Ответ в том виде, в каком его ожидает KubernetesError """
+    def __init__(self, status_code, reason, headers, text):
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers
+        self.text = text
+
+
+def _query(params):
+    query = {}
+    for k, v in (params or {}).items():
+        if v is None:
+            continue
+        if isinstance(v, bool):
+            v = 'true' if v else 'false'
+        query[k] = v
+    return query
+
+
+class AsyncKubernetesApi(object):
+    """
+    asyncio-вариант KubernetesApi: адрес, токен и сертификаты берутся из KubernetesApi,
+    соединения - из неблокирующего пула aiohttp. CONCURRENCY ограничивает число
+    одновременных запросов (watch-потоки в него не входят).
+
+    """
+    CONCURRENCY = 100
+
+    stats = TransportStats()
+    _session = None
+    _semaphore = None
+    _loop = None
+
+    @classmethod
+    def init(cls, concurrency=None):
+        if concurrency:
+            cls.CONCURRENCY = concurrency
+            cls._semaphore = None
+
+    @classmethod
+    def session(cls):
+        if aiohttp is None:
+            raise ImportError('AsyncKubernetesApi requires aiohttp')
+        loop = asyncio.get_running_loop()
+        if cls._session is None or cls._session.closed or cls._loop is not loop:
+            ssl_context = build_ssl_context(KubernetesApi.CA_CERT_PATH, KubernetesApi.CLIENT_CERT, stats=cls.stats)
+            connector = aiohttp.TCPConnector(limit=0, ssl=ssl_context)
+            cls._session = aiohttp.ClientSession(connector=connector)
+            cls._semaphore = None
+            cls._loop = loop
+        if cls._semaphore is None:
+            cls._semaphore = asyncio.Semaphore(cls.CONCURRENCY)
+        return cls._session
+
+    @classmethod
+    async def close(cls):
+        if cls._session is not None:
+            await cls._session.close()
+            cls._session = None
+
+    @classmethod
+    async def _raise_for_status(cls, method, path, r):
+        if 200 <= r.status <= 299:
+            return
+        text = await r.text()
+        DEBUG('Kubernetes API error: %s (%s): %s' % (path, r.status, text))
+        error_cls = KubernetesApi.error_class(r.status)
+        raise error_cls(method=method, path=path, response=Response(r.status, r.reason, r.headers, text))
+
+    @classmethod
+    async def call(cls, method, path, data=None, api=None, params=None, dry_run=False):
+        if data:
+            DEBUG('--- Request:', level=2)
+            DEBUG(data, level=2)
+        if dry_run:
+            return ''
+
+        path = KubernetesApi.full_path(path, api)
+        session = cls.session()
+        async with cls._semaphore:
+            cls.stats.inc('requests')
+            async with session.request(method, KubernetesApi.url(path), headers=KubernetesApi.headers(),
+                                       data=data, params=_query(params)) as r:
+                await cls._raise_for_status(method, path, r)
+                text = await r.text()
+
+        DEBUG('--- Response:', level=2)
+        DEBUG(text, level=2)
+        return text
+
+    @classmethod
+    async def stream(cls, method, path, api=None, params=None, timeout=None):
+        """ Асинхронный генератор строк ответа по мере их поступления """
+        path = KubernetesApi.full_path(path, api)
+        client_timeout = aiohttp.ClientTimeout(connect=CONNECT_TIMEOUT, sock_read=timeout)
+        cls.stats.inc('requests')
+        async with cls.session().request(method, KubernetesApi.url(path), headers=KubernetesApi.headers(),
+                                         params=_query(params), timeout=client_timeout) as r:
+            await cls._raise_for_status(method, path, r)
+            buffer = b''
+            async for chunk in r.content.iter_any():
+                buffer += chunk
+                *lines, buffer = buffer.split(b'\n')
+                for line in lines:
+                    yield line
+            if buffer:
+                yield buffer
+
+    @classmethod
+    async def get(cls, kind, name=None, namespace=None, api=None, params=None):
+        path = KubernetesApi.kind_path(kind, name, namespace)
+        text = await cls.call('GET', path, api=KubernetesApi.kind_api(kind, api), params=params)
+        return Document(json.loads(text))
+
+    @classmethod
+    async def iter_pages(cls, kind, namespace=None, api=None, params=None, page_size=None):
+        """ Как KubernetesApi.iter_pages: LIST по страницам через limit/continue """
+        params = dict(params or {}, limit=page_size or KubernetesApi.LIST_PAGE_SIZE)
+        while 1:
+            page = await cls.get(kind, namespace=namespace, api=api, params=params)
+            yield page
+            token = getattr(page.metadata, 'continue', None)
+            if not token:
+                return
+            params['continue'] = token
+
+    @classmethod
+    async def iter_list(cls, kind, namespace=None, api=None, params=None, page_size=None):
+        async for page in cls.iter_pages(kind, namespace=namespace, api=api, params=params, page_size=page_size):
+            for item in page['items'] or []:
+                yield item
+
+    @classmethod
+    async def replace(cls, doc: Document):
+        path = KubernetesApi.get_api_path(doc, name=doc.metadata.name)
+        text = await cls.call('PUT', path, data=to_json(doc), api=doc.apiVersion, dry_run=Options.dry_run)
+        return Document(json.loads(text or '{}'))
+
+    @classmethod
+    async def create(cls, doc: Document):
+        path = KubernetesApi.get_api_path(doc)
+        text = await cls.call('POST', path, data=to_json(doc), api=doc.apiVersion, dry_run=Options.dry_run)
+        return Document(json.loads(text or '{}'))
+
+    @classmethod
+    async def delete(cls, kind, name, namespace=None, api=None,
+                     grace_period_seconds=None, orphan_dependents=None, propagation_policy=None):
+        query_params = KubernetesApi.delete_params(grace_period_seconds, orphan_dependents, propagation_policy)
+        path = KubernetesApi.kind_path(kind, name, namespace)
+        if not Options.dry_run:
+            await cls.call('DELETE', path, api=KubernetesApi.kind_api(kind, api), params=query_params)
+
+    @classmethod
+    async def read_pod_log(cls, name, namespace, container=None, tail_lines=None, **params):
+        query_params = KubernetesApi.log_params(container, tail_lines, **params)
+        path = 'namespaces/%s/pods/%s/log' % (namespace, name)
+        return await cls.call('GET', path, params=query_params)
+
+    @classmethod
+    async def stream_pod_log(cls, name, namespace, container=None, tail_lines=None, follow=True, **params):
+        query_params = KubernetesApi.log_params(container, tail_lines, follow=follow, **params)
+        path = 'namespaces/%s/pods/%s/log' % (namespace, name)
+        async for line in cls.stream('GET', path, params=query_params):
+            yield line.decode('utf-8', errors='replace')
+
+    @classmethod
+    def watch(cls, kind, namespace=None, name=None, label_selector=None, field_selector=None, api=None):
+        return AsyncWatch(kind, namespace=namespace, name=name, label_selector=label_selector,
+                          field_selector=field_selector, api=api)
+
+
+class AsyncWatch(Watch):
+    async def list(self):
+        pages = [page async for page in AsyncKubernetesApi.iter_pages(self.kind, namespace=self.namespace,
+                                                                      api=self.api, params=self.params())]
+        return self.sync_pages(pages)
+
+    async def stream(self, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        if self.resource_version is None:
+            for event in await self.list():
+                yield event
+
+        path = KubernetesApi.kind_path(self.kind, namespace=self.namespace)
+        while 1:
+            timeout_seconds = WATCH_TIMEOUT
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return
+                timeout_seconds = min(WATCH_TIMEOUT, math.ceil(remaining))
+
+            try:
+                async for line in AsyncKubernetesApi.stream('GET', path, api=self.api,
+                                                            params=self.watch_params(timeout_seconds),
+                                                            timeout=timeout_seconds + CONNECT_TIMEOUT):
+                    if not line.strip():
+                        continue
+                    event = self.handle(json.loads(line))
+                    if event:
+                        yield event
+                    if deadline is not None and time.time() >= deadline:
+                        return
+            except (GoneError, ResourceExpired) as e:
+                DEBUG('watch %s: %s, relisting' % (self.kind, e))
+                for event in await self.list():
+                    yield event
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                DEBUG('watch %s: %s, reconnecting from resourceVersion=%s' % (self.kind, e, self.resource_version))
+                await asyncio.sleep(RECONNECT_DELAY)
+
+
+async def wait_until_deleted(kind, name, namespace, timeout=120):
+    watch = AsyncWatch(kind, namespace=namespace, name=name)
+    await watch.list()
+    if not watch.objects:
+        return
+    CONSOLE('#### Waiting until server deletes %s %s/%s' % (kind, namespace, name))
+    events = watch.stream(timeout=timeout)
+    try:
+        async for __event in events:
+            if not watch.objects:
+                return
+    finally:
+        await events.aclose()
+    raise WaitTimeoutError(kind, name)
+
+
+async def wait_for_container(name, namespace, container_name, expected_state='terminated', timeout=None):
+    from kube_lite.pod import print_status
+    if timeout is None:
+        timeout = Options.wait
+
+    seen_messages = set()
+    CONSOLE('#### Waiting for container %s/%s' % (name, container_name))
+    events = AsyncWatch('pod', namespace=namespace, name=name).stream(timeout=timeout)
+    try:
+        async for event_type, pod_doc in events:
+            if event_type == 'DELETED':
+                raise ObjectDeletedError('pod', name)
+            print_status(pod_doc, seen_messages)
+            for cs in pod_doc.status.containerStatuses or []:
+                if cs.name == container_name:
+                    DEBUG('state=%s' % cs.state)
+                    container_state = getattr(cs.state, expected_state, False)
+                    if container_state:
+                        return container_state
+    finally:
+        await events.aclose()
+
+    raise WaitTimeoutError(name)
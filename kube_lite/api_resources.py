@@ -1,7 +1,23 @@
+import json
 import os
 import re
-import subprocess
+import tempfile
+import threading
+import time
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from .log import DEBUG
+
+DISCOVERY_TTL = 600
+# не чаще, чем раз в столько секунд, перечитываем discovery из-за неизвестного kind
+MISS_REFRESH_INTERVAL = 30
+DISCOVERY_THREADS = 8
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+                         'kube_lite', 'discovery')
+
+MODULE_DIR = os.path.dirname(os.path.realpath(__file__))
+
 
 def parse_api_resources(text):
     header = None
@@ -20,34 +36,180 @@ def parse_api_resources(text):
                 start = end
         else:
             fields = {}
-            for label, start, end in header:
-                fields[label] = line[start:end].rstrip()
+            for i, (label, start, end) in enumerate(header):
+                # последняя колонка (VERBS) длиннее своего заголовка
+                fields[label] = line[start:end if i < len(header) - 1 else None].rstrip()
             yield fields
 
 
-ResourceInfo = namedtuple('ResourceInfo', ['name', 'kind', 'shortnames', 'apigroup', 'namespaced'])
+ResourceInfo = namedtuple('ResourceInfo', ['name', 'kind', 'shortnames', 'apigroup', 'namespaced', 'version'],
+                          defaults=(None,))
 
-def load_api_resources(parsed_table):
+
+def group_version(ri):
+    """ apiVersion для пути запроса: 'v1', 'apps/v1'; None, если версия группы неизвестна """
+    if not ri.apigroup:
+        return ri.version or 'v1'
+    if ri.version:
+        return '%s/%s' % (ri.apigroup, ri.version)
+    return None
+
+
+def index_kinds(resource_infos):
     kinds = {}
-    for record in parsed_table:
-        ri = ResourceInfo(record['NAME'], record['KIND'], record['SHORTNAMES'].split(','), record['APIGROUP'],
-                          record['NAMESPACED'] == 'true')
-        kinds[ri.kind] = ri
-        kinds[ri.kind.lower()] = ri
+    for ri in resource_infos:
+        # первым идет предпочтительный вариант (core, затем группы в порядке, заданном сервером)
+        kinds.setdefault(ri.kind, ri)
+        kinds.setdefault(ri.kind.lower(), ri)
     return kinds
 
 
-def refresh_api_resources():
-    text = subprocess.check_output(['kubectl', 'api-resources', '-o', 'wide'])
-    global KINDS
-    KINDS.clear()
-    KINDS.update(load_api_resources(parse_api_resources(text.decode())))
+def load_api_resources(parsed_table):
+    return index_kinds(ResourceInfo(record['NAME'], record['KIND'], record['SHORTNAMES'].split(','),
+                                    record['APIGROUP'], record['NAMESPACED'] == 'true')
+                       for record in parsed_table)
 
 
-MODULE_DIR = os.path.dirname(os.path.realpath(__file__))
+def load_standard_api_resources():
+    # kubectl api-resources -o wide > standard_api_resources.txt
+    with open(MODULE_DIR + '/standard_api_resources.txt') as f:
+        return load_api_resources(parse_api_resources(f.read()))
+
+
+def parse_resource_list(resource_list):
+    """ Ответ /api/v1 или /apis/<group>/<version> (APIResourceList) """
+    group, __, version = resource_list['groupVersion'].rpartition('/')
+    for r in resource_list.get('resources') or []:
+        if '/' in r['name']:
+            # subresource: pods/log, deployments/scale ...
+            continue
+        yield ResourceInfo(r['name'], r['kind'], r.get('shortNames') or [], group, r['namespaced'], version)
+
+
+def discover_api_resources():
+    """ Таблица ресурсов из discovery endpoints сервера (/api, /apis) """
+    from .direct_api import KubernetesApi
+
+    def get(path):
+        return json.loads(KubernetesApi.call('GET', path).text)
+
+    paths = ['/api/%s' % version for version in get('/api')['versions']]
+    for group in get('/apis')['groups']:
+        paths.append('/apis/%s' % group['preferredVersion']['groupVersion'])
+
+    with ThreadPoolExecutor(max_workers=DISCOVERY_THREADS) as pool:
+        resource_lists = list(pool.map(get, paths))
+
+    resource_infos = []
+    for resource_list in resource_lists:
+        resource_infos.extend(parse_resource_list(resource_list))
+    return resource_infos
+
+
+class KindRegistry:
+    """
+    Словарь kind -> ResourceInfo, который заполняется при первом обращении:
+    из кеша на диске (если он моложе DISCOVERY_TTL), иначе из discovery API сервера.
+    Если сервер недоступен, используется таблица стандартных ресурсов.
+    При обращении к неизвестному kind (например, только что созданному CRD) discovery перечитывается
+
+    """
+    def __init__(self):
+        self._kinds = None
+        self._refreshed_at = 0
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def cache_path():
+        from .direct_api import KubernetesApi
+        return os.path.join(CACHE_DIR, '%s_%s.json' % (KubernetesApi.API_HOST, KubernetesApi.API_PORT))
+
+    def _read_cache(self):
+        try:
+            with open(self.cache_path()) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - cached['time'] > DISCOVERY_TTL:
+            return None
+        return [ResourceInfo(*record) for record in cached['resources']]
+
+    def _write_cache(self, resource_infos):
+        path = self.cache_path()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'time': time.time(), 'resources': resource_infos}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            DEBUG('discovery cache: %s' % e)
+
+    def refresh(self):
+        with self._lock:
+            self._refreshed_at = time.time()
+            try:
+                resource_infos = discover_api_resources()
+            except Exception as e:
+                DEBUG('API discovery failed: %s' % e)
+                if self._kinds is None:
+                    self._kinds = load_standard_api_resources()
+                return
+            self._write_cache(resource_infos)
+            self._kinds = index_kinds(resource_infos)
+
+    def invalidate(self):
+        """ Следующее обращение заново загрузит таблицу (например, после переключения на другой кластер) """
+        with self._lock:
+            self._kinds = None
+            self._refreshed_at = 0
+
+    def _load(self):
+        with self._lock:
+            if self._kinds is not None:
+                return self._kinds
+            resource_infos = self._read_cache()
+            if resource_infos is not None:
+                self._kinds = index_kinds(resource_infos)
+            else:
+                self.refresh()
+            return self._kinds
+
+    def __getitem__(self, kind):
+        kinds = self._load()
+        if kind in kinds:
+            return kinds[kind]
+        with self._lock:
+            if time.time() - self._refreshed_at >= MISS_REFRESH_INTERVAL:
+                DEBUG('unknown kind %s, refreshing API discovery' % kind)
+                self.refresh()
+            return self._kinds[kind]
+
+    def __contains__(self, kind):
+        try:
+            self[kind]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, kind, default=None):
+        try:
+            return self[kind]
+        except KeyError:
+            return default
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def items(self):
+        return self._load().items()
+
+
+def refresh_api_resources():
+    KINDS.refresh()
 
-# load kubernetes standard api resources
-# kubectl api-resources -o wide > default_api_resources.txt
-with open(MODULE_DIR + '/standard_api_resources.txt') as f:
-    KINDS = load_api_resources(parse_api_resources(f.read()))
 
+KINDS = KindRegistry()
@@ -1,4 +1,6 @@
-from urllib.parse import urlparse
+import threading
+import time
+from contextlib import closing
 
 import requests
 import json
@@ -6,11 +8,21 @@ import json
 from kube_lite.options import Options
 from kube_lite.util import to_json
 
-from .log import DEBUG
-from .api_resources import KINDS
+from .log import DEBUG, iter_log_lines
+from .api_resources import KINDS, group_version
 from .document import Document
+from . import metrics, trace
+from .flowcontrol import FlowControl
+from .transport import KubeHTTPAdapter, TransportStats, build_ssl_context
 
 TOKEN_FILE = '/var/run/secrets/kubernetes.io/serviceaccount/token'
+CONNECT_TIMEOUT = 10
+
+
+def _body_size(body):
+    if body is None:
+        return 0
+    return len(body.encode('utf-8') if isinstance(body, str) else body)
 
 
 class KubernetesError(Exception):
@@ -37,13 +49,26 @@ class KubernetesError(Exception):
 class NotFoundError(KubernetesError):
     pass
 
+class GoneError(KubernetesError):
+    pass
+
 
 class KubernetesApi(object):
+    API_SCHEME = 'https'
     API_HOST = 'kubernetes.default.svc'
     API_PORT = 443
     TOKEN = None
     CA_CERT_PATH = '/var/run/secrets/kubernetes.io/serviceaccount/ca.crt'
     CLIENT_CERT = None
+    POOL_SIZE = 10
+    # объектов на страницу в iter_pages/iter_list
+    LIST_PAGE_SIZE = 500
+
+    stats = TransportStats()
+    # без ограничения и без повторов: их включает тот, кто создает подключение (kube_deploy.backend)
+    flow_control = FlowControl(qps=0, max_retries=0)
+    _session = None
+    _session_lock = threading.Lock()
 
     @classmethod
     def get_api_path(cls, doc, name=None):
@@ -57,7 +82,7 @@ class KubernetesApi(object):
         return path
 
     @classmethod
-    def init(cls, host=None, port=None, token=None):
+    def init(cls, host=None, port=None, token=None, pool_size=None):
         if host:
             cls.API_HOST = host
         if port:
@@ -67,70 +92,195 @@ class KubernetesApi(object):
         if token is None:
             with open(TOKEN_FILE) as f:
                 cls.TOKEN = 'Bearer ' + f.read()
+        cls.reset_session(pool_size)
+        KINDS.invalidate()
 
     @classmethod
-    def init_from_kubeconfig(cls):
-        import kubernetes
-        from kubernetes.client.configuration import configuration
-        kubernetes.config.load_kube_config()
-        cls.CA_CERT_PATH = configuration.ssl_ca_cert
-        cls.CLIENT_CERT = (configuration.cert_file, configuration.key_file)
-        host_uo = urlparse(configuration.host)
-        cls.API_HOST = host_uo.hostname
-        cls.API_PORT = host_uo.port
-        cls.TOKEN = configuration.get_api_key_with_prefix('authorization')
+    def init_from_kubeconfig(cls, pool_size=None, path=None, context=None):
+        from .kubeconfig import load_kubeconfig
+        config = load_kubeconfig(path, context)
+        cls.CA_CERT_PATH = config.ca_cert_path
+        cls.CLIENT_CERT = config.client_cert
+        cls.API_SCHEME = config.scheme
+        cls.API_HOST = config.host
+        cls.API_PORT = config.port
+        cls.TOKEN = config.token
+        cls.reset_session(pool_size)
+        KINDS.invalidate()
+        return config
 
     @classmethod
-    def call(cls, method, path, data=None, api=None, params=None, dry_run=False):
-        if data:
-            DEBUG('--- Request:', level=2)
-            DEBUG(data, level=2)
+    def reset_session(cls, pool_size=None):
+        """
+        Закрывает текущий пул соединений; следующий запрос откроет новый
+        с актуальными сертификатами
 
-        headers = {'Content-Type': 'application/json'}
-        if cls.TOKEN:
-            headers['Authorization'] = cls.TOKEN
+        """
+        with cls._session_lock:
+            if pool_size:
+                cls.POOL_SIZE = pool_size
+            if cls._session is not None:
+                cls._session.close()
+                cls._session = None
+
+    @classmethod
+    def session(cls):
+        # один пул keep-alive соединений на процесс, общий для всех потоков
+        session = cls._session
+        if session is None:
+            with cls._session_lock:
+                if cls._session is None:
+                    ssl_context = build_ssl_context(cls.CA_CERT_PATH, cls.CLIENT_CERT, stats=cls.stats)
+                    adapter = KubeHTTPAdapter(ssl_context, pool_connections=1, pool_maxsize=cls.POOL_SIZE)
+                    session = requests.Session()
+                    session.verify = bool(cls.CA_CERT_PATH)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    cls._session = session
+                session = cls._session
+        return session
+
+    @classmethod
+    def kind_path(cls, kind, name=None, namespace=None):
+        k = KINDS[kind.lower()]
+        path = k.name
+        if namespace:
+            path = 'namespaces/%s/%s' % (namespace, path)
+        if name:
+            path += '/' + name
+        return path
+
+    @classmethod
+    def kind_api(cls, kind, api=None):
+        """ apiVersion для запросов к kind: указанный явно или предпочтительный из discovery """
+        return api or group_version(KINDS[kind.lower()])
 
+    @classmethod
+    def full_path(cls, path, api=None):
+        if path.startswith('/'):
+            # уже полный путь (например, discovery: /api, /apis/apps/v1)
+            return path
         if not api:
             api = 'api/v1'
         elif '/' not in api:
             api = 'api/' + api
         else:
             api = 'apis/' + api
-        path = '/%s/%s' % (api, path)
-        url = 'https://%s:%s%s' % (cls.API_HOST, cls.API_PORT, path)
-        request = requests.Request(url=url, method=method, headers=headers, data=data, params=params)
-        session = requests.Session()
+        return '/%s/%s' % (api, path)
+
+    @classmethod
+    def url(cls, full_path):
+        return '%s://%s:%s%s' % (cls.API_SCHEME, cls.API_HOST, cls.API_PORT, full_path)
+
+    @classmethod
+    def headers(cls, extra=None):
+        headers = {'Content-Type': 'application/json'}
+        if cls.TOKEN:
+            headers['Authorization'] = cls.TOKEN
+        if extra:
+            headers.update(extra)
+        return headers
+
+    @staticmethod
+    def error_class(status_code):
+        if status_code == 404:
+            return NotFoundError
+        elif status_code == 410:
+            return GoneError
+        return KubernetesError
+
+    @classmethod
+    def call(cls, method, path, data=None, api=None, params=None, dry_run=False, stream=False, timeout=None,
+             headers=None):
+        if data:
+            DEBUG('--- Request:', level=2)
+            DEBUG(data, level=2)
+
+        path = cls.full_path(path, api)
+        request = requests.Request(url=cls.url(path), method=method, headers=cls.headers(headers), data=data,
+                                   params=params)
 
         if dry_run:
             return requests.Response()
-        else:
-            r = session.send(request.prepare(), verify=cls.CA_CERT_PATH, cert=cls.CLIENT_CERT)
-
-        DEBUG('--- Response:', level=2)
-        DEBUG(r.text, level=2)
+        r = cls._send(method, request.prepare(), stream, timeout)
 
         if 200 <= r.status_code <= 299:
+            if not stream:
+                DEBUG('--- Response:', level=2)
+                DEBUG(r.text, level=2)
             return r
         else:
             DEBUG('Kubernetes API error: %s (%s): %s' % (path, r.status_code, r.text))
-            if r.status_code == 404:
-                error_cls = NotFoundError
-            else:
-                error_cls = KubernetesError
+            error_cls = cls.error_class(r.status_code)
             raise(error_cls(method=method, path=path, response=r))
 
 
+    @classmethod
+    def _send(cls, method, prepared, stream, timeout):
+        """ Отправка через flow_control: очередь на токен и повтор после 429/5xx и обрыва соединения """
+        attempt = 0
+        while 1:
+            cls.flow_control.acquire(method)
+            cls.stats.inc('requests')
+            collector = metrics.current()
+            if collector is not None:
+                start = time.perf_counter()
+            try:
+                with trace.api_span(method, prepared.path_url):
+                    r = cls.session().send(prepared, stream=stream, timeout=timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if collector is not None:
+                    collector.observe_request(method, prepared.path_url, 'error', time.perf_counter() - start,
+                                              bytes_out=_body_size(prepared.body))
+                delay = cls.flow_control.retry_delay(method, attempt)
+                if delay is None:
+                    raise
+                DEBUG('%s %s: %s, retry in %.1f s' % (method, prepared.path_url, e, delay))
+            else:
+                if collector is not None:
+                    # у потокового ответа (watch, логи) время - до заголовков, размер - из Content-Length
+                    bytes_in = int(r.headers.get('Content-Length') or 0) if stream else len(r.content)
+                    collector.observe_request(method, prepared.path_url, r.status_code, time.perf_counter() - start,
+                                              bytes_in, _body_size(prepared.body))
+                delay = None
+                if not 200 <= r.status_code <= 299:
+                    delay = cls.flow_control.retry_delay(method, attempt, r.status_code,
+                                                         r.headers.get('Retry-After'))
+                if delay is None:
+                    return r
+                DEBUG('%s %s: %s, retry in %.1f s' % (method, prepared.path_url, r.status_code, delay))
+                r.close()
+            time.sleep(delay)
+            attempt += 1
+
     @classmethod
     def get(cls, kind, name=None, namespace=None, api=None, params=None):
-        k = KINDS[kind.lower()]
-        path = k.name
-        if namespace:
-            path = 'namespaces/%s/%s' % (namespace, path)
-        if name:
-            path += '/' + name
-        r = cls.call('GET', path, api=api, params=params)
+        path = cls.kind_path(kind, name, namespace)
+        r = cls.call('GET', path, api=cls.kind_api(kind, api), params=params)
         return Document(json.loads(r.text))
 
+    @classmethod
+    def iter_pages(cls, kind, namespace=None, api=None, params=None, page_size=None):
+        """
+        LIST по страницам (limit/continue): генератор документов-списков по page_size объектов,
+        так что в памяти одновременно только одна страница. Все страницы - срез одной resourceVersion
+
+        """
+        params = dict(params or {}, limit=page_size or cls.LIST_PAGE_SIZE)
+        while 1:
+            page = cls.get(kind, namespace=namespace, api=api, params=params)
+            yield page
+            token = getattr(page.metadata, 'continue', None)
+            if not token:
+                return
+            params['continue'] = token
+
+    @classmethod
+    def iter_list(cls, kind, namespace=None, api=None, params=None, page_size=None):
+        """ Объекты коллекции по мере получения страниц """
+        for page in cls.iter_pages(kind, namespace=namespace, api=api, params=params, page_size=page_size):
+            yield from page['items'] or []
+
     @classmethod
     def replace(cls, doc: Document):
         path = cls.get_api_path(doc, name=doc.metadata.name)
@@ -150,9 +300,8 @@ class KubernetesApi(object):
         doc = Document(json.loads(r.text))
         return doc
 
-    @classmethod
-    def delete(cls, kind, name, namespace=None, api=None,
-               grace_period_seconds=None, orphan_dependents=None, propagation_policy=None):
+    @staticmethod
+    def delete_params(grace_period_seconds=None, orphan_dependents=None, propagation_policy=None):
         query_params = {}
 
         if grace_period_seconds is not None:
@@ -161,38 +310,54 @@ class KubernetesApi(object):
             query_params['orphanDependents'] = orphan_dependents
         if propagation_policy is not None:
             query_params['propagationPolicy'] = propagation_policy
+        return query_params
 
-        k = KINDS[kind.lower()]
-        path = k.name
-        if namespace:
-            path = 'namespaces/%s/%s' % (namespace, path)
-        if name:
-            path += '/' + name
+    @classmethod
+    def delete(cls, kind, name, namespace=None, api=None,
+               grace_period_seconds=None, orphan_dependents=None, propagation_policy=None):
+        query_params = cls.delete_params(grace_period_seconds, orphan_dependents, propagation_policy)
+        path = cls.kind_path(kind, name, namespace)
 
         if not Options.dry_run:
-            cls.call('DELETE', path, api=api, params=query_params, dry_run=Options.dry_run)
+            cls.call('DELETE', path, api=cls.kind_api(kind, api), params=query_params, dry_run=Options.dry_run)
 
-    @classmethod
-    def read_pod_log(cls, name, namespace, container=None, tail_lines=None):
+    @staticmethod
+    def log_params(container=None, tail_lines=None, follow=None, since_seconds=None, limit_bytes=None,
+                   timestamps=None, previous=None):
+        # see kubernetes/client/apis/core_v1_api.py
         query_params = {}
         if container:
             query_params['container'] = container
         if tail_lines:
             query_params['tailLines'] = tail_lines
-        # see kubernetes/client/apis/core_v1_api.py
-        # if 'follow' in params:
-        #     query_params['follow'] = params['follow']
-        # if 'limit_bytes' in params:
-        #     query_params['limitBytes'] = params['limit_bytes']
-        # if 'pretty' in params:
-        #     query_params['pretty'] = params['pretty']
-        # if 'previous' in params:
-        #     query_params['previous'] = params['previous']
-        # if 'since_seconds' in params:
-        #     query_params['sinceSeconds'] = params['since_seconds']
-        # if 'timestamps' in params:
-        #     query_params['timestamps'] = params['timestamps']
+        if follow:
+            query_params['follow'] = 'true'
+        if since_seconds:
+            query_params['sinceSeconds'] = since_seconds
+        if limit_bytes:
+            query_params['limitBytes'] = limit_bytes
+        if timestamps:
+            query_params['timestamps'] = 'true'
+        if previous:
+            query_params['previous'] = 'true'
+        return query_params
 
+    @classmethod
+    def read_pod_log(cls, name, namespace, container=None, tail_lines=None, **params):
+        query_params = cls.log_params(container, tail_lines, **params)
         path = 'namespaces/%s/pods/%s/log' % (namespace, name)
         r = cls.call('GET', path, params=query_params)
         return r.text
+
+    @classmethod
+    def stream_pod_log(cls, name, namespace, container=None, tail_lines=None, follow=True, **params):
+        """
+        Генератор строк лога по мере их поступления: при follow=True поток заканчивается
+        вместе с контейнером, весь лог в памяти не собирается
+
+        """
+        query_params = cls.log_params(container, tail_lines, follow=follow, **params)
+        path = 'namespaces/%s/pods/%s/log' % (namespace, name)
+        r = cls.call('GET', path, params=query_params, stream=True, timeout=(CONNECT_TIMEOUT, None))
+        with closing(r):
+            yield from iter_log_lines(r.iter_content(chunk_size=None))
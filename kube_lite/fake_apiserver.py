@@ -0,0 +1,815 @@
+"""
+Заглушка API сервера Kubernetes в текущем процессе - для тестов и бенчмарков без кластера.
+
+Обслуживает по http то, чем пользуются kube_lite и kube_deploy: discovery (/api, /apis),
+GET/LIST (labelSelector, fieldSelector по metadata.name/namespace, limit/continue), POST, PUT,
+PATCH (strategic merge и merge patch - как рекурсивное слияние, server-side apply), DELETE объекта
+и коллекции с каскадным удалением по ownerReferences, WATCH с resourceVersion и 410 для устаревшей
+версии, лог пода. Вместо контроллеров - упрощенные переходы состояний: Deployment создает
+ReplicaSet, тот - поды, поды через ready_delay становятся Running и готовыми, а поды без владельца
+с restartPolicy Never/OnFailure еще через ready_delay завершаются с кодом 0.
+
+Задержка (latency) и ошибки (error_rate, inject_error) добавляются к каждому запросу, кроме discovery.
+
+    with FakeApiServer(ready_delay=0.01) as server:
+        server.write_kubeconfig(path)
+        KubernetesApi.init_from_kubeconfig(path=path)
+
+"""
+import base64
+import copy
+import hashlib
+import heapq
+import itertools
+import json
+import random
+import threading
+import time
+import traceback
+import uuid
+from collections import Counter, defaultdict, namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import yaml
+
+from .api_resources import MODULE_DIR, parse_api_resources
+from .informer import match_labels, parse_label_selector
+
+# версии групп для discovery; остальные группы - v1
+GROUP_VERSIONS = {'': 'v1', 'extensions': 'v1beta1', 'policy': 'v1beta1'}
+# столько последних событий хранится для WATCH с resourceVersion
+HISTORY_SIZE = 10000
+WATCH_TIMEOUT_MAX = 1800
+DEFAULT_POD_LOG = 'fake log line 1\nfake log line 2\n'
+
+ApiResource = namedtuple('ApiResource', ['name', 'kind', 'group', 'namespaced', 'verbs', 'shortnames'])
+_Event = namedtuple('_Event', ['rv', 'resource', 'namespace', 'name', 'labels', 'type', 'text'])
+
+
+class _ApiError(Exception):
+    def __init__(self, code, reason, message, headers=None):
+        super().__init__(message)
+        self.code = code
+        self.reason = reason
+        self.message = message
+        self.headers = headers or {}
+
+    def status(self):
+        return {'kind': 'Status', 'apiVersion': 'v1', 'metadata': {}, 'status': 'Failure',
+                'message': self.message, 'reason': self.reason, 'code': self.code}
+
+
+def load_resources():
+    """ {(группа, имя во множественном числе): ApiResource} по таблице стандартных ресурсов """
+    with open(MODULE_DIR + '/standard_api_resources.txt') as f:
+        records = list(parse_api_resources(f.read()))
+    resources = {}
+    for record in records:
+        resource = ApiResource(record['NAME'], record['KIND'], record['APIGROUP'], record['NAMESPACED'] == 'true',
+                               set(record['VERBS'].strip('[]').split()),
+                               [name for name in record['SHORTNAMES'].split(',') if name])
+        resources[resource.group, resource.name] = resource
+    return resources
+
+
+def merge(target, patch):
+    """ Рекурсивное слияние (JSON merge patch): None удаляет ключ, списки заменяются целиком """
+    if not isinstance(patch, dict):
+        return copy.deepcopy(patch)
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = merge(result.get(key), value)
+    return result
+
+
+def parse_field_selector(selector):
+    """ 'metadata.name=web,metadata.namespace!=test' -> [(поле, op, значение)] """
+    requirements = []
+    for term in (selector or '').split(','):
+        if not term:
+            continue
+        for op in ('!=', '==', '='):
+            if op in term:
+                field, value = term.split(op, 1)
+                requirements.append((field.strip(), '!=' if op == '!=' else '=', value.strip()))
+                break
+        else:
+            raise _ApiError(400, 'BadRequest', 'invalid field selector: %r' % selector)
+    return requirements
+
+
+def match_fields(requirements, obj):
+    for field, op, value in requirements:
+        actual = obj
+        for part in field.split('.'):
+            actual = actual.get(part) if isinstance(actual, dict) else None
+        if (str(actual) == value) != (op == '='):
+            return False
+    return True
+
+
+def _now():
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+
+
+def _replicas(obj):
+    replicas = (obj.get('spec') or {}).get('replicas')
+    return 1 if replicas is None else replicas
+
+
+class FakeApiServer(object):
+    def __init__(self, latency=0, error_rate=0, error_status=503, ready_delay=0.05, seed=None,
+                 history_size=HISTORY_SIZE):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.ready_delay = ready_delay
+        self.history_size = history_size
+        self.pod_logs = {}
+        self.request_count = 0
+        self.request_counts = Counter()
+        # принятые TCP соединения: по ним видно, переиспользует ли клиент keep-alive
+        self.connection_count = 0
+        self.resources = load_resources()
+        self._random = random.Random(seed)
+        self._injected = []
+        self._cond = threading.Condition(threading.RLock())
+        self._objects = {}
+        # uid владельца -> ключи зависимых объектов в _objects (ownerReferences)
+        self._dependents = defaultdict(set)
+        self._rv = 0
+        # события с resourceVersion _history_start .. _rv
+        self._history = []
+        self._history_start = 1
+        self._timers = []
+        self._timer_seq = itertools.count()
+        self._stopped = False
+        self._httpd = None
+        self._threads = []
+
+    # --- запуск
+
+    def start(self):
+        server = self
+
+        class Handler(_Handler):
+            api_server = server
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._httpd.daemon_threads = True
+        self._threads = [threading.Thread(target=self._httpd.serve_forever, args=(0.05,), name='fake-apiserver',
+                                          daemon=True),
+                         threading.Thread(target=self._run_timers, name='fake-controllers', daemon=True)]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+        for thread in self._threads:
+            thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return 'http://%s:%s' % (host, port)
+
+    def write_kubeconfig(self, path, namespace='default', context='fake'):
+        config = {'apiVersion': 'v1', 'kind': 'Config', 'current-context': context,
+                  'clusters': [{'name': context, 'cluster': {'server': self.url}}],
+                  'contexts': [{'name': context, 'context': {'cluster': context, 'user': context,
+                                                             'namespace': namespace}}],
+                  'users': [{'name': context, 'user': {'token': 'fake-token'}}]}
+        with open(path, 'w') as f:
+            yaml.safe_dump(config, f)
+        return path
+
+    def inject_error(self, status, count=1, method=None, retry_after=None):
+        """ Следующие count запросов (с методом method, если задан) получат ошибку status """
+        with self._cond:
+            self._injected.extend([(status, method, retry_after)] * count)
+
+    # --- доступ к объектам из тестов
+
+    def get_object(self, resource, namespace, name):
+        with self._cond:
+            obj = self._objects.get((resource, namespace or '', name))
+            return copy.deepcopy(obj)
+
+    def list_objects(self, resource, namespace=None):
+        with self._cond:
+            return [copy.deepcopy(obj) for (r, ns, __), obj in sorted(self._objects.items())
+                    if r == resource and (namespace is None or ns == namespace)]
+
+    # --- хранилище; все методы ниже вызываются под self._cond
+
+    def _emit(self, event_type, resource, obj):
+        metadata = obj['metadata']
+        self._history.append(_Event(int(metadata['resourceVersion']), resource, metadata.get('namespace', ''),
+                                    metadata['name'], dict(metadata.get('labels') or {}), event_type,
+                                    json.dumps(obj)))
+        if len(self._history) > 2 * self.history_size:
+            del self._history[:self.history_size]
+            self._history_start = self._history[0].rv
+        self._cond.notify_all()
+
+    def _index_owners(self, key, obj, add):
+        for owner in obj['metadata'].get('ownerReferences') or []:
+            if add:
+                self._dependents[owner.get('uid')].add(key)
+            else:
+                self._dependents[owner.get('uid')].discard(key)
+
+    def _put(self, resource, obj, event_type):
+        self._rv += 1
+        obj['metadata']['resourceVersion'] = str(self._rv)
+        metadata = obj['metadata']
+        key = (resource, metadata.get('namespace', ''), metadata['name'])
+        if key in self._objects:
+            self._index_owners(key, self._objects[key], False)
+        self._objects[key] = obj
+        self._index_owners(key, obj, True)
+        self._emit(event_type, resource, obj)
+        return obj
+
+    def _create(self, resource, namespace, obj):
+        metadata = obj.setdefault('metadata', {})
+        if not metadata.get('name'):
+            if not metadata.get('generateName'):
+                raise _ApiError(422, 'Invalid', 'metadata.name: Required value')
+            metadata['name'] = metadata['generateName'] + uuid.uuid4().hex[:5]
+        if namespace:
+            metadata['namespace'] = namespace
+        if (resource, namespace, metadata['name']) in self._objects:
+            raise _ApiError(409, 'AlreadyExists', '%s "%s" already exists' % (resource, metadata['name']))
+        metadata.update(uid=str(uuid.uuid4()), creationTimestamp=_now(), generation=1)
+        if resource == 'pods':
+            obj['status'] = {'phase': 'Pending', 'containerStatuses': self._container_statuses(
+                obj, {'waiting': {'reason': 'ContainerCreating'}}, False)}
+        obj.setdefault('status', {})
+        self._put(resource, obj, 'ADDED')
+        self._created(resource, obj)
+        return obj
+
+    def _update(self, resource, old, new):
+        """ Новая версия объекта; если ничего не изменилось, resourceVersion остается прежним """
+        spec_changed = new.get('spec') != old.get('spec')
+        # metadata нового объекта может быть тем же словарем, что у старого (merge без metadata)
+        new = dict(new, metadata=dict(new.get('metadata') or {}))
+        metadata = new['metadata']
+        for key in ('uid', 'creationTimestamp', 'namespace', 'name'):
+            if key in old['metadata']:
+                metadata[key] = old['metadata'][key]
+        metadata['generation'] = old['metadata'].get('generation', 1) + spec_changed
+        metadata['resourceVersion'] = old['metadata']['resourceVersion']
+        if new == old:
+            return old
+        self._put(resource, new, 'MODIFIED')
+        if spec_changed:
+            self._updated(resource, new)
+        return new
+
+    def _delete(self, resource, obj, propagation_policy=None):
+        metadata = obj['metadata']
+        key = (resource, metadata.get('namespace', ''), metadata['name'])
+        del self._objects[key]
+        self._index_owners(key, obj, False)
+        metadata['deletionTimestamp'] = _now()
+        self._rv += 1
+        metadata['resourceVersion'] = str(self._rv)
+        self._emit('DELETED', resource, obj)
+        if propagation_policy != 'Orphan':
+            # сборщик мусора: зависимые объекты уходят вместе с владельцем
+            for key in sorted(self._dependents.pop(metadata['uid'], ())):
+                # уже удален вместе с другим зависимым объектом
+                if key in self._objects:
+                    self._delete(key[0], self._objects[key])
+        self._deleted(resource, obj)
+
+    def _select(self, resource, namespace, label_selector=None, field_selector=None):
+        labels = parse_label_selector(label_selector)
+        fields = parse_field_selector(field_selector)
+        return [obj for (r, ns, __), obj in sorted(self._objects.items())
+                if r == resource and (not namespace or ns == namespace)
+                and match_labels(labels, obj['metadata'].get('labels')) and match_fields(fields, obj)]
+
+    def _owned(self, resource, uid):
+        """ Объекты resource, у которых в ownerReferences есть uid - без перебора всего хранилища """
+        return [self._objects[key] for key in sorted(self._dependents.get(uid, ())) if key[0] == resource]
+
+    # --- контроллеры
+
+    def _schedule(self, delay, function, *args):
+        heapq.heappush(self._timers, (time.monotonic() + delay, next(self._timer_seq), function, args))
+        self._cond.notify_all()
+
+    def _run_timers(self):
+        with self._cond:
+            while not self._stopped:
+                if not self._timers:
+                    self._cond.wait()
+                    continue
+                due, __, function, args = self._timers[0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._timers)
+                try:
+                    function(*args)
+                except Exception:
+                    # ошибка в заглушке контроллера не должна останавливать остальные
+                    traceback.print_exc()
+
+    def _created(self, resource, obj):
+        if resource == 'deployments':
+            self._schedule(0, self._sync_deployment, obj['metadata']['namespace'], obj['metadata']['name'])
+        elif resource == 'replicasets':
+            self._schedule(0, self._sync_replica_set, obj['metadata']['namespace'], obj['metadata']['name'])
+        elif resource == 'pods':
+            self._schedule(self.ready_delay, self._start_pod, obj['metadata']['namespace'], obj['metadata']['name'])
+
+    def _updated(self, resource, obj):
+        if resource in ('deployments', 'replicasets'):
+            self._created(resource, obj)
+
+    def _deleted(self, resource, obj):
+        if resource == 'pods':
+            for owner in obj['metadata'].get('ownerReferences') or []:
+                if owner.get('kind') == 'ReplicaSet':
+                    self._schedule(0, self._sync_replica_set, obj['metadata']['namespace'], owner['name'])
+
+    def _set_status(self, resource, obj, status):
+        if obj.get('status') != status:
+            self._put(resource, dict(obj, status=status), 'MODIFIED')
+
+    def _sync_deployment(self, namespace, name):
+        deployment = self._objects.get(('deployments', namespace, name))
+        if deployment is None:
+            return
+        spec = deployment.get('spec') or {}
+        template = spec.get('template') or {}
+        template_hash = hashlib.sha1(json.dumps(template, sort_keys=True).encode()).hexdigest()[:10]
+        uid = deployment['metadata']['uid']
+        replicas = _replicas(deployment)
+        new_name = '%s-%s' % (name, template_hash)
+        for replica_set in self._owned('replicasets', uid):
+            if replica_set['metadata']['name'] != new_name \
+                    and replica_set['spec'].get('replicas'):
+                # старые ReplicaSet - сразу в 0
+                self._update('replicasets', replica_set, merge(replica_set, {'spec': {'replicas': 0}}))
+
+        replica_set = self._objects.get(('replicasets', namespace, new_name))
+        if replica_set is None:
+            labels = dict((template.get('metadata') or {}).get('labels') or {}, **{'pod-template-hash': template_hash})
+            self._create('replicasets', namespace, {
+                'kind': 'ReplicaSet', 'apiVersion': 'apps/v1',
+                'metadata': {'name': new_name, 'labels': labels, 'ownerReferences': [
+                    {'apiVersion': 'apps/v1', 'kind': 'Deployment', 'name': name, 'uid': uid, 'controller': True}]},
+                'spec': {'replicas': replicas, 'selector': spec.get('selector'),
+                         'template': merge(template, {'metadata': {'labels': labels}})}})
+        elif replica_set['spec'].get('replicas') != replicas:
+            self._update('replicasets', replica_set, merge(replica_set, {'spec': {'replicas': replicas}}))
+        self._deployment_status(namespace, name)
+
+    def _sync_replica_set(self, namespace, name):
+        replica_set = self._objects.get(('replicasets', namespace, name))
+        if replica_set is None:
+            return
+        uid = replica_set['metadata']['uid']
+        pods = self._owned('pods', uid)
+        replicas = _replicas(replica_set)
+        for pod in pods[replicas:]:
+            self._delete('pods', pod)
+        template = replica_set['spec'].get('template') or {}
+        for __ in range(replicas - len(pods)):
+            self._create('pods', namespace, {
+                'kind': 'Pod', 'apiVersion': 'v1',
+                'metadata': {'name': '%s-%s' % (name, uuid.uuid4().hex[:5]),
+                             'labels': dict((template.get('metadata') or {}).get('labels') or {}),
+                             'ownerReferences': [{'apiVersion': 'apps/v1', 'kind': 'ReplicaSet', 'name': name,
+                                                  'uid': uid, 'controller': True}]},
+                'spec': copy.deepcopy(template.get('spec') or {})})
+        self._replica_set_status(namespace, name)
+
+    def _replica_set_status(self, namespace, name):
+        replica_set = self._objects.get(('replicasets', namespace, name))
+        if replica_set is None:
+            return
+        pods = self._owned('pods', replica_set['metadata']['uid'])
+        ready = sum(1 for pod in pods if pod['status'].get('phase') == 'Running')
+        self._set_status('replicasets', replica_set, {
+            'replicas': len(pods), 'readyReplicas': ready, 'availableReplicas': ready,
+            'observedGeneration': replica_set['metadata']['generation']})
+        for owner in replica_set['metadata'].get('ownerReferences') or []:
+            if owner.get('kind') == 'Deployment':
+                self._deployment_status(namespace, owner['name'])
+
+    def _deployment_status(self, namespace, name):
+        deployment = self._objects.get(('deployments', namespace, name))
+        if deployment is None:
+            return
+        replica_sets = self._owned('replicasets', deployment['metadata']['uid'])
+        replicas = _replicas(deployment)
+        ready = sum(rs['status'].get('readyReplicas') or 0 for rs in replica_sets)
+        available = ready >= replicas
+        self._set_status('deployments', deployment, {
+            'observedGeneration': deployment['metadata']['generation'],
+            'replicas': sum(rs['status'].get('replicas') or 0 for rs in replica_sets),
+            'updatedReplicas': replicas, 'readyReplicas': ready, 'availableReplicas': ready,
+            'conditions': [{'type': 'Available', 'status': 'True' if available else 'False'},
+                           {'type': 'Progressing', 'status': 'True',
+                            'reason': 'NewReplicaSetAvailable' if available else 'ReplicaSetUpdated'}]})
+
+    def _container_statuses(self, pod, state, ready):
+        return [{'name': container.get('name'), 'ready': ready, 'restartCount': 0, 'image': container.get('image'),
+                 'lastState': {},
+                 'containerID': 'fake://%s/%s' % (pod['metadata']['uid'], container.get('name')), 'state': state}
+                for container in (pod.get('spec') or {}).get('containers') or []]
+
+    def _start_pod(self, namespace, name):
+        pod = self._objects.get(('pods', namespace, name))
+        if pod is None:
+            return
+        state = {'running': {'startedAt': _now()}}
+        self._set_status('pods', pod, {'phase': 'Running', 'podIP': '10.0.0.1', 'startTime': _now(),
+                                       'conditions': [{'type': 'Ready', 'status': 'True'}],
+                                       'containerStatuses': self._container_statuses(pod, state, True)})
+        owners = pod['metadata'].get('ownerReferences') or []
+        for owner in owners:
+            if owner.get('kind') == 'ReplicaSet':
+                self._replica_set_status(namespace, owner['name'])
+        if not owners and (pod.get('spec') or {}).get('restartPolicy') in ('Never', 'OnFailure'):
+            self._schedule(self.ready_delay, self._complete_pod, namespace, name)
+
+    def _complete_pod(self, namespace, name):
+        pod = self._objects.get(('pods', namespace, name))
+        if pod is None:
+            return
+        started_at = pod['status'].get('startTime') or _now()
+        state = {'terminated': {'exitCode': 0, 'reason': 'Completed', 'startedAt': started_at,
+                                'finishedAt': _now()}}
+        self._set_status('pods', pod, {'phase': 'Succeeded', 'startTime': started_at,
+                                       'conditions': [{'type': 'Ready', 'status': 'False'}],
+                                       'containerStatuses': self._container_statuses(pod, state, False)})
+
+    # --- разбор запроса
+
+    def resolve(self, path):
+        """
+        (ApiResource или None, namespace, name, subresource) по пути запроса;
+        для discovery - (None, ответ, None, None)
+
+        """
+        parts = [part for part in path.split('/') if part]
+        if parts == ['api']:
+            return None, {'kind': 'APIVersions', 'versions': ['v1']}, None, None
+        if parts == ['apis']:
+            return None, self._api_groups(), None, None
+        if parts[:1] == ['api'] and len(parts) >= 2:
+            group, version, rest = '', parts[1], parts[2:]
+        elif parts[:1] == ['apis'] and len(parts) >= 3:
+            group, version, rest = parts[1], parts[2], parts[3:]
+        else:
+            raise _ApiError(404, 'NotFound', 'the server could not find the requested resource')
+        if not rest:
+            return None, self._resource_list(group, version), None, None
+
+        namespace = ''
+        if rest[0] == 'namespaces' and len(rest) >= 3 and rest[2] not in ('status', 'finalize'):
+            namespace, rest = rest[1], rest[2:]
+        resource = self.resources.get((group, rest[0]))
+        if resource is None:
+            raise _ApiError(404, 'NotFound', 'the server could not find the requested resource')
+        name = rest[1] if len(rest) > 1 else None
+        subresource = rest[2] if len(rest) > 2 else None
+        return resource, namespace, name, subresource
+
+    def _api_groups(self):
+        groups = sorted({resource.group for resource in self.resources.values() if resource.group})
+        result = []
+        for group in groups:
+            group_version = '%s/%s' % (group, GROUP_VERSIONS.get(group, 'v1'))
+            version = {'groupVersion': group_version, 'version': GROUP_VERSIONS.get(group, 'v1')}
+            result.append({'name': group, 'versions': [version], 'preferredVersion': version})
+        return {'kind': 'APIGroupList', 'apiVersion': 'v1', 'groups': result}
+
+    def _resource_list(self, group, version):
+        group_version = '%s/%s' % (group, version) if group else version
+        resources = [{'name': resource.name, 'kind': resource.kind, 'namespaced': resource.namespaced,
+                      'shortNames': resource.shortnames, 'verbs': sorted(resource.verbs)}
+                     for (resource_group, __), resource in sorted(self.resources.items()) if resource_group == group]
+        if not resources:
+            raise _ApiError(404, 'NotFound', 'the server could not find the requested resource')
+        return {'kind': 'APIResourceList', 'apiVersion': 'v1', 'groupVersion': group_version, 'resources': resources}
+
+    def before_request(self, method):
+        """ Задержка и ошибки, заданные для теста; _ApiError - ответить ошибкой """
+        if self.latency:
+            time.sleep(self.latency)
+        with self._cond:
+            for i, (status, error_method, retry_after) in enumerate(self._injected):
+                if error_method is None or error_method == method:
+                    del self._injected[i]
+                    break
+            else:
+                if not self.error_rate or self._random.random() >= self.error_rate:
+                    return
+                status, retry_after = self.error_status, None
+        headers = {'Retry-After': str(retry_after)} if retry_after is not None else {}
+        raise _ApiError(status, 'TooManyRequests' if status == 429 else 'InternalError',
+                        'injected error', headers)
+
+    def count(self, verb):
+        with self._cond:
+            self.request_count += 1
+            self.request_counts[verb] += 1
+
+    # --- операции API; возвращают (код, объект)
+
+    def get(self, resource, namespace, name):
+        with self._cond:
+            obj = self._objects.get((resource.name, namespace, name))
+            if obj is None:
+                raise _ApiError(404, 'NotFound', '%s "%s" not found' % (resource.name, name))
+            return 200, obj
+
+    def list(self, resource, namespace, query):
+        with self._cond:
+            items = self._select(resource.name, namespace, query.get('labelSelector'), query.get('fieldSelector'))
+            metadata = {'resourceVersion': str(self._rv)}
+            start = 0
+            if query.get('continue'):
+                try:
+                    token = json.loads(base64.b64decode(query['continue']))
+                    start = token['start']
+                    metadata['resourceVersion'] = token['rv']
+                except (ValueError, KeyError, TypeError):
+                    raise _ApiError(400, 'BadRequest', 'invalid continue token')
+            limit = int(query.get('limit') or 0)
+            if limit and start + limit < len(items):
+                metadata['continue'] = base64.b64encode(json.dumps(
+                    {'start': start + limit, 'rv': metadata['resourceVersion']}).encode()).decode()
+                items = items[start:start + limit]
+            else:
+                items = items[start:]
+            items = [{key: value for key, value in item.items() if key not in ('kind', 'apiVersion')}
+                     for item in items]
+            return 200, {'kind': resource.kind + 'List', 'apiVersion': 'v1', 'metadata': metadata, 'items': items}
+
+    def create(self, resource, namespace, body):
+        with self._cond:
+            return 201, self._create(resource.name, namespace, body)
+
+    def replace(self, resource, namespace, name, body, subresource=None):
+        with self._cond:
+            __, old = self.get(resource, namespace, name)
+            expected = (body.get('metadata') or {}).get('resourceVersion')
+            if expected and expected != old['metadata']['resourceVersion']:
+                raise _ApiError(409, 'Conflict', 'the object has been modified')
+            if subresource == 'status':
+                body = dict(old, status=body.get('status') or {})
+            else:
+                # status меняется только через подресурс
+                body = dict(body, status=old.get('status'))
+            return 200, self._update(resource.name, old, body)
+
+    def patch(self, resource, namespace, name, body, content_type, query):
+        with self._cond:
+            old = self._objects.get((resource.name, namespace, name))
+            if content_type == 'application/apply-patch+yaml':
+                return self._apply(resource, namespace, name, old, body, query.get('fieldManager'))
+            if content_type == 'application/json-patch+json':
+                raise _ApiError(415, 'UnsupportedMediaType', 'json patch is not supported by the fake server')
+            if old is None:
+                raise _ApiError(404, 'NotFound', '%s "%s" not found' % (resource.name, name))
+            return 200, self._update(resource.name, old, merge(old, body))
+
+    def _apply(self, resource, namespace, name, old, body, field_manager):
+        managed = [{'manager': field_manager or 'unknown', 'operation': 'Apply',
+                    'apiVersion': body.get('apiVersion'), 'time': _now()}]
+        if old is None:
+            body.setdefault('metadata', {}).update(name=name, managedFields=managed)
+            return 201, self._create(resource.name, namespace, body)
+        new = merge(old, body)
+        new['metadata']['managedFields'] = old['metadata'].get('managedFields')
+        if new == old:
+            return 200, old
+        new['metadata']['managedFields'] = managed
+        return 200, self._update(resource.name, old, new)
+
+    def delete(self, resource, namespace, name, body, query):
+        propagation_policy = (body or {}).get('propagationPolicy') or query.get('propagationPolicy')
+        with self._cond:
+            __, obj = self.get(resource, namespace, name)
+            self._delete(resource.name, obj, propagation_policy)
+            return 200, obj
+
+    def delete_collection(self, resource, namespace, body, query):
+        if 'deletecollection' not in resource.verbs:
+            raise _ApiError(405, 'MethodNotAllowed', 'the server does not allow this method on the requested resource')
+        propagation_policy = (body or {}).get('propagationPolicy') or query.get('propagationPolicy')
+        with self._cond:
+            items = self._select(resource.name, namespace, query.get('labelSelector'), query.get('fieldSelector'))
+            for obj in items:
+                if (resource.name, namespace or obj['metadata'].get('namespace', ''),
+                        obj['metadata']['name']) in self._objects:
+                    self._delete(resource.name, obj, propagation_policy)
+            return 200, {'kind': resource.kind + 'List', 'apiVersion': 'v1', 'metadata': {}, 'items': items}
+
+    def pod_log(self, namespace, name, query):
+        with self._cond:
+            if ('pods', namespace, name) not in self._objects:
+                raise _ApiError(404, 'NotFound', 'pods "%s" not found' % name)
+        log = self.pod_logs.get(name, DEFAULT_POD_LOG).encode('utf-8')
+        if query.get('limitBytes'):
+            log = log[:int(query['limitBytes'])]
+        return log
+
+    def watch(self, resource, namespace, query, send):
+        """ Отправляет события send(строка) до timeoutSeconds или остановки сервера """
+        labels = parse_label_selector(query.get('labelSelector'))
+        fields = parse_field_selector(query.get('fieldSelector'))
+        timeout = min(int(query.get('timeoutSeconds') or WATCH_TIMEOUT_MAX), WATCH_TIMEOUT_MAX)
+        deadline = time.monotonic() + timeout
+
+        def matches(event):
+            return event.resource == resource.name and (not namespace or event.namespace == namespace) \
+                and match_labels(labels, event.labels) \
+                and match_fields(fields, {'metadata': {'name': event.name, 'namespace': event.namespace}})
+
+        resource_version = query.get('resourceVersion')
+        with self._cond:
+            if resource_version in (None, '', '0'):
+                lines = [json.dumps({'type': 'ADDED', 'object': obj})
+                         for obj in self._select(resource.name, namespace, query.get('labelSelector'),
+                                                 query.get('fieldSelector'))]
+                last = self._rv
+            else:
+                lines = []
+                last = int(resource_version)
+        for line in lines:
+            send(line)
+
+        while 1:
+            with self._cond:
+                if last + 1 < self._history_start:
+                    expired = _ApiError(410, 'Expired', 'too old resource version: %s' % last)
+                    send(json.dumps({'type': 'ERROR', 'object': expired.status()}))
+                    return
+                events = self._history[last + 1 - self._history_start:]
+                if not events:
+                    remaining = deadline - time.monotonic()
+                    if self._stopped or remaining <= 0:
+                        return
+                    self._cond.wait(min(remaining, 1))
+                    continue
+                last = events[-1].rv
+            for event in events:
+                if matches(event):
+                    send('{"type": "%s", "object": %s}' % (event.type, event.text))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # заголовки и тело уходят отдельными write: без TCP_NODELAY каждый ответ ждет delayed ACK клиента
+    disable_nagle_algorithm = True
+    api_server = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        with self.api_server._cond:
+            self.api_server.connection_count += 1
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_PATCH(self):
+        self._handle('PATCH')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return None
+        text = self.rfile.read(length).decode('utf-8')
+        try:
+            # YAML - надмножество JSON (server-side apply принимает и то, и другое)
+            return yaml.safe_load(text) if 'yaml' in (self.headers.get('Content-Type') or '') else json.loads(text)
+        except ValueError:
+            raise _ApiError(400, 'BadRequest', 'invalid request body')
+
+    def _send(self, code, data, content_type='application/json', headers=None):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_json(self, code, doc, headers=None):
+        self._send(code, json.dumps(doc).encode('utf-8'), headers=headers)
+
+    def _handle(self, method):
+        server = self.api_server
+        url = urlsplit(self.path)
+        query = dict(parse_qsl(url.query))
+        try:
+            # тело читаем всегда: иначе следующий запрос в keep-alive соединении прочитается неверно
+            body = self._read_body()
+            resource, namespace, name, subresource = server.resolve(url.path)
+            if resource is None:
+                server.count('discovery')
+                self._send_json(200, namespace)
+                return
+            verb = self._verb(method, name, subresource, query)
+            server.count(verb)
+            server.before_request(method)
+            if verb == 'watch':
+                self._watch(resource, namespace, query)
+                return
+            if verb == 'log':
+                self._send(200, server.pod_log(namespace, name, query), 'text/plain')
+                return
+            code, doc = self._call(verb, resource, namespace, name, subresource, body, query)
+            with server._cond:
+                data = json.dumps(doc).encode('utf-8')
+            self._send(code, data)
+        except _ApiError as e:
+            self._send_json(e.code, e.status(), e.headers)
+
+    @staticmethod
+    def _verb(method, name, subresource, query):
+        if method == 'GET':
+            if subresource == 'log':
+                return 'log'
+            if name is None:
+                return 'watch' if query.get('watch') in ('1', 'true') else 'list'
+            return 'get'
+        if method == 'DELETE' and name is None:
+            return 'deletecollection'
+        return {'POST': 'create', 'PUT': 'update', 'PATCH': 'patch', 'DELETE': 'delete'}[method]
+
+    def _call(self, verb, resource, namespace, name, subresource, body, query):
+        server = self.api_server
+        if verb == 'get':
+            return server.get(resource, namespace, name)
+        if verb == 'list':
+            return server.list(resource, namespace, query)
+        if body is None and verb in ('create', 'update', 'patch'):
+            raise _ApiError(400, 'BadRequest', 'request body is required')
+        if verb == 'create':
+            return server.create(resource, namespace, body)
+        if verb == 'update':
+            return server.replace(resource, namespace, name, body, subresource)
+        if verb == 'patch':
+            content_type = (self.headers.get('Content-Type') or '').split(';')[0].strip()
+            return server.patch(resource, namespace, name, body, content_type, query)
+        if verb == 'delete':
+            return server.delete(resource, namespace, name, body, query)
+        return server.delete_collection(resource, namespace, body, query)
+
+    def _watch(self, resource, namespace, query):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def send(line):
+            data = (line + '\n').encode('utf-8')
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+            self.wfile.flush()
+
+        try:
+            self.api_server.watch(resource, namespace, query, send)
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            # клиент закрыл watch
+            self.close_connection = True
@@ -0,0 +1,137 @@
+import random
+import threading
+import time
+from collections import deque
+
+DEFAULT_QPS = 50
+DEFAULT_BURST = 100
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.2
+BACKOFF_MAX = 10
+# больше этого Retry-After не ждем
+RETRY_AFTER_MAX = 60
+
+# очереди в порядке приоритета: запись не ждет, пока пройдут чтения из циклов ожидания
+LANES = ('write', 'read')
+WRITE_METHODS = {'POST', 'PUT', 'PATCH', 'DELETE'}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def lane_for(method):
+    return 'write' if method.upper() in WRITE_METHODS else 'read'
+
+
+def parse_retry_after(value):
+    """ Retry-After в секундах; дату (вторая форма заголовка) не разбираем """
+    try:
+        return min(max(float(value), 0), RETRY_AFTER_MAX)
+    except (TypeError, ValueError):
+        return None
+
+
+class LaneStats(object):
+    def __init__(self):
+        self.requests = 0
+        self.queued = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.retries = 0
+
+    def record(self, waited):
+        self.requests += 1
+        if waited > 0.001:
+            self.queued += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+
+    def as_dict(self):
+        return {'requests': self.requests, 'queued': self.queued, 'wait_total': round(self.wait_total, 3),
+                'wait_max': round(self.wait_max, 3), 'retries': self.retries}
+
+
+class FlowControl(object):
+    """
+    Ограничение запросов к одному API серверу на стороне клиента.
+
+    Token bucket: в среднем не больше qps запросов в секунду, пачкой - до burst (qps=0 - без ограничения).
+    Ждущие токена запросы стоят в очередях LANES: следующий токен получает первый запрос из самой
+    приоритетной непустой очереди. retry_delay() решает, повторять ли запрос после 429/5xx или обрыва
+    соединения и через сколько.
+
+    """
+    def __init__(self, qps=DEFAULT_QPS, burst=DEFAULT_BURST, max_retries=MAX_RETRIES):
+        self.qps = qps
+        self.burst = max(burst or 0, 1)
+        self.max_retries = max_retries
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+        self._waiting = {lane: deque() for lane in LANES}
+        self.stats = {lane: LaneStats() for lane in LANES}
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.qps)
+        self._updated = now
+
+    def _next_ticket(self):
+        for lane in LANES:
+            if self._waiting[lane]:
+                return self._waiting[lane][0]
+        return None
+
+    def acquire(self, method):
+        """ Ждет своей очереди на запрос; возвращает время ожидания в секундах """
+        lane = lane_for(method)
+        start = time.monotonic()
+        with self._cond:
+            if self.qps:
+                ticket = object()
+                self._waiting[lane].append(ticket)
+                try:
+                    while 1:
+                        self._refill()
+                        if self._tokens >= 1 and self._next_ticket() is ticket:
+                            self._tokens -= 1
+                            break
+                        # до следующего токена, или пока очередь не сдвинется
+                        self._cond.wait((1 - self._tokens) / self.qps if self._tokens < 1 else None)
+                finally:
+                    self._waiting[lane].remove(ticket)
+                    self._cond.notify_all()
+            waited = time.monotonic() - start
+            self.stats[lane].record(waited)
+        return waited
+
+    def retry_delay(self, method, attempt, status=None, retry_after=None):
+        """
+        Через сколько секунд повторить запрос, или None - не повторять.
+        status=None - ответа нет (ошибка соединения). 429 значит, что сервер запрос не выполнял,
+        его повторяем для любого метода; 5xx и обрыв соединения - только для идемпотентных
+
+        """
+        method = method.upper()
+        if attempt >= self.max_retries:
+            return None
+        if status is not None and status not in RETRY_STATUSES:
+            return None
+        if status != 429 and method not in IDEMPOTENT_METHODS:
+            return None
+        # exponential backoff с full jitter, но не раньше, чем просит сервер
+        delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+        server_delay = parse_retry_after(retry_after)
+        if server_delay is not None:
+            delay = max(delay, server_delay)
+        with self._cond:
+            self.stats[lane_for(method)].retries += 1
+        return delay
+
+    def as_dict(self):
+        with self._cond:
+            return {lane: stats.as_dict() for lane, stats in self.stats.items()}
+
+    def __str__(self):
+        return ', '.join('%s: %s requests, %s queued, wait %.2f s (max %.3f s), %s retries'
+                         % (lane, s['requests'], s['queued'], s['wait_total'], s['wait_max'], s['retries'])
+                         for lane, s in self.as_dict().items())
@@ -0,0 +1,222 @@
+"""
+Informer - локальная копия объектов по одному LIST и WATCH.
+
+Инфраструктура на будущее: ни kube_lite, ни kube_deploy его пока не используют (kube_deploy
+работает через свой backend, а ожидания в kube_lite.wait следят за одним объектом). Из модуля
+в работе только разбор и проверка селекторов меток - ими пользуется kube_lite.fake_apiserver.
+
+"""
+import re
+import threading
+import time
+from collections import defaultdict
+
+from kube_lite.log import DEBUG
+from kube_lite.watch import Watch
+
+RESTART_DELAY = 1
+
+_REQUIREMENT_RE = re.compile(r'''
+    \s*(?P<not>!)?\s*(?P<key>[\w./-]+)\s*
+    (?:
+        (?P<op>==|=|!=)\s*(?P<value>[\w.-]*)
+      | (?P<set_op>in|notin)\s*\((?P<values>[^)]*)\)
+    )?\s*(?:,|$)
+''', re.VERBOSE)
+
+
+def parse_label_selector(selector):
+    """
+    'app=web,tier!=db,env in (a,b),!canary' -> [(key, op, values)],
+    op - один из '=', '!=', 'in', 'notin', 'exists', '!exists'
+
+    """
+    requirements = []
+    pos = 0
+    selector = (selector or '').strip()
+    while pos < len(selector):
+        m = _REQUIREMENT_RE.match(selector, pos)
+        if not m or m.end() == pos:
+            raise ValueError('invalid label selector: %r' % selector)
+        pos = m.end()
+        if m.group('op'):
+            op = '!=' if m.group('op') == '!=' else '='
+            requirements.append((m.group('key'), op, {m.group('value')}))
+        elif m.group('set_op'):
+            values = {value.strip() for value in m.group('values').split(',') if value.strip()}
+            requirements.append((m.group('key'), m.group('set_op'), values))
+        else:
+            requirements.append((m.group('key'), '!exists' if m.group('not') else 'exists', None))
+    return requirements
+
+
+def match_labels(requirements, labels):
+    labels = dict(labels.items()) if labels else {}
+    for key, op, values in requirements:
+        if op in ('=', 'in'):
+            if labels.get(key) not in values:
+                return False
+        elif op in ('!=', 'notin'):
+            if key in labels and labels[key] in values:
+                return False
+        elif op == 'exists':
+            if key not in labels:
+                return False
+        elif key in labels:
+            return False
+    return True
+
+
+class Informer:
+    """
+    Локальная копия всех объектов одного kind в namespace: один LIST, затем один WATCH,
+    сколько бы потребителей ни читали объекты.
+
+    Объекты индексируются по (namespace, имя) - informer может смотреть и на все namespace -
+    и по парам метка=значение; get() и list() отвечают из памяти. Подписчики subscribe() получают (тип события, объект) из потока informer'а,
+    поэтому обработчик не должен надолго блокироваться.
+
+    """
+    def __init__(self, kind, namespace=None, api=None):
+        self.kind = kind
+        self.namespace = namespace
+        self.watch = Watch(kind, namespace=namespace, api=api)
+        self._objects = {}
+        self._label_index = defaultdict(set)
+        self._handlers = []
+        self._changed = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def start(self):
+        """ Первый LIST выполняется в вызывающем потоке: после start() хранилище уже заполнено """
+        with self._changed:
+            if self._thread is not None:
+                return self
+            self._dispatch(self.watch.list())
+            self._thread = threading.Thread(target=self._run, name='informer-%s' % self.kind, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """
+        Обрывает watch и ждет завершения потока (не дольше timeout). Поток - daemon:
+        informer, который забыли остановить, не мешает выходу из процесса
+
+        """
+        self._stopped = True
+        self.watch.stop()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def _run(self):
+        while not self._stopped:
+            try:
+                for event in self.watch.stream():
+                    if self._stopped:
+                        return
+                    self._dispatch([event])
+            except Exception as e:
+                if self._stopped:
+                    return
+                DEBUG('informer %s: %s, restarting' % (self.kind, e))
+                time.sleep(RESTART_DELAY)
+
+    def _index(self, key, obj, add):
+        for item in (obj.metadata.labels or {}).items():
+            keys = self._label_index[item]
+            if add:
+                keys.add(key)
+            else:
+                keys.discard(key)
+                if not keys:
+                    del self._label_index[item]
+
+    def _dispatch(self, events):
+        with self._changed:
+            for event_type, obj in events:
+                key = (obj.metadata.namespace, obj.metadata.name)
+                old = self._objects.pop(key, None)
+                if old is not None:
+                    self._index(key, old, add=False)
+                if event_type != 'DELETED':
+                    self._objects[key] = obj
+                    self._index(key, obj, add=True)
+            handlers = list(self._handlers)
+            self._changed.notify_all()
+        for event_type, obj in events:
+            for handler in handlers:
+                try:
+                    handler(event_type, obj)
+                except Exception as e:
+                    DEBUG('informer %s: handler %r failed: %s' % (self.kind, handler, e))
+
+    def subscribe(self, handler, replay=True):
+        """ handler(тип события, объект); replay - сразу получить ADDED по уже известным объектам """
+        with self._changed:
+            self._handlers.append(handler)
+            existing = list(self._objects.values()) if replay else []
+        for obj in existing:
+            handler('ADDED', obj)
+        return handler
+
+    def unsubscribe(self, handler):
+        with self._changed:
+            if handler in self._handlers:
+                self._handlers.remove(handler)
+
+    def get(self, name, namespace=None):
+        """ namespace по умолчанию - namespace informer'а; для informer по всем namespace его нужно задать """
+        with self._changed:
+            return self._objects.get((namespace or self.namespace, name))
+
+    def list(self, label_selector=None):
+        requirements = parse_label_selector(label_selector)
+        with self._changed:
+            # кандидаты - пересечение индексов по условиям равенства, остальные условия проверяем у каждого
+            candidates = None
+            for label, op, values in requirements:
+                if op == '=':
+                    keys = self._label_index.get((label, next(iter(values))), set())
+                    candidates = keys if candidates is None else candidates & keys
+            if candidates is None:
+                candidates = self._objects.keys()
+            return [self._objects[key] for key in sorted(candidates)
+                    if match_labels(requirements, self._objects[key].metadata.labels)]
+
+    def wait_for(self, predicate, timeout=None):
+        """ Ждет, пока predicate(informer) не станет истинным; возвращает его значение или None по таймауту """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._changed:
+            while 1:
+                result = predicate(self)
+                if result:
+                    return result
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._changed.wait(remaining)
+
+
+_informers = {}
+_informers_lock = threading.Lock()
+
+
+def informer(kind, namespace=None, api=None):
+    """ Общий для всего процесса запущенный Informer для kind в namespace """
+    key = (kind.lower(), namespace, api)
+    with _informers_lock:
+        shared = _informers.get(key)
+        if shared is None:
+            shared = _informers[key] = Informer(kind, namespace, api)
+    return shared.start()
+
+
+def stop_informers(timeout=None):
+    """ Останавливает все общие Informer и ждет их потоков """
+    with _informers_lock:
+        stopped = list(_informers.values())
+        _informers.clear()
+    for shared in stopped:
+        shared.stop(timeout)
@@ -0,0 +1,94 @@
+import atexit
+import base64
+import os
+import tempfile
+from urllib.parse import urlparse
+
+import yaml
+
+DEFAULT_KUBECONFIG = os.path.expanduser('~/.kube/config')
+
+
+class KubeConfigError(Exception):
+    pass
+
+
+class KubeConfig(object):
+    """
+    Параметры подключения из текущего (или заданного) контекста kubeconfig.
+    Поддерживаются токен и клиентский сертификат; exec/auth-provider плагины - нет
+
+    """
+    def __init__(self, host, port, token=None, ca_cert_path=None, client_cert=None, namespace=None, scheme='https'):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.token = token
+        self.ca_cert_path = ca_cert_path
+        self.client_cert = client_cert
+        self.namespace = namespace
+
+
+def _named(items, name, what):
+    for item in items or []:
+        if item['name'] == name:
+            return item[what]
+    raise KubeConfigError('kubeconfig: %s %r not found' % (what, name))
+
+
+def _data_file(data):
+    # *-data в kubeconfig - base64; ssl хочет путь к файлу
+    fd, path = tempfile.mkstemp(prefix='kube_lite-', suffix='.pem')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(base64.standard_b64decode(data))
+    atexit.register(os.unlink, path)
+    return path
+
+
+def _file(section, key, base_dir):
+    if section.get(key + '-data'):
+        return _data_file(section[key + '-data'])
+    if section.get(key):
+        return os.path.join(base_dir, os.path.expanduser(section[key]))
+    return None
+
+
+def load_kubeconfig(path=None, context=None):
+    if path is None:
+        path = (os.environ.get('KUBECONFIG') or DEFAULT_KUBECONFIG).split(os.pathsep)[0]
+    try:
+        with open(path) as f:
+            config = yaml.safe_load(f) or {}
+    except OSError as e:
+        raise KubeConfigError('Kubernetes configuration not found: %s' % e)
+
+    base_dir = os.path.dirname(os.path.abspath(path))
+    context = _named(config.get('contexts'), context or config.get('current-context'), 'context')
+    cluster = _named(config.get('clusters'), context['cluster'], 'cluster')
+    user = _named(config.get('users'), context.get('user'), 'user') if context.get('user') else {}
+    if user.get('exec') or user.get('auth-provider'):
+        raise KubeConfigError('kubeconfig: exec and auth-provider credentials are not supported')
+
+    server = urlparse(cluster['server'])
+    token = user.get('token')
+    if not token and user.get('tokenFile'):
+        with open(os.path.join(base_dir, user['tokenFile'])) as f:
+            token = f.read().strip()
+
+    ca_cert_path = None
+    if not cluster.get('insecure-skip-tls-verify'):
+        ca_cert_path = _file(cluster, 'certificate-authority', base_dir)
+    client_cert = None
+    cert_file = _file(user, 'client-certificate', base_dir)
+    if cert_file:
+        client_cert = (cert_file, _file(user, 'client-key', base_dir))
+
+    # http - только для локальных заглушек API (kube_lite.fake_apiserver)
+    scheme = server.scheme or 'https'
+    return KubeConfig(host=server.hostname,
+                      port=server.port or (80 if scheme == 'http' else 443),
+                      scheme=scheme,
+                      token='Bearer ' + token if token else None,
+                      ca_cert_path=ca_cert_path,
+                      client_cert=client_cert,
+                      namespace=context.get('namespace'))
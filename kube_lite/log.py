@@ -1,3 +1,4 @@
+import codecs
 import logging
 import sys
 from kube_lite.options import Options
@@ -37,7 +38,44 @@ def indent_multiline(msg, prepend='#     '):
         parts.append(prepend + line)
     return '\n'.join(parts)
 
-def print_container_log(log, pod_name, container_name):
+LOG_LINE_LIMIT = 64 * 1024
+
+
+def iter_log_lines(chunks, line_limit=LOG_LINE_LIMIT):
+    """
+    Разбивает поток байтовых кусков на строки по мере поступления.
+    Строка длиннее line_limit отдается частями, так что в памяти не копится больше одного куска
+    и одной строки
+
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    buffer = ''
+    for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split('\n')
+        yield from lines
+        while len(buffer) > line_limit:
+            yield buffer[:line_limit]
+            buffer = buffer[line_limit:]
+    buffer += decoder.decode(b'', final=True)
+    if buffer:
+        yield buffer
+
+
+def print_container_log(log, pod_name, container_name, spool_file=None, prepend='#     '):
+    """
+    log - весь лог строкой или итератор строк (например, из stream_log);
+    итератор печатается построчно по мере поступления и дублируется в spool_file
+
+    """
     CONSOLE('# ---------- %s/%s' % (pod_name, container_name))
-    CONSOLE(indent_multiline(log.rstrip()))
+    if isinstance(log, str):
+        if spool_file is not None:
+            spool_file.write(log)
+        CONSOLE(indent_multiline(log.rstrip(), prepend))
+    else:
+        for line in log:
+            if spool_file is not None:
+                spool_file.write(line + '\n')
+            CONSOLE(prepend + line.rstrip())
     CONSOLE('# ---------- end')
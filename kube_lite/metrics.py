@@ -0,0 +1,143 @@
+"""
+Метрики запросов к API: число, латентность (гистограмма) и байты по verb, kind и коду ответа.
+
+Сбор включается enable() в текущем контексте (contextvars): потоки, которым передана копия
+контекста, пишут в тот же Metrics, остальные - никуда. Выключенный сбор стоит одного
+ContextVar.get() на запрос.
+
+"""
+import contextvars
+import json
+import os
+import threading
+
+# верхние границы корзин гистограммы латентности, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_current = contextvars.ContextVar('metrics', default=None)
+
+
+def current():
+    """ Metrics текущего контекста или None, если сбор выключен """
+    return _current.get()
+
+
+def enable():
+    """ Включает сбор в текущем контексте; возвращает Metrics, в который он пойдет """
+    metrics = _current.get()
+    if metrics is None:
+        metrics = Metrics()
+        _current.set(metrics)
+    return metrics
+
+
+def resource_of(path):
+    """
+    Ресурс по пути запроса: /api/v1/namespaces/test/pods/web/log?follow=1 -> pods/log,
+    /apis/apps/v1/namespaces/test/deployments -> deployments, /api/v1/namespaces/test -> namespaces
+
+    """
+    parts = path.split('?', 1)[0].strip('/').split('/')
+    if parts[0] == 'api':
+        parts = parts[2:]
+    elif parts[0] == 'apis':
+        parts = parts[3:]
+    if parts[:1] == ['namespaces'] and len(parts) > 2:
+        parts = parts[2:]
+    if not parts or not parts[0]:
+        return ''
+    if len(parts) > 2:
+        return '%s/%s' % (parts[0], parts[2])
+    return parts[0]
+
+
+class _Series(object):
+    __slots__ = ('count', 'seconds', 'buckets', 'bytes_in', 'bytes_out')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def as_dict(self):
+        return {'count': self.count, 'seconds': round(self.seconds, 6),
+                'buckets': dict(zip([str(le) for le in LATENCY_BUCKETS], self.buckets)),
+                'bytes_in': self.bytes_in, 'bytes_out': self.bytes_out}
+
+
+class Metrics(object):
+    """
+    Серии по семействам: 'kube_api_request' - HTTP-запросы (каждая попытка отдельно),
+    другие семейства заводит вызывающий код (например, операции над ресурсами в kube_deploy)
+
+    """
+    HELP = {'kube_api_request': 'Kubernetes API HTTP requests'}
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # {семейство: {(verb, kind, code): _Series}}
+        self.families = {}
+
+    def observe(self, family, verb, kind, code, seconds, bytes_in=0, bytes_out=0):
+        key = (verb, kind, str(code))
+        with self._lock:
+            series = self.families.setdefault(family, {}).get(key)
+            if series is None:
+                series = self.families[family][key] = _Series()
+            series.count += 1
+            series.seconds += seconds
+            for i, le in enumerate(LATENCY_BUCKETS):
+                if seconds <= le:
+                    series.buckets[i] += 1
+                    break
+            series.bytes_in += bytes_in
+            series.bytes_out += bytes_out
+
+    def observe_request(self, method, path, code, seconds, bytes_in=0, bytes_out=0):
+        self.observe('kube_api_request', method.upper(), resource_of(path), code, seconds, bytes_in, bytes_out)
+
+    def as_dict(self):
+        with self._lock:
+            return {family: [dict(series.as_dict(), verb=verb, kind=kind, code=code)
+                             for (verb, kind, code), series in sorted(all_series.items())]
+                    for family, all_series in sorted(self.families.items())}
+
+    def to_prometheus(self):
+        """ Текстовый формат Prometheus (для node_exporter textfile collector) """
+        lines = []
+        for family, all_series in self.as_dict().items():
+            name = family + '_duration_seconds'
+            lines.append('# HELP %s %s' % (name, self.HELP.get(family, family.replace('_', ' '))))
+            lines.append('# TYPE %s histogram' % name)
+            for series in all_series:
+                labels = 'verb="%s",kind="%s",code="%s"' % (series['verb'], series['kind'], series['code'])
+                cumulative = 0
+                for le, count in series['buckets'].items():
+                    cumulative += count
+                    lines.append('%s_bucket{%s,le="%s"} %s' % (name, labels, le, cumulative))
+                lines.append('%s_bucket{%s,le="+Inf"} %s' % (name, labels, series['count']))
+                lines.append('%s_sum{%s} %s' % (name, labels, series['seconds']))
+                lines.append('%s_count{%s} %s' % (name, labels, series['count']))
+            for direction in ('in', 'out'):
+                if not any(series['bytes_' + direction] for series in all_series):
+                    continue
+                counter = '%s_bytes_%s_total' % (family, direction)
+                lines.append('# TYPE %s counter' % counter)
+                for series in all_series:
+                    lines.append('%s{verb="%s",kind="%s",code="%s"} %s' % (
+                        counter, series['verb'], series['kind'], series['code'], series['bytes_' + direction]))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """ Пишет метрики в файл: *.json - JSON, иначе текстовый формат Prometheus """
+        if path.endswith('.json'):
+            text = json.dumps(self.as_dict(), indent=2) + '\n'
+        else:
+            text = self.to_prometheus()
+        # textfile collector не должен увидеть файл недописанным
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
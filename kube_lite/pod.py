@@ -1,8 +1,9 @@
-import time
 from kube_lite.direct_api import KubernetesApi, NotFoundError
 from kube_lite.log import DEBUG, CONSOLE, indent_multiline
 from kube_lite.options import Options
 from kube_lite.resource import Reference
+from kube_lite.wait import ObjectDeletedError, WaitTimeoutError
+from kube_lite.watch import Watch
 
 
 def _print_state(pod_name, c_status, state_name, state, seen_messages):
@@ -42,14 +43,16 @@ class PodReference(Reference):
     kind = 'pod'
 
     def wait(self, container_name, expected_state='terminated', timeout=None):
-        start_t = time.time()
         if timeout is None:
             timeout = Options.wait
 
         seen_messages = set()
         CONSOLE('#### Waiting for container %s/%s' % (self.name, container_name))
-        while 1:
-            pod_doc = KubernetesApi.get('pod', self.name, namespace=self.namespace)
+        watch = Watch('pod', namespace=self.namespace, name=self.name)
+        for event_type, pod_doc in watch.stream(timeout=timeout):
+            if event_type == 'DELETED':
+                # состояние контейнера уже не изменится
+                raise ObjectDeletedError(self.kind, self.name)
             print_status(pod_doc, seen_messages)
             for cs in pod_doc.status.containerStatuses or []:
                 if cs.name == container_name:
@@ -58,10 +61,14 @@ class PodReference(Reference):
                     if container_state:
                         return container_state
 
-            if time.time() >= start_t + timeout:
-                from kube_deploy.controller import WaitTimeoutError
-                raise WaitTimeoutError(self.name)
-            time.sleep(1)
+        raise WaitTimeoutError(self.name)
+
+    async def wait_async(self, container_name, expected_state='terminated', timeout=None):
+        from kube_lite.aio import wait_for_container
+        return await wait_for_container(self.name, self.namespace, container_name, expected_state, timeout)
 
     def read_log(self, container_name, **params):
         return KubernetesApi.read_pod_log(self.name, namespace=self.namespace, container=container_name, **params)
+
+    def stream_log(self, container_name, **params):
+        return KubernetesApi.stream_pod_log(self.name, namespace=self.namespace, container=container_name, **params)
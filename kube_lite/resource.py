@@ -22,6 +22,10 @@ class Reference:
     def wait_until_deleted(self, timeout: int = None):
         wait_until_deleted('pod', self.name, namespace=self.namespace, timeout=timeout or Options.wait)
 
+    async def wait_until_deleted_async(self, timeout: int = None):
+        from kube_lite.aio import wait_until_deleted as wait_until_deleted_async
+        await wait_until_deleted_async('pod', self.name, namespace=self.namespace, timeout=timeout or Options.wait)
+
     def read(self):
         doc = KubernetesApi.get(self.kind, self.name, namespace=self.namespace)
         return Document(doc)
@@ -0,0 +1,18 @@
+import pytest
+from kube_lite import api_resources
+from kube_lite.direct_api import KubernetesApi
+from kube_lite.fake_apiserver import FakeApiServer
+from kube_lite.flowcontrol import FlowControl
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.setattr(api_resources, 'CACHE_DIR', str(tmp_path / 'discovery'))
+    for name in ('API_SCHEME', 'API_HOST', 'API_PORT', 'TOKEN', 'CA_CERT_PATH', 'CLIENT_CERT'):
+        monkeypatch.setattr(KubernetesApi, name, getattr(KubernetesApi, name))
+    monkeypatch.setattr(KubernetesApi, 'flow_control', FlowControl(qps=0))
+    with FakeApiServer(ready_delay=0.01, history_size=50) as fake:
+        KubernetesApi.init_from_kubeconfig(path=fake.write_kubeconfig(str(tmp_path / 'kubeconfig')))
+        yield fake
+    KubernetesApi.reset_session()
+    api_resources.KINDS.invalidate()
@@ -0,0 +1,106 @@
+import asyncio
+import json
+
+import pytest
+from kube_lite.aio import AsyncKubernetesApi, AsyncWatch, _query, wait_for_container, wait_until_deleted
+from kube_lite.direct_api import KubernetesApi
+from kube_lite.document import Document
+from kube_lite.wait import WaitTimeoutError
+
+NAMESPACE = 'test'
+
+
+def _config_map(name, **labels):
+    return Document({'kind': 'ConfigMap', 'apiVersion': 'v1',
+                     'metadata': {'name': name, 'namespace': NAMESPACE, 'labels': labels}, 'data': {'key': name}})
+
+
+def _job_pod(name):
+    return Document({'kind': 'Pod', 'apiVersion': 'v1', 'metadata': {'name': name, 'namespace': NAMESPACE},
+                     'spec': {'restartPolicy': 'Never', 'containers': [{'name': 'job', 'image': 'job:1'}]}})
+
+
+def _run(coroutine):
+    async def run_and_close():
+        try:
+            return await coroutine
+        finally:
+            await AsyncKubernetesApi.close()
+    return asyncio.run(run_and_close())
+
+
+def test_query_params():
+    assert _query({'watch': 1, 'follow': True, 'previous': False, 'container': None}) == \
+        {'watch': 1, 'follow': 'true', 'previous': 'false'}
+
+
+def test_create_and_paged_list(server):
+    async def scenario():
+        await asyncio.gather(*[AsyncKubernetesApi.create(_config_map('cm-%02d' % i, app='web'))
+                               for i in range(50)])
+        names = [item['metadata']['name'] async for item in AsyncKubernetesApi.iter_list(
+            'configmap', namespace=NAMESPACE, params={'labelSelector': 'app=web'}, page_size=20)]
+        doc = await AsyncKubernetesApi.get('configmap', 'cm-07', namespace=NAMESPACE)
+        return names, doc
+
+    names, doc = _run(scenario())
+    assert names == ['cm-%02d' % i for i in range(50)]
+    assert server.request_counts['create'] == 50 and server.request_counts['list'] == 3
+    assert doc.data.key == 'cm-07'
+
+
+def test_watch_sees_new_objects(server):
+    KubernetesApi.create(_config_map('a'))
+
+    async def scenario():
+        watch = AsyncKubernetesApi.watch('configmap', namespace=NAMESPACE)
+        initial = [event async for event in watch.stream(timeout=0.1)]
+        await AsyncKubernetesApi.create(_config_map('b'))
+        added = [event async for event in watch.stream(timeout=0.5)]
+        return initial, added
+
+    initial, added = _run(scenario())
+    assert [(event_type, obj.metadata.name) for event_type, obj in initial] == [('ADDED', 'a')]
+    assert [(event_type, obj.metadata.name) for event_type, obj in added] == [('ADDED', 'b')]
+
+
+def test_pod_wait_log_and_delete(server):
+    server.pod_logs['job'] = 'line 1\nline 2\n'
+
+    async def scenario():
+        await AsyncKubernetesApi.create(_job_pod('job'))
+        running = await wait_for_container('job', NAMESPACE, 'job', expected_state='running', timeout=5)
+        lines = [line async for line in AsyncKubernetesApi.stream_pod_log('job', NAMESPACE, container='job')]
+        terminated = await wait_for_container('job', NAMESPACE, 'job', timeout=5)
+        await AsyncKubernetesApi.delete('pod', 'job', namespace=NAMESPACE)
+        await wait_until_deleted('pod', 'job', NAMESPACE, timeout=5)
+        return running, lines, terminated
+
+    running, lines, terminated = _run(scenario())
+    assert running.startedAt
+    assert lines == ['line 1', 'line 2']
+    assert terminated.exitCode == 0
+    assert server.get_object('pods', NAMESPACE, 'job') is None
+
+
+def test_wait_for_container_timeout(server):
+    KubernetesApi.call('POST', 'namespaces/test/pods', data=json.dumps(
+        {'kind': 'Pod', 'metadata': {'name': 'web'}, 'spec': {'containers': [{'name': 'web', 'image': 'web:1'}]}}))
+    with pytest.raises(WaitTimeoutError):
+        # контейнер без restartPolicy Never не завершается
+        _run(wait_for_container('web', NAMESPACE, 'web', timeout=0.5))
+
+
+def test_async_watch_relists_after_expired_version(server):
+    async def scenario():
+        await AsyncKubernetesApi.create(_config_map('a'))
+        watch = AsyncWatch('configmap', namespace=NAMESPACE)
+        await watch.list()
+        # история сервера - 50 событий
+        for i in range(120):
+            await AsyncKubernetesApi.create(_config_map('c-%s' % i))
+        return [event async for event in watch.stream(timeout=0.5)]
+
+    events = _run(scenario())
+    assert len([event_type for event_type, __ in events if event_type == 'ADDED']) == 120
+    assert server.request_counts['list'] == 2
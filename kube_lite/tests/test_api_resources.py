@@ -0,0 +1,24 @@
+from kube_lite.api_resources import ResourceInfo, group_version, index_kinds, parse_resource_list
+
+
+def test_parse_resource_list_skips_subresources():
+    resource_list = {'groupVersion': 'apps/v1',
+                     'resources': [{'name': 'deployments', 'kind': 'Deployment', 'namespaced': True,
+                                    'shortNames': ['deploy']},
+                                   {'name': 'deployments/scale', 'kind': 'Scale', 'namespaced': True}]}
+    assert list(parse_resource_list(resource_list)) == [
+        ResourceInfo('deployments', 'Deployment', ['deploy'], 'apps', True, 'v1')]
+
+
+def test_core_group_version():
+    ri, = parse_resource_list({'groupVersion': 'v1',
+                               'resources': [{'name': 'pods', 'kind': 'Pod', 'namespaced': True}]})
+    assert ri.apigroup == ''
+    assert group_version(ri) == 'v1'
+
+
+def test_first_group_wins():
+    kinds = index_kinds([ResourceInfo('events', 'Event', ['ev'], '', True, 'v1'),
+                         ResourceInfo('events', 'Event', ['ev'], 'events.k8s.io', True, 'v1')])
+    assert group_version(kinds['event']) == 'v1'
+    assert group_version(ResourceInfo('deployments', 'Deployment', [], 'apps', True)) is None
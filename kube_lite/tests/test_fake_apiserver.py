@@ -0,0 +1,100 @@
+import json
+import time
+
+import pytest
+from kube_lite.direct_api import KubernetesApi, NotFoundError
+from kube_lite.document import Document
+from kube_lite.informer import Informer
+from kube_lite.watch import Watch
+
+NAMESPACE = 'test'
+
+
+def _config_map(name, **labels):
+    return Document({'kind': 'ConfigMap', 'apiVersion': 'v1',
+                     'metadata': {'name': name, 'namespace': NAMESPACE, 'labels': labels}, 'data': {'key': name}})
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def test_crud_and_paginated_list(server):
+    for i in range(5):
+        KubernetesApi.create(_config_map('cm-%s' % i, app='web' if i % 2 else 'db'))
+    assert KubernetesApi.get('configmap', 'cm-1', namespace=NAMESPACE).data.key == 'cm-1'
+
+    names = [item['metadata']['name'] for item in KubernetesApi.iter_list(
+        'configmap', namespace=NAMESPACE, params={'labelSelector': 'app=web'}, page_size=1)]
+    assert names == ['cm-1', 'cm-3']
+    assert server.request_counts['list'] == 2
+
+    KubernetesApi.delete('configmap', 'cm-1', namespace=NAMESPACE)
+    with pytest.raises(NotFoundError):
+        KubernetesApi.get('configmap', 'cm-1', namespace=NAMESPACE)
+
+
+def test_deployment_becomes_ready(server):
+    template = {'metadata': {'labels': {'app': 'web'}}, 'spec': {'containers': [{'name': 'web', 'image': 'web:1'}]}}
+    KubernetesApi.call('POST', 'namespaces/test/deployments', api='apps/v1', data=json.dumps(
+        {'kind': 'Deployment', 'metadata': {'name': 'web'}, 'spec': {'replicas': 2, 'template': template}}))
+
+    _wait_for(lambda: (server.get_object('deployments', NAMESPACE, 'web')['status'].get('readyReplicas') == 2))
+    [replica_set] = server.list_objects('replicasets', NAMESPACE)
+    assert replica_set['metadata']['ownerReferences'][0]['name'] == 'web'
+    pods = server.list_objects('pods', NAMESPACE)
+    assert [pod['status']['phase'] for pod in pods] == ['Running', 'Running']
+
+    # удаление Deployment уносит ReplicaSet и поды
+    KubernetesApi.call('DELETE', 'namespaces/test/deployments/web', api='apps/v1')
+    assert server.list_objects('replicasets') == server.list_objects('pods') == []
+
+
+def test_watch_and_expired_resource_version(server):
+    watch = Watch('configmap', namespace=NAMESPACE)
+    assert list(watch.stream(timeout=0.1)) == []
+    KubernetesApi.create(_config_map('a'))
+    events = list(watch.stream(timeout=1))
+    assert [(event_type, obj.metadata.name) for event_type, obj in events] == [('ADDED', 'a')]
+
+    # история сервера - 50 событий: старая resourceVersion устаревает, watch делает LIST заново
+    for i in range(120):
+        KubernetesApi.create(_config_map('b-%s' % i))
+    events = list(watch.stream(timeout=1))
+    assert len([event_type for event_type, __ in events if event_type == 'ADDED']) == 120
+    assert server.request_counts['list'] == 2
+
+
+def test_informer_stop_closes_quiet_watch(server):
+    KubernetesApi.create(_config_map('cm-1', app='web'))
+    informer = Informer('configmap', namespace=NAMESPACE).start()
+    assert informer.get('cm-1') is not None
+    _wait_for(lambda: server.request_counts['watch'])
+
+    start = time.time()
+    informer.stop(timeout=5)
+    assert not informer._thread.is_alive()
+    assert time.time() - start < 1
+
+
+def test_injected_errors_are_retried(server):
+    KubernetesApi.create(_config_map('a'))
+    server.inject_error(503, method='GET')
+    assert KubernetesApi.get('configmap', 'a', namespace=NAMESPACE).metadata.name == 'a'
+    assert server.request_counts['get'] == 2
+
+    server.inject_error(503, method='POST')
+    with pytest.raises(Exception):
+        KubernetesApi.create(_config_map('b'))
+
+
+def test_pod_log(server):
+    server.pod_logs['job'] = 'line 1\nline 2\n'
+    KubernetesApi.call('POST', 'namespaces/test/pods', data=json.dumps(
+        {'kind': 'Pod', 'metadata': {'name': 'job'},
+         'spec': {'restartPolicy': 'Never', 'containers': [{'name': 'job', 'image': 'job:1'}]}}))
+    assert KubernetesApi.read_pod_log('job', NAMESPACE, container='job') == 'line 1\nline 2\n'
+    _wait_for(lambda: server.get_object('pods', NAMESPACE, 'job')['status']['phase'] == 'Succeeded')
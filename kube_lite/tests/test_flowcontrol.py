@@ -0,0 +1,63 @@
+import threading
+import time
+
+from kube_lite.flowcontrol import FlowControl, parse_retry_after
+
+
+def test_retry_delay_rules():
+    flow = FlowControl(max_retries=2)
+    # 429 - сервер запрос не выполнял, повторяем и POST
+    assert flow.retry_delay('POST', 0, 429) is not None
+    assert flow.retry_delay('POST', 0, 503) is None
+    assert flow.retry_delay('POST', 0) is None
+    assert flow.retry_delay('GET', 0, 503) is not None
+    assert flow.retry_delay('GET', 0) is not None
+    assert flow.retry_delay('GET', 0, 404) is None
+    assert flow.retry_delay('GET', 2, 429) is None
+    assert flow.stats['write'].retries == 1
+    assert flow.stats['read'].retries == 2
+
+
+def test_retry_after_is_honored():
+    flow = FlowControl()
+    assert flow.retry_delay('PATCH', 0, 429, '3') >= 3
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') is None
+    assert parse_retry_after('100000') == 60
+
+
+def test_writes_overtake_queued_reads():
+    flow = FlowControl(qps=20, burst=1)
+    flow.acquire('GET')
+    order = []
+
+    def request(method):
+        flow.acquire(method)
+        order.append(method)
+
+    readers = [threading.Thread(target=request, args=('GET',)) for __ in range(3)]
+    for thread in readers:
+        thread.start()
+    # читатели уже ждут токена, когда приходит запись
+    time.sleep(0.01)
+    writer = threading.Thread(target=request, args=('POST',))
+    writer.start()
+    for thread in readers + [writer]:
+        thread.join()
+    assert order[0] == 'POST'
+    assert flow.stats['read'].queued == 3
+
+
+def test_unlimited_does_not_wait():
+    flow = FlowControl(qps=0)
+    for __ in range(1000):
+        flow.acquire('GET')
+    assert flow.stats['read'].requests == 1000
+    assert flow.stats['read'].queued == 0
+
+
+def test_kubernetes_api_default_does_not_throttle_or_retry():
+    from kube_lite.direct_api import KubernetesApi
+    flow = KubernetesApi.flow_control
+    assert flow.qps == 0
+    assert flow.retry_delay('POST', 0, 429) is None
+    assert flow.retry_delay('GET', 0, 503) is None
@@ -0,0 +1,69 @@
+import pytest
+from kube_lite.document import Document
+from kube_lite.informer import Informer, parse_label_selector, match_labels
+
+
+def _pod(name, rv, namespace='test', **labels):
+    return Document({'kind': 'Pod', 'metadata': {'name': name, 'namespace': namespace, 'resourceVersion': rv,
+                                                 'labels': labels}})
+
+
+def _informer(*pods):
+    informer = Informer('pod', namespace='test')
+    informer._dispatch([('ADDED', pod) for pod in pods])
+    return informer
+
+
+def test_parse_label_selector():
+    assert parse_label_selector('app=web,tier!=db,env in (a, b),!canary,track') == [
+        ('app', '=', {'web'}), ('tier', '!=', {'db'}), ('env', 'in', {'a', 'b'}),
+        ('canary', '!exists', None), ('track', 'exists', None)]
+    assert parse_label_selector(None) == []
+    with pytest.raises(ValueError):
+        parse_label_selector('app=web,,')
+
+
+def test_match_labels():
+    requirements = parse_label_selector('app=web,env notin (prod),!canary')
+    assert match_labels(requirements, {'app': 'web', 'env': 'dev'})
+    assert not match_labels(requirements, {'app': 'web', 'env': 'prod'})
+    assert not match_labels(requirements, {'app': 'web', 'canary': 'true'})
+
+
+def test_list_by_selector_and_get():
+    informer = _informer(_pod('a', '1', app='web', version='1'), _pod('b', '2', app='web', version='2'),
+                         _pod('c', '3', app='db'))
+    assert [pod.metadata.name for pod in informer.list('app=web')] == ['a', 'b']
+    assert [pod.metadata.name for pod in informer.list('app=web,version!=1')] == ['b']
+    assert [pod.metadata.name for pod in informer.list()] == ['a', 'b', 'c']
+    assert informer.get('c').metadata.resourceVersion == '3'
+    assert informer.get('x') is None
+
+
+def test_all_namespaces_keeps_same_names_apart():
+    informer = Informer('pod')
+    informer._dispatch([('ADDED', _pod('web', '1', namespace='a', app='web')),
+                        ('ADDED', _pod('web', '2', namespace='b', app='web'))])
+    assert [pod.metadata.namespace for pod in informer.list('app=web')] == ['a', 'b']
+    assert informer.get('web', namespace='b').metadata.resourceVersion == '2'
+
+    informer._dispatch([('DELETED', _pod('web', '3', namespace='a', app='web'))])
+    assert [pod.metadata.namespace for pod in informer.list('app=web')] == ['b']
+    assert informer.get('web', namespace='a') is None
+
+
+def test_events_update_index_and_subscribers():
+    informer = _informer(_pod('a', '1', app='web'))
+    events = []
+    informer.subscribe(lambda event_type, obj: events.append((event_type, obj.metadata.name)))
+
+    informer._dispatch([('MODIFIED', _pod('a', '2', app='db')), ('DELETED', _pod('a', '3', app='db'))])
+    assert events == [('ADDED', 'a'), ('MODIFIED', 'a'), ('DELETED', 'a')]
+    assert informer.list('app=web') == [] and informer.list('app=db') == []
+    assert not informer._label_index
+
+
+def test_wait_for_timeout():
+    informer = _informer(_pod('a', '1'))
+    assert informer.wait_for(lambda i: i.get('a'), timeout=0).metadata.name == 'a'
+    assert informer.wait_for(lambda i: i.get('b'), timeout=0.01) is None
@@ -0,0 +1,54 @@
+import base64
+
+import pytest
+import yaml
+from kube_lite.kubeconfig import KubeConfigError, load_kubeconfig
+
+
+def _write(tmp_path, user, cluster=None, current_context='main'):
+    config = {'apiVersion': 'v1', 'kind': 'Config', 'current-context': current_context,
+              'clusters': [{'name': 'main', 'cluster': dict({'server': 'https://k8s.local:6443'}, **(cluster or {}))}],
+              'contexts': [{'name': 'main', 'context': {'cluster': 'main', 'user': 'admin', 'namespace': 'prod'}}],
+              'users': [{'name': 'admin', 'user': user}]}
+    path = tmp_path / 'config'
+    path.write_text(yaml.safe_dump(config))
+    return str(path)
+
+
+def test_token(tmp_path):
+    config = load_kubeconfig(_write(tmp_path, {'token': 'secret'}))
+    assert (config.scheme, config.host, config.port) == ('https', 'k8s.local', 6443)
+    assert config.token == 'Bearer secret'
+    assert config.namespace == 'prod'
+    assert config.client_cert is None
+
+
+def test_token_file(tmp_path):
+    (tmp_path / 'token').write_text('from-file\n')
+    config = load_kubeconfig(_write(tmp_path, {'tokenFile': 'token'}))
+    assert config.token == 'Bearer from-file'
+
+
+def test_data_certificates(tmp_path):
+    def data(text):
+        return base64.standard_b64encode(text.encode()).decode()
+
+    config = load_kubeconfig(_write(tmp_path, {'client-certificate-data': data('CERT'), 'client-key-data': data('KEY')},
+                                    cluster={'certificate-authority-data': data('CA')}))
+    with open(config.ca_cert_path) as f:
+        assert f.read() == 'CA'
+    cert_path, key_path = config.client_cert
+    with open(cert_path) as cert, open(key_path) as key:
+        assert (cert.read(), key.read()) == ('CERT', 'KEY')
+
+
+def test_missing_context(tmp_path):
+    path = _write(tmp_path, {'token': 'secret'})
+    with pytest.raises(KubeConfigError, match="'other' not found"):
+        load_kubeconfig(path, context='other')
+
+
+def test_exec_credentials_are_rejected(tmp_path):
+    path = _write(tmp_path, {'exec': {'apiVersion': 'client.authentication.k8s.io/v1', 'command': 'aws'}})
+    with pytest.raises(KubeConfigError, match='not supported'):
+        load_kubeconfig(path)
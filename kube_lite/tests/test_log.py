@@ -0,0 +1,29 @@
+import io
+
+from kube_lite import log
+from kube_lite.log import iter_log_lines, print_container_log
+
+
+def test_iter_log_lines_splits_across_chunks():
+    chunks = [b'first li', b'ne\nsecond\nthi', b'rd']
+    assert list(iter_log_lines(chunks)) == ['first line', 'second', 'third']
+
+
+def test_iter_log_lines_multibyte_split():
+    data = 'строка\n'.encode()
+    chunks = [data[:3], data[3:]]
+    assert list(iter_log_lines(chunks)) == ['строка']
+
+
+def test_iter_log_lines_long_line_is_bounded():
+    lines = list(iter_log_lines([b'x' * 25, b'y' * 10 + b'\n'], line_limit=10))
+    assert lines == ['x' * 10, 'x' * 10, 'x' * 5 + 'y' * 10]
+
+
+def test_print_container_log_spools_stream(monkeypatch):
+    console = io.StringIO()
+    spool = io.StringIO()
+    monkeypatch.setattr(log, 'CONSOLE_FILE', console)
+    print_container_log(iter(['a', 'b']), 'pod', 'main', spool_file=spool)
+    assert spool.getvalue() == 'a\nb\n'
+    assert console.getvalue() == '# ---------- pod/main\n#     a\n#     b\n# ---------- end\n'
@@ -0,0 +1,48 @@
+import contextvars
+import json
+
+from kube_lite import metrics
+from kube_lite.metrics import Metrics, resource_of
+
+
+def test_resource_of():
+    assert resource_of('/api/v1/namespaces/test/pods/web/log?follow=true') == 'pods/log'
+    assert resource_of('/apis/apps/v1/namespaces/test/deployments') == 'deployments'
+    assert resource_of('/apis/apps/v1/namespaces/test/replicasets/web/status') == 'replicasets/status'
+    assert resource_of('/api/v1/namespaces/test') == 'namespaces'
+    assert resource_of('/api/v1/nodes') == 'nodes'
+    assert resource_of('/api') == ''
+
+
+def test_enable_is_per_context():
+    def run():
+        collector = metrics.enable()
+        assert metrics.enable() is collector
+        return collector
+
+    assert contextvars.copy_context().run(run) is not None
+    assert metrics.current() is None
+
+
+def test_export(tmp_path):
+    collector = Metrics()
+    collector.observe_request('get', '/api/v1/namespaces/test/pods', 200, 0.02, bytes_in=100)
+    collector.observe_request('GET', '/api/v1/namespaces/test/pods', 200, 3)
+    collector.observe('super_apply_resource_operation', 'create', 'Pod', 'ok', 0.5)
+
+    collector.write(str(tmp_path / 'metrics.json'))
+    data = json.loads((tmp_path / 'metrics.json').read_text())
+    [pods] = data['kube_api_request']
+    assert (pods['verb'], pods['kind'], pods['code'], pods['count'], pods['bytes_in']) == ('GET', 'pods', '200', 2, 100)
+    assert pods['buckets']['0.025'] == 1 and pods['buckets']['5'] == 1
+
+    collector.write(str(tmp_path / 'metrics.prom'))
+    text = (tmp_path / 'metrics.prom').read_text()
+    labels = 'verb="GET",kind="pods",code="200"'
+    assert 'kube_api_request_duration_seconds_bucket{%s,le="0.025"} 1' % labels in text
+    assert 'kube_api_request_duration_seconds_bucket{%s,le="5"} 2' % labels in text
+    assert 'kube_api_request_duration_seconds_count{%s} 2' % labels in text
+    assert 'kube_api_request_bytes_in_total{%s} 100' % labels in text
+    # у операций над ресурсами байтов нет - нет и счетчиков
+    assert 'super_apply_resource_operation_bytes_in_total' not in text
+    assert 'super_apply_resource_operation_duration_seconds_count{verb="create",kind="Pod",code="ok"} 1' in text
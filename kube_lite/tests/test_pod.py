@@ -0,0 +1,57 @@
+import asyncio
+import threading
+
+import pytest
+from kube_lite.aio import AsyncKubernetesApi
+from kube_lite.direct_api import KubernetesApi
+from kube_lite.document import Document
+from kube_lite.pod import PodReference
+from kube_lite.wait import ObjectDeletedError, WaitTimeoutError
+
+NAMESPACE = 'test'
+
+
+def _pod(name, restart_policy):
+    return Document({'kind': 'Pod', 'apiVersion': 'v1', 'metadata': {'name': name, 'namespace': NAMESPACE},
+                     'spec': {'restartPolicy': restart_policy, 'containers': [{'name': name, 'image': 'app:1'}]}})
+
+
+def test_wait_for_terminated_container(server):
+    KubernetesApi.create(_pod('job', 'Never'))
+    state = PodReference('job', NAMESPACE).wait('job', timeout=5)
+    assert state.exitCode == 0
+
+
+def test_wait_fails_when_pod_is_deleted(server):
+    KubernetesApi.create(_pod('web', 'Always'))
+    # контейнер без restartPolicy Never не завершается; Pod удаляют, пока его ждут
+    deleter = threading.Timer(0.2, KubernetesApi.delete, ('pod', 'web'), {'namespace': NAMESPACE})
+    deleter.start()
+    try:
+        with pytest.raises(ObjectDeletedError):
+            PodReference('web', NAMESPACE).wait('web', timeout=5)
+    finally:
+        deleter.join()
+
+
+def test_sync_and_async_waits_raise_the_same_errors(server):
+    KubernetesApi.create(_pod('web', 'Always'))
+    pod = PodReference('web', NAMESPACE)
+    with pytest.raises(WaitTimeoutError):
+        pod.wait('web', timeout=0.5)
+
+    async def wait_async():
+        try:
+            return await pod.wait_async('web', timeout=0.5)
+        finally:
+            await AsyncKubernetesApi.close()
+    with pytest.raises(WaitTimeoutError):
+        asyncio.run(wait_async())
+
+    deleter = threading.Timer(0.2, KubernetesApi.delete, ('pod', 'web'), {'namespace': NAMESPACE})
+    deleter.start()
+    try:
+        with pytest.raises(ObjectDeletedError):
+            asyncio.run(wait_async())
+    finally:
+        deleter.join()
@@ -0,0 +1,36 @@
+import contextvars
+import json
+import threading
+
+from kube_lite import trace
+
+
+def test_span_is_noop_when_disabled():
+    with trace.span('nothing'):
+        pass
+    assert trace.current() is None
+
+
+def test_spans_from_threads_with_copied_context(tmp_path):
+    def run():
+        tracer = trace.enable()
+        with trace.span('deploy', target='test'):
+            worker = threading.Thread(target=contextvars.copy_context().run, args=(request,), name='apply-0')
+            worker.start()
+            worker.join()
+        return tracer
+
+    def request():
+        with trace.api_span('get', '/api/v1/namespaces/test/pods?limit=500'):
+            pass
+
+    tracer = contextvars.copy_context().run(run)
+    tracer.write(str(tmp_path / 'trace.json'))
+    events = json.loads((tmp_path / 'trace.json').read_text())['traceEvents']
+
+    [deploy] = [event for event in events if event['name'] == 'deploy']
+    [get] = [event for event in events if event['name'] == 'GET pods']
+    assert deploy['args'] == {'target': 'test'} and get['cat'] == 'api'
+    assert deploy['ts'] <= get['ts'] and get['ts'] + get['dur'] <= deploy['ts'] + deploy['dur']
+    assert {'name': 'thread_name', 'ph': 'M', 'pid': get['pid'], 'tid': get['tid'],
+            'args': {'name': 'apply-0'}} in events
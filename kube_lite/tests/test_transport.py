@@ -0,0 +1,27 @@
+import ssl
+from kube_lite.direct_api import KubernetesApi
+from kube_lite.transport import TransportStats, build_ssl_context
+
+
+def test_ssl_context_without_ca():
+    context = build_ssl_context()
+    assert context.verify_mode == ssl.CERT_NONE
+    assert not context.check_hostname
+
+
+def test_stats():
+    stats = TransportStats()
+    stats.inc('requests', 5)
+    stats.inc('connections_opened')
+    assert stats.connections_reused == 4
+    assert 'connections_reused=4' in str(stats)
+
+
+def test_sequential_calls_reuse_one_connection(server):
+    stats = KubernetesApi.stats
+    requests_before = stats.requests
+    for __ in range(20):
+        KubernetesApi.call('GET', 'namespaces/test/configmaps')
+    assert stats.requests - requests_before == 20
+    # один keep-alive на все запросы, включая discovery
+    assert server.connection_count == 1
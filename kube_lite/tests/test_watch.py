@@ -0,0 +1,38 @@
+import pytest
+from kube_lite.document import Document
+from kube_lite.watch import Watch, ResourceExpired
+
+
+def _pod(name, rv):
+    return {'kind': 'Pod', 'metadata': {'name': name, 'resourceVersion': rv}}
+
+
+def _list(rv, *items):
+    return Document({'metadata': {'resourceVersion': rv}, 'items': list(items)})
+
+
+def test_field_selector():
+    watch = Watch('pod', namespace='test', name='pod1', field_selector='status.phase=Running')
+    assert watch.params() == {'fieldSelector': 'status.phase=Running,metadata.name=pod1'}
+
+
+def test_relist_emits_difference():
+    watch = Watch('pod', namespace='test')
+    events = watch.sync(_list('10', _pod('a', '1'), _pod('b', '2')))
+    assert [(t, o.metadata.name) for t, o in events] == [('ADDED', 'a'), ('ADDED', 'b')]
+
+    events = watch.sync(_list('20', _pod('a', '1'), _pod('c', '3')))
+    assert [(t, o.metadata.name) for t, o in events] == [('ADDED', 'c'), ('DELETED', 'b')]
+    assert watch.resource_version == '20'
+
+
+def test_handle_events():
+    watch = Watch('pod', namespace='test')
+    assert watch.handle({'type': 'ADDED', 'object': _pod('a', '5')})[0] == 'ADDED'
+    assert watch.handle({'type': 'BOOKMARK', 'object': {'metadata': {'resourceVersion': '7'}}}) is None
+    assert watch.resource_version == '7'
+    assert watch.handle({'type': 'DELETED', 'object': _pod('a', '8')})[0] == 'DELETED'
+    assert not watch.objects
+
+    with pytest.raises(ResourceExpired):
+        watch.handle({'type': 'ERROR', 'object': {'kind': 'Status', 'code': 410, 'message': 'too old'}})
@@ -0,0 +1,86 @@
+"""
+Временная шкала выполнения в формате Chrome trace events (chrome://tracing, Perfetto).
+
+Интервалы (span) пишутся как события "X" с потоком в tid: вложенность на шкале определяется
+временем, поэтому запросы к API видны внутри фаз, которые их выполнили. Как и kube_lite.metrics,
+запись включается enable() в текущем контексте; выключенная стоит одного ContextVar.get().
+
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from .metrics import resource_of
+
+_current = contextvars.ContextVar('trace', default=None)
+_NO_SPAN = nullcontext()
+
+
+def current():
+    """ Tracer текущего контекста или None, если запись выключена """
+    return _current.get()
+
+
+def enable():
+    tracer = _current.get()
+    if tracer is None:
+        tracer = Tracer()
+        _current.set(tracer)
+    return tracer
+
+
+def span(name, cat='phase', **args):
+    """ with span('read_docs'): ... - интервал в Tracer текущего контекста, если он есть """
+    tracer = _current.get()
+    if tracer is None:
+        return _NO_SPAN
+    return tracer.span(name, cat, **args)
+
+
+def api_span(method, path):
+    """ Интервал запроса к API: 'GET pods', путь с параметрами - в args """
+    tracer = _current.get()
+    if tracer is None:
+        return _NO_SPAN
+    return tracer.span('%s %s' % (method.upper(), resource_of(path)), 'api', path=path)
+
+
+class Tracer(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._threads = {}
+        self.pid = os.getpid()
+        self.events = []
+
+    def add(self, name, start, end, cat='phase', args=None):
+        """ Интервал [start, end] по time.perf_counter() в текущем потоке; ts на шкале - тоже perf_counter """
+        thread = threading.current_thread()
+        event = {'name': name, 'cat': cat, 'ph': 'X', 'pid': self.pid, 'tid': thread.ident,
+                 'ts': round(start * 1e6, 1), 'dur': round((end - start) * 1e6, 1)}
+        if args:
+            event['args'] = args
+        with self._lock:
+            self.events.append(event)
+            self._threads.setdefault(thread.ident, thread.name)
+
+    @contextmanager
+    def span(self, name, cat='phase', **args):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.perf_counter(), cat, args)
+
+    def as_dict(self):
+        with self._lock:
+            names = [{'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid, 'args': {'name': name}}
+                     for tid, name in self._threads.items()]
+            return {'traceEvents': names + sorted(self.events, key=lambda event: event['ts']),
+                    'displayTimeUnit': 'ms'}
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f)
@@ -0,0 +1,101 @@
+import ssl
+import threading
+import weakref
+
+from requests.adapters import HTTPAdapter
+
+
+class TransportStats(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections_opened = 0
+        self.tls_sessions_reused = 0
+
+    def inc(self, name, value=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    @property
+    def connections_reused(self):
+        return max(self.requests - self.connections_opened, 0)
+
+    def as_dict(self):
+        return {'requests': self.requests,
+                'connections_opened': self.connections_opened,
+                'connections_reused': self.connections_reused,
+                'tls_sessions_reused': self.tls_sessions_reused}
+
+    def __str__(self):
+        return ' '.join('%s=%s' % item for item in self.as_dict().items())
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    """
+    SSLContext, который при открытии нового соединения предлагает серверу
+    TLS-сессию предыдущего соединения (abbreviated handshake)
+
+    """
+    stats = None
+    _last_socket = None
+
+    def _last_session(self, kwargs):
+        last_socket = self._last_socket and self._last_socket()
+        if last_socket is not None and kwargs.get('session') is None:
+            session = last_socket.session
+            if session is not None:
+                kwargs['session'] = session
+
+    def wrap_socket(self, *args, **kwargs):
+        self._last_session(kwargs)
+        sock = super().wrap_socket(*args, **kwargs)
+        self._last_socket = weakref.ref(sock)
+        if self.stats is not None:
+            self.stats.inc('connections_opened')
+            if sock.session_reused:
+                self.stats.inc('tls_sessions_reused')
+        return sock
+
+    def wrap_bio(self, *args, **kwargs):
+        # asyncio (aiohttp) открывает TLS через SSLObject; handshake еще не выполнен
+        self._last_session(kwargs)
+        ssl_object = super().wrap_bio(*args, **kwargs)
+        self._last_socket = weakref.ref(ssl_object)
+        if self.stats is not None:
+            self.stats.inc('connections_opened')
+        return ssl_object
+
+
+def build_ssl_context(ca_cert_path=None, client_cert=None, stats=None):
+    context = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.stats = stats
+    if ca_cert_path:
+        context.load_verify_locations(cafile=ca_cert_path)
+    else:
+        # без CA сертификат сервера не проверяется (как и раньше с verify=None)
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    if client_cert and client_cert[0]:
+        context.load_cert_chain(*client_cert)
+    return context
+
+
+class KubeHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter с общим SSLContext: CA и клиентский сертификат загружаются
+    один раз, а не при каждом новом соединении
+
+    """
+    def __init__(self, ssl_context, **kwargs):
+        self.ssl_context = ssl_context
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['ssl_context'] = self.ssl_context
+        super().init_poolmanager(*args, **kwargs)
+
+    def cert_verify(self, conn, url, verify, cert):
+        if self.ssl_context.verify_mode == ssl.CERT_NONE:
+            conn.cert_reqs = 'CERT_NONE'
+        else:
+            conn.cert_reqs = 'CERT_REQUIRED'
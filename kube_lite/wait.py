@@ -1,24 +1,19 @@
-import time
-
-from kube_lite import KubernetesApi, NotFoundError
-from kube_lite.log import CONSOLE, DEBUG
+from kube_lite.log import CONSOLE
+from kube_lite.watch import Watch
 
 class WaitTimeoutError(Exception):
     pass
 
+class ObjectDeletedError(Exception):
+    """ Объект удален, пока ждали изменения его состояния """
+
 def wait_until_deleted(kind, name, namespace, timeout=120):
-    start_t = time.time()
-    printed = False
-    while 1:
-        try:
-            KubernetesApi.get(kind, name=name, namespace=namespace)
-        except NotFoundError:
-            break
-        if not printed:
-            CONSOLE('#### Waiting until server deletes %s %s/%s' % (kind, namespace, name))
-            printed = True
-        else:
-            DEBUG('Waiting until server deletes %s %s/%s ' % (kind, namespace, name))
-        if time.time() >= start_t + timeout:
-            raise WaitTimeoutError(kind, name)
-        time.sleep(1)
+    watch = Watch(kind, namespace=namespace, name=name)
+    watch.list()
+    if not watch.objects:
+        return
+    CONSOLE('#### Waiting until server deletes %s %s/%s' % (kind, namespace, name))
+    for __event in watch.stream(timeout=timeout):
+        if not watch.objects:
+            return
+    raise WaitTimeoutError(kind, name)
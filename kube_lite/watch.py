@@ -0,0 +1,165 @@
+import json
+import math
+import socket
+import time
+from contextlib import closing
+
+import requests
+
+from kube_lite.direct_api import KubernetesApi, GoneError, CONNECT_TIMEOUT
+from kube_lite.document import Document
+from kube_lite.log import DEBUG
+
+WATCH_TIMEOUT = 300
+RECONNECT_DELAY = 1
+
+
+class WatchError(Exception):
+    pass
+
+
+class ResourceExpired(Exception):
+    pass
+
+
+def abort_response(response):
+    """ Обрывает соединение потокового ответа requests из другого потока (close() не будит recv) """
+    sock = getattr(response.raw.connection, 'sock', None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class Watch(object):
+    """
+    Поток событий ?watch=1 для объектов одного kind.
+
+    Соединение переоткрывается с последнего resourceVersion после таймаута или обрыва,
+    при 410 Gone делается повторный LIST, и наблюдатель получает события, которые
+    приводят его к текущему состоянию (включая DELETED для исчезнувших объектов).
+
+    """
+    def __init__(self, kind, namespace=None, name=None, label_selector=None, field_selector=None, api=None):
+        self.kind = kind
+        self.namespace = namespace
+        self.api = KubernetesApi.kind_api(kind, api)
+        self.label_selector = label_selector
+        field_selectors = [field_selector] if field_selector else []
+        if name:
+            field_selectors.append('metadata.name=%s' % name)
+        self.field_selector = ','.join(field_selectors) or None
+        self.resource_version = None
+        self.objects = {}
+        self._stopped = False
+        self._response = None
+
+    def stop(self):
+        """ Можно вызвать из другого потока: stream() заканчивается сразу, а не после следующего события """
+        self._stopped = True
+        response = self._response
+        if response is not None:
+            abort_response(response)
+
+    def params(self, **params):
+        if self.label_selector:
+            params['labelSelector'] = self.label_selector
+        if self.field_selector:
+            params['fieldSelector'] = self.field_selector
+        return params
+
+    def list(self):
+        pages = KubernetesApi.iter_pages(self.kind, namespace=self.namespace, api=self.api, params=self.params())
+        return self.sync_pages(pages)
+
+    def sync(self, list_doc):
+        return self.sync_pages([list_doc])
+
+    def sync_pages(self, pages):
+        events = []
+        current = {}
+        for item in self._page_items(pages):
+            name = item.metadata.name
+            current[name] = item
+            old = self.objects.get(name)
+            if old is None:
+                events.append(('ADDED', item))
+            elif old.metadata.resourceVersion != item.metadata.resourceVersion:
+                events.append(('MODIFIED', item))
+        for name, item in self.objects.items():
+            if name not in current:
+                events.append(('DELETED', item))
+        self.objects = current
+        return events
+
+    def _page_items(self, pages):
+        for page in pages:
+            self.resource_version = page.metadata.resourceVersion
+            yield from page['items'] or []
+
+    def handle(self, event):
+        event_type = event['type']
+        obj = Document(event['object'])
+        if event_type == 'ERROR':
+            if obj.code == 410:
+                raise ResourceExpired(obj.message)
+            raise WatchError(obj.code, obj.message)
+
+        if obj.metadata.resourceVersion:
+            self.resource_version = obj.metadata.resourceVersion
+        if event_type == 'BOOKMARK':
+            return None
+
+        if event_type == 'DELETED':
+            self.objects.pop(obj.metadata.name, None)
+        else:
+            self.objects[obj.metadata.name] = obj
+        return event_type, obj
+
+    def watch_params(self, timeout_seconds):
+        return self.params(watch=1, allowWatchBookmarks='true', resourceVersion=self.resource_version,
+                           timeoutSeconds=timeout_seconds)
+
+    def stream(self, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        if self.resource_version is None:
+            yield from self.list()
+
+        path = KubernetesApi.kind_path(self.kind, namespace=self.namespace)
+        while not self._stopped:
+            timeout_seconds = WATCH_TIMEOUT
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return
+                timeout_seconds = min(WATCH_TIMEOUT, math.ceil(remaining))
+
+            try:
+                r = KubernetesApi.call('GET', path, api=self.api, params=self.watch_params(timeout_seconds),
+                                       stream=True, timeout=(CONNECT_TIMEOUT, timeout_seconds + CONNECT_TIMEOUT))
+                self._response = r
+                # stop() мог прийти, пока соединение открывалось
+                if self._stopped:
+                    abort_response(r)
+                with closing(r):
+                    for line in r.iter_lines(chunk_size=None):
+                        if self._stopped:
+                            return
+                        if not line:
+                            continue
+                        event = self.handle(json.loads(line))
+                        if event:
+                            yield event
+                        if deadline is not None and time.time() >= deadline:
+                            return
+            except (GoneError, ResourceExpired) as e:
+                DEBUG('watch %s: %s, relisting' % (self.kind, e))
+                yield from self.list()
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                if self._stopped:
+                    return
+                DEBUG('watch %s: %s, reconnecting from resourceVersion=%s' % (self.kind, e, self.resource_version))
+                time.sleep(RECONNECT_DELAY)
+            finally:
+                self._response = None
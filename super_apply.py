@@ -2,24 +2,32 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import copy
 import re
 import subprocess
 import sys
 import os
+import time
 import uuid
+from collections import defaultdict
+from contextlib import ExitStack
 
 sys.path.insert(0, os.path.dirname(sys.argv[0]) + '/../lib/site-packages')
 sys.path.insert(0, os.path.dirname(sys.argv[0]) + '/lib/site-packages')
 
-from kubernetes.client.rest import ApiException
-from kube_deploy.kube import init_kube_connection, get_namespace
+from kube_deploy.backend import BACKENDS
+from kube_deploy.kube import ApiError
 from kube_deploy.controller import NamespaceController
+from kube_deploy.manifests import load_files, ManifestCache, DEFAULT_CACHE_DIR
 from kube_deploy.log import setup_logging, CONSOLE, DEBUG, print_container_log
 from kube_deploy.options import Options
-from kube_deploy.resources import supports_versions, RESOURCE_TYPES, Pod
+from kube_deploy.resources import supports_versions, RESOURCE_TYPES, Pod, UNCHANGED, FINGERPRINT_ANNOTATION, \
+    content_fingerprint, prefetch_live_state, LIVE_VIEW
+from kube_deploy.scheduler import ApplyScheduler
+from kube_deploy.targets import init_targets, run_targets, print_results
+from kube_deploy.tracing import profiled, span, traced
 
-from dotdict import DotDict
-import yaml
+from dotdict import DotDict, LazyDotDict
 
 class SvnVersionError(Exception):
     pass
@@ -34,13 +42,27 @@ Options.no_version = None
 Options.overwrite = None
 Options.replicas = None
 Options.delete_old_versions = None
+Options.wait_for_deletion = None
 Options.set_annotation = []
 Options.wait = None
 Options.rename = True
-
-
-def parse_cmd_line():
+Options.parallelism = 1
+Options.log_dir = None
+Options.parse_jobs = None
+Options.manifest_cache = DEFAULT_CACHE_DIR
+Options.manifest_cache_size = 256
+Options.log_limit_bytes = None
+Options.namespaces = None
+Options.contexts = None
+Options.target_parallelism = 4
+Options.stop_on_failure = False
+
+
+def build_parser():
+    """ Аргументы добавляются в Options.parser один раз на процесс (демон разбирает командную строку многократно) """
     parser = Options.parser
+    if parser.description:
+        return parser
     parser.description = 'Deploy resources to Kubernetes'
     parser.add_argument('resources', nargs='+')
 
@@ -51,20 +73,103 @@ def parse_cmd_line():
     version_group.add_argument('--set-version', metavar='VERSION', dest='force_version',
                                help='Set resource version to the supplied value')
     parser.add_argument('--overwrite', action='store_true', help='Replace existing resources')
+    parser.add_argument('--server-side', action='store_true',
+                        help='Create or update resources with a single server-side apply request')
+    parser.add_argument('--field-manager', default='super_apply', metavar='NAME',
+                        help='Field manager name for server-side apply')
+    parser.add_argument('--force-conflicts', action='store_true',
+                        help='Take ownership of fields managed by other field managers (server-side apply)')
     parser.add_argument('--replicas', type=int, default=1, metavar='N', help='Deploy this many replicas')
     parser.add_argument('--delete-old-versions', action='store_true')
+    parser.add_argument('--wait-for-deletion', action='store_true',
+                        help='With --delete-old-versions, wait until old versions are gone')
     parser.add_argument('--set-annotation', '-A', metavar='KEY=VALUE', action='append',
                         help='Set annotation on Kubernetes resources')
 
-    parser.add_argument('--namespace', '-n')
+    parser.add_argument('--parallelism', '-j', type=int, default=1, metavar='N',
+                        help='Apply up to N independent resources concurrently')
+    parser.add_argument('--parse-jobs', type=int, metavar='N',
+                        help='Parse large manifest sets in N processes (default: number of CPUs, 1 disables)')
+    parser.add_argument('--manifest-cache', default=DEFAULT_CACHE_DIR, metavar='DIR',
+                        help='Keep parsed manifests in DIR and skip parsing files that have not changed')
+    parser.add_argument('--no-manifest-cache', dest='manifest_cache', action='store_const', const=None)
+    parser.add_argument('--manifest-cache-size', type=int, default=256, metavar='MB',
+                        help='Remove least recently used entries when the manifest cache grows over MB')
+
+    parser.add_argument('--namespace', '-n', dest='namespaces', action='append', metavar='NAMESPACE',
+                        help='Deploy to NAMESPACE; may be repeated or comma-separated')
+    parser.add_argument('--context', dest='contexts', action='append', metavar='CONTEXT',
+                        help='Deploy to kubeconfig CONTEXT; may be repeated or comma-separated '
+                             '(every namespace in every context)')
+    parser.add_argument('--target-parallelism', type=int, default=4, metavar='N',
+                        help='Deploy to at most N namespaces/contexts at a time')
+    parser.add_argument('--stop-on-failure', action='store_true',
+                        help='Do not start deploying to the remaining targets after one has failed')
+    parser.add_argument('--list-page-size', type=int, default=500, metavar='N',
+                        help='Read object lists from the API server N objects at a time')
+    parser.add_argument('--qps', type=float, default=50, metavar='N',
+                        help='Send at most N requests per second to each cluster on average (0 - no limit)')
+    parser.add_argument('--burst', type=int, default=100, metavar='N',
+                        help='Allow bursts of up to N requests above --qps')
+    parser.add_argument('--metrics-out', metavar='FILE',
+                        help='Write API request counts, latency histograms and sizes to FILE at exit '
+                             '(*.json - JSON, otherwise Prometheus text format)')
+    parser.add_argument('--trace-out', metavar='FILE',
+                        help='Write a timeline of deploy phases and API requests to FILE at exit '
+                             '(Chrome trace events: chrome://tracing, ui.perfetto.dev)')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='Profile the run in all threads with cProfile and save pstats to FILE')
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='kubernetes',
+                        help='Kubernetes client: the kubernetes package or the lightweight kube_lite')
     parser.add_argument('--dry-run', action='store_true', help='Do not change Kubernetes objects')
     parser.add_argument('--wait', type=int, default=60, nargs='?', metavar='SECONDS',
                         help='Wait for deployment to have at least 1 ready pod')
+    parser.add_argument('--no-fail-fast', dest='fail_fast', action='store_false',
+                        help='Wait for the full --wait time even if the rollout has already failed')
+    parser.add_argument('--max-restarts', type=int, default=3, metavar='N',
+                        help='Abort the rollout when a container has restarted N times')
+    parser.add_argument('--failure-grace', type=int, default=10, metavar='SECONDS',
+                        help='Abort when a container stays in CrashLoopBackOff, ImagePullBackOff etc. this long')
     parser.add_argument('--verbose', '-v', action='store_true')
+    parser.add_argument('--log-dir', metavar='DIR', help='Also save pod logs to DIR/<pod>.<container>.log')
+    parser.add_argument('--log-limit-bytes', type=int, metavar='N', help='Print at most N bytes of each pod log')
     parser.add_argument('--quiet', '-q', action='store_true')
     parser.add_argument('--debug', '-d', type=int, default=0)
-
-    parser.parse_args(namespace=Options)
+    return parser
+
+
+def parse_cmd_line(argv=None, cwd=None):
+    """ cwd - каталог, относительно которого заданы пути в argv (по умолчанию - текущий) """
+    parser = build_parser()
+    parser.parse_args(argv, namespace=Options)
+    if cwd:
+        Options.resources = [os.path.join(cwd, filename) for filename in Options.resources]
+        if Options.log_dir:
+            Options.log_dir = os.path.join(cwd, Options.log_dir)
+        for name in ('metrics_out', 'trace_out', 'profile'):
+            if getattr(Options, name):
+                setattr(Options, name, os.path.join(cwd, getattr(Options, name)))
+    validate_options(parser)
+
+
+def validate_options(parser):
+    # все, что можно проверить без обращения к кластеру, проверяем до подключения к нему
+    for filename in Options.resources:
+        if not os.path.isfile(filename):
+            parser.error('%s: file not found' % filename)
+    for name in ('namespaces', 'contexts'):
+        values = getattr(Options, name)
+        if values:
+            setattr(Options, name, [value for param in values for value in param.split(',') if value])
+    # --replicas 0 - законный способ остановить Deployment
+    for name in ('qps', 'replicas'):
+        value = getattr(Options, name)
+        if value is not None and value < 0:
+            parser.error('--%s must not be negative' % name)
+    for name in ('parallelism', 'parse_jobs', 'target_parallelism', 'list_page_size', 'burst'):
+        value = getattr(Options, name)
+        if value is not None and value < 1:
+            parser.error('--%s must be at least 1' % name.replace('_', '-'))
 
 
 def get_version(app, filename):
@@ -75,20 +180,32 @@ def get_version(app, filename):
     return version
 
 
+@traced()
 def read_docs(app, filenames):
+    cache = None
+    if Options.manifest_cache:
+        cache = ManifestCache(Options.manifest_cache, Options.manifest_cache_size * 1024 * 1024)
     docs = []
-    for filename in filenames:
+    for filename, file_docs in zip(filenames, load_files(filenames, Options.parse_jobs, cache)):
         file_version = get_version(app, filename)
 
         print('! file: %s\tversion: %s' % (filename, file_version))
 
-        with open(filename) as f:
-            for d in yaml.load_all(f):
-                doc = DotDict(d)
-                docs.append((file_version, doc))
+        for d in file_docs:
+            docs.append((file_version, d))
+    if cache is not None:
+        print('! %s' % cache)
     return docs
 
 
+def wrap_docs(docs, copy_docs=False):
+    """ Документы для одной цели; copy_docs - своя копия, т.к. при выкатке документы меняются """
+    if copy_docs:
+        docs = copy.deepcopy(docs)
+    return [(version, LazyDotDict(doc)) for version, doc in docs]
+
+
+@traced()
 def index_resources(app, docs):
     annotations = dict(param.split('=', 1) for param in Options.set_annotation)
     for version, doc in docs:
@@ -113,6 +230,10 @@ def set_versions(doc, app, version):
     return doc
 
 
+def set_fingerprint(doc):
+    set_annotations(doc, {FINGERPRINT_ANNOTATION: content_fingerprint(doc)})
+
+
 def set_replicas(doc, replicas):
     if doc.kind == 'Deployment':
         doc.spec.replicas = replicas
@@ -125,6 +246,29 @@ def set_container_env(doc, env_var_name, value):
                 env_var.value = value
 
 
+def config_map_refs(doc):
+    if doc.kind == 'Deployment':
+        spec = doc.spec.template.spec
+    else:
+        spec = doc.spec
+    names = set()
+    for volume in spec.get('volumes') or []:
+        if volume.get('configMap'):
+            names.add(volume.configMap.name)
+        for source in (volume.get('projected') or {}).get('sources') or []:
+            if source.get('configMap'):
+                names.add(source.configMap.name)
+    for container in (spec.get('containers') or []) + (spec.get('initContainers') or []):
+        for env_from in container.get('envFrom') or []:
+            if env_from.get('configMapRef'):
+                names.add(env_from.configMapRef.name)
+        for env_var in container.get('env') or []:
+            ref = (env_var.get('valueFrom') or {}).get('configMapKeyRef')
+            if ref:
+                names.add(ref.name)
+    return names
+
+
 def get_selector(resource):
     update_id = resource.metadata.labels['update-id']
     app_name = resource.metadata.labels['app']
@@ -144,38 +288,57 @@ class AppData:
         self.services[doc.metadata.name] = doc
 
 
+    def linked_deployments(self, service_doc):
+        app_name = service_doc.metadata.labels['app']
+        return [deployment for deployment in self.deployments.values()
+                if (deployment.metadata.get('labels') or {}).get('app') == app_name]
+
     def link_deployments(self, service_doc):
         # привязываем deployment к service
         service_name = service_doc.metadata.name
-        app_name = service_doc.metadata.labels['app']
-        for deployment in self.deployments.values():
-            if deployment.metadata.labels.get('app') == app_name:
-                if supports_versions(deployment):
-                    version = deployment.metadata.labels.get('version')
-                    service_doc.spec.selector.version = version
-                    CONSOLE('# Service %s: set labels.version = %s' % (service_name, version))
-                else:
-                    # приложение может не поддерживать версии
-                    CONSOLE('# Service %s: no labels.version in resource definition' % service_name)
-                    service_doc.spec.selector.pop('version', None)
-
-
+        for deployment in self.linked_deployments(service_doc):
+            if supports_versions(deployment):
+                version = deployment.metadata.labels.get('version')
+                service_doc.spec.selector.version = version
+                CONSOLE('# Service %s: set labels.version = %s' % (service_name, version))
+            else:
+                # приложение может не поддерживать версии
+                CONSOLE('# Service %s: no labels.version in resource definition' % service_name)
+                service_doc.spec.selector.pop('version', None)
+
+
+@traced()
 def delete_old_versions(app, docs, site):
+    targets = []
     for version, doc in docs:
         if version and supports_versions(doc):
             selector = 'app=%s,version!=%s' % (app.app_name, version)
             DEBUG('delete_old_versions', doc.kind, selector)
-            site.delete_resources(RESOURCE_TYPES[doc.kind], selector)
+            targets.append((RESOURCE_TYPES[doc.kind], selector))
+    site.delete_collections(targets, wait=Options.wait_for_deletion)
+
+def follow_pod_log(pod, container_name):
+    """ Печатает лог контейнера по мере его появления, пока контейнер не завершится """
+    log = pod.stream_log(container_name, follow=True, limit_bytes=Options.log_limit_bytes)
+    if not Options.log_dir:
+        print_container_log(log, pod.name, container_name)
+        return
+    os.makedirs(Options.log_dir, exist_ok=True)
+    with open(os.path.join(Options.log_dir, '%s.%s.log' % (pod.name, container_name)), 'w') as f:
+        print_container_log(log, pod.name, container_name, spool_file=f)
 
+
+@traced()
 def process_pod_results(pod):
     container_name = pod.spec.containers[0].name
-    terminated = pod.wait_for_container(container_name, 'terminated', expected_exit_code=0, max_restarts=1)
-    DEBUG('rc=', terminated.exit_code)
-    log = pod.read_log(container_name)
-    if terminated.exit_code == 0:
-        print_container_log(log, pod.name, container_name)
+    pod.wait_for_container(container_name, ('running', 'terminated'), max_restarts=1)
+    follow_pod_log(pod, container_name)
+    # лог кончается вместе с контейнером; код выхода (и ненулевой) - из статуса
+    terminated = pod.wait_for_exit(container_name)
+    DEBUG('rc=', terminated.exitCode)
+    if terminated.exitCode == 0:
         pod.delete()
-    return terminated.exit_code
+    return terminated.exitCode
 
 
 APPLY_ORDER = {'ConfigMap': 1,
@@ -184,61 +347,175 @@ APPLY_ORDER = {'ConfigMap': 1,
                'Service': 30,}
 
 
-def main():
-    init_kube_connection()
+def apply_tier(doc):
+    return APPLY_ORDER.get(doc.kind) or APPLY_ORDER[None]
+
+
+def build_apply_graph(app, docs):
+    """
+    Зависимости между документами: документ применяется после всех документов
+    предыдущих уровней APPLY_ORDER, кроме тех, про которые известно, что он на них не ссылается:
+    Deployment и Pod ждут только свои ConfigMap, Service - только свои Deployment.
+
+    """
+    # ConfigMap и Deployment ищем по индексу, а не перебором всех документов
+    other_by_tier = defaultdict(list)
+    config_maps_by_name = defaultdict(list)
+    deployments_by_id = {}
+    for i, (__version, doc) in enumerate(docs):
+        if doc.kind == 'ConfigMap':
+            config_maps_by_name[doc.metadata.name].append(i)
+        elif doc.kind == 'Deployment':
+            deployments_by_id[id(doc)] = i
+        else:
+            other_by_tier[apply_tier(doc)].append(i)
+
+    dependencies = {}
+    for i, (__version, doc) in enumerate(docs):
+        tier = apply_tier(doc)
+        deps = dependencies[i] = set()
+        for other_tier, indexes in other_by_tier.items():
+            if other_tier < tier:
+                deps.update(indexes)
+
+        if APPLY_ORDER['ConfigMap'] < tier:
+            if doc.kind in ('Deployment', 'Pod'):
+                for name in config_map_refs(doc):
+                    deps.update(config_maps_by_name.get(name, ()))
+            else:
+                for indexes in config_maps_by_name.values():
+                    deps.update(indexes)
+
+        if APPLY_ORDER['Deployment'] < tier:
+            if doc.kind == 'Service':
+                linked = [deployments_by_id.get(id(deployment)) for deployment in app.linked_deployments(doc)]
+                deps.update(j for j in linked if j is not None)
+            else:
+                deps.update(deployments_by_id.values())
+    return dependencies
+
+
+def apply_document(app, site, rollouts, namespace, update_id, doc):
+    if doc.kind == 'Service':
+        # Service переключаем только на готовые Deployment
+        rollouts.wait([deployment.metadata.name for deployment in app.linked_deployments(doc)])
+
+    doc.metadata.namespace = namespace
+    resource_type = RESOURCE_TYPES[doc.kind]
+    resource = resource_type(doc)
 
-    parse_cmd_line()
-    setup_logging()
-    namespace = get_namespace()
+    if doc.kind == 'Deployment':
+        doc.metadata.setdefault('labels', DotDict())['update-id'] = update_id
+        doc.spec.template.metadata.setdefault('labels', DotDict())['update-id'] = update_id
+        set_replicas(doc, Options.replicas)
+
+    elif doc.kind == 'Pod':
+        doc.metadata.setdefault('labels', DotDict())['update-id'] = update_id
+        if Options.overwrite:
+            try:
+                Pod(doc).delete()
+            except ApiError as e:
+                if e.status != 404:
+                    raise
+
+    elif doc.kind == 'Service':
+        app.link_deployments(doc)
+
+    set_fingerprint(doc)
+    if resource.apply() == UNCHANGED:
+        return
 
-    site = NamespaceController(namespace)
-    app = AppData(Options)
+    if doc.kind == 'Deployment':
+        if Options.wait and not Options.dry_run:
+            rollouts.register(resource.name)
 
-    docs = read_docs(app, Options.resources)
+    elif doc.kind == 'Pod':
+        if Options.wait and not Options.dry_run:
+            process_pod_results(Pod(doc))
 
-    index_resources(app, docs)
 
-    update_id = str(uuid.uuid1())
+def deploy(target, docs):
+    with target.lock, span('deploy %s' % target):
+        deploy_locked(target, docs)
 
-    for version, doc in sorted(docs, key=lambda row: APPLY_ORDER.get(row[1].kind) or APPLY_ORDER[None]):
-        doc.metadata.namespace = namespace
-        resource_type = RESOURCE_TYPES[doc.kind]
-        resource = resource_type(doc)
 
-        if doc.kind == 'Deployment':
-            doc.metadata.setdefault('labels', DotDict())['update-id'] = update_id
-            doc.spec.template.metadata.setdefault('labels', DotDict())['update-id'] = update_id
-            set_replicas(doc, Options.replicas)
-
-        elif doc.kind == 'Pod':
-            doc.metadata.setdefault('labels', DotDict())['update-id'] = update_id
-            if Options.overwrite:
-                #from kubernetes import client
-                #api = client.CoreV1Api()
-                #pod_doc = api.read_namespaced_pod(name=doc.metadata.name, namespace=site.namespace)
-                try:
-                    Pod(doc).delete()
-                except ApiException as e:
-                    if e.status != 404:
-                        raise
-
-        elif doc.kind == 'Service':
-            app.link_deployments(doc)
-
-        resource.apply()
+def deploy_locked(target, docs):
+    # в демоне LIVE_VIEW мог остаться от прошлого запуска в этот namespace
+    LIVE_VIEW.clear(target.namespace)
+    site = NamespaceController(target.namespace)
+    app = AppData(Options)
 
-        if doc.kind == 'Deployment':
-            if Options.wait and not Options.dry_run:
-                site.wait_for_deployment(get_selector(resource))
+    index_resources(app, docs)
+    # состояние объектов на сервере - одним LIST на kind, а не GET на каждый документ
+    with span('prefetch_live_state'):
+        prefetch_live_state(target.namespace, [doc for __, doc in docs])
 
-        elif doc.kind == 'Pod':
-            if Options.wait and not Options.dry_run:
-                process_pod_results(Pod(doc))
+    update_id = str(uuid.uuid1())
+    rollouts = site.rollout_tracker('update-id=%s' % update_id)
+
+    docs = sorted(docs, key=lambda row: apply_tier(row[1]))
+    scheduler = ApplyScheduler(Options.parallelism)
+    try:
+        with span('apply_documents'):
+            scheduler.run(docs, build_apply_graph(app, docs),
+                          lambda row: apply_document(app, site, rollouts, target.namespace, update_id, row[1]))
+        rollouts.wait()
+    finally:
+        rollouts.close()
 
     if Options.delete_old_versions:
         delete_old_versions(app, docs, site)
 
 
+def write_report(report, path):
+    report.write(path)
+    DEBUG('%s written to %s' % (type(report).__name__, path))
+
+
+def main(argv=None, cwd=None):
+    started = time.perf_counter()
+    parse_cmd_line(argv, cwd)
+    parsed = time.perf_counter()
+    setup_logging()
+    # метрики и трассировка включаются до запуска потоков: те получают копию контекста;
+    # файлы пишутся и при неудачном запуске
+    with ExitStack() as reports:
+        if Options.metrics_out:
+            from kube_lite import metrics
+            reports.callback(write_report, metrics.enable(), Options.metrics_out)
+        if Options.trace_out:
+            from kube_lite import trace
+            tracer = trace.enable()
+            tracer.add('parse_cmd_line', started, parsed)
+            reports.callback(write_report, tracer, Options.trace_out)
+        if Options.profile:
+            reports.enter_context(profiled(Options.profile))
+        deploy_all()
+
+
+def deploy_all():
+    targets = init_targets(Options.contexts, Options.namespaces)
+
+    # файлы разбираются один раз на все цели
+    docs = read_docs(AppData(Options), Options.resources)
+
+    if len(targets) == 1:
+        try:
+            with targets[0].activate():
+                deploy(targets[0], wrap_docs(docs))
+        finally:
+            DEBUG('flow control: %s' % targets[0].backend.flow_control)
+        return
+
+    results = run_targets(targets, lambda target: deploy(target, wrap_docs(docs, copy_docs=True)),
+                          Options.target_parallelism, Options.stop_on_failure)
+    for target in targets:
+        DEBUG('%s flow control: %s' % (target, target.backend.flow_control))
+    print_results(results)
+    if not all(result.ok for result in results):
+        sys.exit(1)
+
+
 
 if __name__ == '__main__':
     main()
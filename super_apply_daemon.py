@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+super_apply_daemon.py serve [--socket PATH]      запустить демон
+super_apply_daemon.py [--socket PATH] ARGS...    выполнить "super_apply.py ARGS..." в запущенном демоне
+
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(sys.argv[0]) + '/../lib/site-packages')
+sys.path.insert(0, os.path.dirname(sys.argv[0]) + '/lib/site-packages')
+
+from kube_deploy.daemon import DEFAULT_SOCKET, DaemonNotRunning, run_client, serve
+
+
+def warm_up():
+    # все, что иначе делал бы каждый запуск: импорты, разбор аргументов, подключение к текущему контексту
+    import super_apply
+    from kube_deploy.backend import connected_backend
+    from kube_deploy.log import DEBUG
+    super_apply.build_parser().prog = 'super_apply.py'
+    try:
+        connected_backend()
+    except (Exception, SystemExit) as e:
+        DEBUG('warm up: %s' % e)
+
+
+def job(argv, cwd):
+    import super_apply
+    super_apply.main(argv, cwd)
+
+
+def main(argv):
+    path = DEFAULT_SOCKET
+    if argv[:1] == ['--socket'] and len(argv) >= 2:
+        path, argv = argv[1], argv[2:]
+    if argv[:1] == ['serve']:
+        if argv[1:3] and argv[1] == '--socket':
+            path = argv[2]
+        serve(job, path, warm_up=warm_up)
+        return 0
+    try:
+        return run_client(argv, path)
+    except DaemonNotRunning as e:
+        print(e, file=sys.stderr)
+        return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,108 @@
+import pytest
+from dotdict import LazyDotDict
+from kube_deploy import backend as backend_module
+from kube_deploy import resources
+from kube_deploy.backend import WATCH_CONNECTIONS, create_backend, use_backend
+from kube_deploy.kube import ApiError
+from kube_deploy.options import Options
+from kube_deploy.resources import ConfigMap, Deployment, Pod, ReplicaSet
+from kube_lite import api_resources
+from kube_lite.fake_apiserver import FakeApiServer
+
+NAMESPACE = 'test'
+
+
+@pytest.fixture(params=['kubernetes', 'lite'])
+def connected(request, tmp_path, monkeypatch):
+    """ Подключенный backend (оба вида) к заглушке API сервера """
+    monkeypatch.setattr(api_resources, 'CACHE_DIR', str(tmp_path / 'discovery'))
+    monkeypatch.setattr(Options, 'backend', request.param)
+    monkeypatch.setattr(Options, 'dry_run', False)
+    monkeypatch.setattr(Options, 'qps', 0)
+    monkeypatch.setattr(Options, 'parallelism', 1, raising=False)
+    console = []
+    monkeypatch.setattr(resources, 'CONSOLE', lambda *args: console.append(' '.join(map(str, args))))
+    with FakeApiServer(ready_delay=0.01) as server:
+        monkeypatch.setenv('KUBECONFIG', server.write_kubeconfig(str(tmp_path / 'kubeconfig'), namespace=NAMESPACE))
+        connected = create_backend()
+        connected.connect()
+        connected.server = server
+        connected.console = console
+        with use_backend(connected):
+            yield connected
+
+
+def _config_map(name, **labels):
+    return ConfigMap(LazyDotDict({'kind': 'ConfigMap', 'apiVersion': 'v1', 'data': {'key': name},
+                                  'metadata': {'name': name, 'namespace': NAMESPACE, 'labels': labels}}))
+
+
+def test_create_list_and_read(connected):
+    assert connected.current_namespace() == NAMESPACE
+    _config_map('web', app='web').create()
+    _config_map('db', app='db').create()
+
+    # label_selector= уходит в запрос как labelSelector
+    listed = ConfigMap.list(NAMESPACE, label_selector='app=web')
+    assert [item.metadata.name for item in listed['items']] == ['web']
+    assert ConfigMap.read(NAMESPACE, 'web').data.key == 'web'
+
+    with pytest.raises(ApiError) as exc_info:
+        ConfigMap.read(NAMESPACE, 'missing')
+    assert exc_info.value.status == 404
+
+
+def test_pod_status_exit_code_and_log(connected):
+    connected.server.pod_logs['job'] = 'line 1\nline 2\n'
+    pod = Pod(LazyDotDict({'kind': 'Pod', 'apiVersion': 'v1', 'metadata': {'name': 'job', 'namespace': NAMESPACE},
+                           'spec': {'restartPolicy': 'Never', 'containers': [{'name': 'job', 'image': 'job:1'}]}}))
+    pod.create()
+
+    terminated = pod.wait_for_exit('job', timeout=10)
+    assert terminated.exitCode == 0
+
+    seen_messages = set()
+    pod.print_status(Pod.read(NAMESPACE, 'job'), seen_messages)
+    assert '# Container job/job: terminated // Completed' in connected.console
+    # ключи сообщений - по containerID из ответа
+    assert all(key[0].startswith('fake://') for key in seen_messages)
+
+    assert list(pod.stream_log('job', follow=False)) == ['line 1', 'line 2']
+
+
+def test_delete_options_body(connected):
+    labels = {'app': 'web'}
+    Deployment(LazyDotDict({
+        'kind': 'Deployment', 'apiVersion': 'extensions/v1beta1',
+        'metadata': {'name': 'web', 'namespace': NAMESPACE, 'labels': labels},
+        'spec': {'replicas': 1, 'selector': {'matchLabels': labels}, 'template': {
+            'metadata': {'labels': labels}, 'spec': {'containers': [{'name': 'app', 'image': 'app:1'}]}}}})).create()
+    deployment = Deployment(Deployment.read(NAMESPACE, 'web'))
+    assert ReplicaSet.list(NAMESPACE)['items']
+
+    # propagationPolicy передается в теле DeleteOptions
+    deployment.delete(propagation_policy='Orphan')
+    assert connected.server.get_object('deployments', NAMESPACE, 'web') is None
+    assert ReplicaSet.list(NAMESPACE)['items']
+
+
+def test_watch_stream(connected):
+    _config_map('a').create()
+    watch = ConfigMap.watch(NAMESPACE)
+    events = watch.stream(timeout_seconds=1)
+    event_type, obj = next(events)
+    assert (event_type, obj.metadata.name) == ('ADDED', 'a')
+    watch.stop()
+    assert list(events) == []
+    assert watch.resource_version == obj.metadata.resourceVersion
+
+
+def test_pool_size_follows_parallelism(connected, monkeypatch):
+    monkeypatch.setattr(Options, 'parallelism', 20)
+    sized = create_backend()
+    sized.connect()
+    if Options.backend == 'lite':
+        assert sized.api.POOL_SIZE == 20 + WATCH_CONNECTIONS
+    else:
+        assert sized.api_client.configuration.connection_pool_maxsize >= 20 + WATCH_CONNECTIONS
+    assert backend_module._pool_size() == 20 + WATCH_CONNECTIONS
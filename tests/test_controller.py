@@ -0,0 +1,103 @@
+import json
+import threading
+
+import pytest
+from dotdict import LazyDotDict
+from kube_deploy import controller, resources
+from kube_deploy.backend import Backend, use_backend
+from kube_deploy.controller import NamespaceController
+from kube_deploy.kube import WaitTimeoutError
+from kube_deploy.options import Options
+from kube_deploy.resources import ConfigMap, Deployment, Service
+
+
+class ClusterBackend(Backend):
+    """ LIST отдает names, watch - заранее заданные события (по списку на каждое открытие) """
+    name = 'cluster'
+
+    def __init__(self, lists=(), watches=()):
+        super().__init__()
+        self.lists = list(lists)
+        self.watches = list(watches)
+        self.requests = []
+        self.watch_params = []
+        self._lock = threading.Lock()
+
+    def request(self, method, path, params=None, body=None, content_type='application/json'):
+        with self._lock:
+            self.requests.append((method, path))
+            if method == 'GET':
+                names = self.lists.pop(0) if self.lists else []
+                return LazyDotDict({'metadata': {'resourceVersion': '10'},
+                                    'items': [{'metadata': {'name': name, 'namespace': 'test'}} for name in names]
+                                    }), 200, {}
+        return LazyDotDict({}), 200, {}
+
+    def stream(self, method, path, params=None, timeout=None, on_open=None):
+        self.watch_params.append(params)
+        on_open(lambda: None)
+        for event_type, obj in self.watches.pop(0):
+            yield (json.dumps({'type': event_type, 'object': obj}) + '\n').encode()
+
+
+def _object(name, rv='11'):
+    return {'metadata': {'name': name, 'resourceVersion': rv}}
+
+
+@pytest.fixture(autouse=True)
+def options(monkeypatch):
+    monkeypatch.setattr(Options, 'dry_run', False)
+    monkeypatch.setattr(controller, 'CONSOLE', lambda *args: None)
+    monkeypatch.setattr(resources, 'CONSOLE', lambda *args: None)
+
+
+def test_delete_collections_skips_duplicates():
+    fake = ClusterBackend()
+    with use_backend(fake):
+        NamespaceController('test').delete_collections([(ConfigMap, 'app=web'), (Deployment, 'app=web'),
+                                                        (ConfigMap, 'app=web')])
+    assert sorted(fake.requests) == [('DELETE', '/api/v1/namespaces/test/configmaps'),
+                                     ('DELETE', '/apis/extensions/v1beta1/namespaces/test/deployments')]
+
+
+def test_delete_without_deletecollection_deletes_each_object():
+    fake = ClusterBackend(lists=[['web', 'web-canary']])
+    with use_backend(fake):
+        NamespaceController('test').delete_collections([(Service, 'app=web')])
+    assert fake.requests == [('GET', '/api/v1/namespaces/test/services'),
+                             ('DELETE', '/api/v1/namespaces/test/services/web'),
+                             ('DELETE', '/api/v1/namespaces/test/services/web-canary')]
+
+
+def test_wait_until_deleted_counts_down():
+    fake = ClusterBackend(lists=[['a', 'b']],
+                          watches=[[('MODIFIED', _object('a')), ('DELETED', _object('a', '12')),
+                                    ('DELETED', _object('b', '13')), ('DELETED', _object('never-listed'))]])
+    with use_backend(fake):
+        NamespaceController('test').wait_until_deleted(ConfigMap, 'app=web', timeout=60)
+    # watch начинается с версии LIST и заканчивается, как только удалены все объекты
+    assert fake.watch_params[0]['resourceVersion'] == '10'
+    assert fake.watches == []
+
+
+def test_wait_until_deleted_relists_after_expired_version():
+    expired = {'kind': 'Status', 'code': 410, 'reason': 'Expired', 'message': 'too old resource version'}
+    fake = ClusterBackend(lists=[['a', 'b'], ['b']],
+                          watches=[[('ERROR', expired)], [('DELETED', _object('b', '20'))]])
+    with use_backend(fake):
+        NamespaceController('test').wait_until_deleted(ConfigMap, 'app=web', timeout=60)
+    assert [method for method, __ in fake.requests] == ['GET', 'GET']
+    assert len(fake.watch_params) == 2
+
+
+def test_wait_until_deleted_timeout():
+    fake = ClusterBackend(lists=[['a']])
+    with use_backend(fake), pytest.raises(WaitTimeoutError):
+        NamespaceController('test').wait_until_deleted(ConfigMap, 'app=web', timeout=0)
+    assert fake.watch_params == []
+
+    # ничего не осталось - не ждем и не открываем watch
+    fake = ClusterBackend(lists=[[]])
+    with use_backend(fake):
+        NamespaceController('test').wait_until_deleted(ConfigMap, 'app=web', timeout=0)
+    assert fake.watch_params == []
@@ -0,0 +1,76 @@
+import contextvars
+import threading
+
+from kube_deploy import backend
+from kube_deploy.backend import Backend, connected_backend, share_connections
+from kube_deploy.daemon import run_job
+from kube_deploy.options import Options, job_options
+
+
+class FakeConnection:
+    def __init__(self):
+        self.messages = []
+
+    def send(self, message):
+        self.messages.append(message)
+
+
+def test_job_options_are_isolated():
+    seen = {}
+    barrier = threading.Barrier(2)
+
+    def job(value):
+        with job_options():
+            Options.dry_run = value
+            barrier.wait()
+            seen[value] = Options.dry_run
+
+    threads = [threading.Thread(target=contextvars.copy_context().run, args=(job, value)) for value in ('a', 'b')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert seen == {'a': 'a', 'b': 'b'}
+    assert Options.dry_run is None
+
+
+def test_run_job_exit_codes():
+    def run(job):
+        return contextvars.copy_context().run(run_job, job, [], None, FakeConnection())
+
+    assert run(lambda argv, cwd: None) == 0
+    assert run(lambda argv, cwd: Options.parser.exit(2)) == 2
+
+    def fail(argv, cwd):
+        raise RuntimeError('boom')
+    assert run(fail) == 1
+
+
+class RateLimitedBackend(Backend):
+    name = 'rate-limited'
+
+    def connect(self):
+        # ограничение частоты, с которым подключился бы настоящий backend
+        self.qps = Options.qps
+
+
+def test_shared_backend_keeps_job_rate_limits(monkeypatch):
+    monkeypatch.setitem(backend.BACKENDS, RateLimitedBackend.name, RateLimitedBackend)
+    monkeypatch.setattr(backend, '_connected', None)
+    share_connections()
+
+    def job(qps):
+        with job_options():
+            Options.backend = RateLimitedBackend.name
+            Options.qps = qps
+            return connected_backend()
+
+    def run(qps):
+        return contextvars.copy_context().run(job, qps)
+
+    # warm_up подключается с ограничением по умолчанию
+    default = run(Options.qps)
+    assert run(Options.qps) is default
+    limited = run(5)
+    assert limited is not default and limited.qps == 5
+    assert run(5) is limited
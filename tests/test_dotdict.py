@@ -0,0 +1,65 @@
+import copy
+
+from dotdict import DotDict, LazyDotDict
+
+
+def manifest():
+    return {'kind': 'Deployment',
+            'metadata': {'name': 'app', 'labels': {'app': 'app'}},
+            'spec': {'template': {'spec': {'containers': [{'name': 'main', 'env': [{'name': 'A', 'value': '1'}]},
+                                                          [{'nested': 'list'}]]}}}}
+
+
+def test_same_values_as_dotdict():
+    eager = DotDict(manifest())
+    lazy = LazyDotDict(manifest())
+    assert lazy == eager
+    assert lazy.metadata.labels.app == eager.metadata.labels.app
+    assert lazy.spec.template.spec.containers[0].env[0].value == '1'
+    assert lazy.spec.template.spec.containers[1][0].nested == 'list'
+
+
+def test_children_wrapped_on_access():
+    lazy = LazyDotDict(manifest())
+    assert type(dict.__getitem__(lazy, 'metadata')) is dict
+    assert isinstance(lazy.metadata, LazyDotDict)
+    assert lazy.metadata is lazy.metadata
+    assert isinstance(lazy.get('spec'), LazyDotDict)
+    assert all(isinstance(v, LazyDotDict) for v in lazy.values() if isinstance(v, dict))
+    assert not hasattr(lazy, '_user_defined_attrs')
+
+
+def test_missing_attribute_default():
+    lazy = LazyDotDict(manifest())
+    assert lazy.status is None
+    assert 'status' in lazy
+    assert LazyDotDict({}, default=dict).x == {}
+    assert lazy.metadata.namespace is None
+
+
+def test_changes_are_kept():
+    lazy = LazyDotDict(manifest())
+    lazy.metadata.setdefault('annotations', DotDict())['a'] = 'b'
+    lazy.spec.template.spec.containers[0].image = 'img'
+    lazy.replicas = 2
+    assert lazy['metadata']['annotations'] == {'a': 'b'}
+    assert lazy['spec']['template']['spec']['containers'][0]['image'] == 'img'
+    assert lazy['replicas'] == 2
+
+
+def test_source_is_not_modified():
+    source = manifest()
+    lazy = LazyDotDict(source)
+    containers = lazy.spec.template.spec.containers
+    assert containers[0].env[0].value == '1' and containers[1][0].nested == 'list'
+    assert lazy.spec.template.spec.containers is containers
+    assert source == manifest()
+    assert type(source['spec']['template']['spec']['containers'][0]) is dict
+
+
+def test_deepcopy():
+    lazy = LazyDotDict(manifest(), default=dict)
+    clone = copy.deepcopy(lazy)
+    clone.metadata.name = 'other'
+    assert lazy.metadata.name == 'app'
+    assert clone.missing == {}
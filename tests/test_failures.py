@@ -0,0 +1,69 @@
+import pytest
+from dotdict import LazyDotDict
+from kube_deploy.failures import FailureClassifier
+from kube_deploy.kube import RolloutFailedError
+from kube_deploy.rollout import RolloutTracker
+
+
+def pod(name, owner=None, phase='Running', restart_policy='Always', **container_status):
+    metadata = {'name': name}
+    if owner:
+        metadata['ownerReferences'] = [{'kind': 'ReplicaSet', 'name': owner}]
+    status = dict({'name': 'app', 'restartCount': 0, 'containerID': 'c-' + name, 'state': {}, 'lastState': {}},
+                  **container_status)
+    return LazyDotDict({'kind': 'Pod', 'metadata': metadata, 'spec': {'restartPolicy': restart_policy},
+                        'status': {'phase': phase, 'containerStatuses': [status]}})
+
+
+def replica_set(name, deployment, ready=0):
+    return LazyDotDict({'kind': 'ReplicaSet', 'metadata': {'name': name, 'ownerReferences': [
+        {'kind': 'Deployment', 'name': deployment}]}, 'status': {'readyReplicas': ready}})
+
+
+def test_fatal_waiting_reason_after_grace_period():
+    classifier = FailureClassifier(grace_period=10)
+    crashing = pod('web-1', state={'waiting': {'reason': 'CrashLoopBackOff', 'message': 'back-off'}})
+    assert classifier.check_pod(crashing) is None
+
+    # причина держится дольше grace period
+    key = ('web-1', 'app', 'CrashLoopBackOff')
+    classifier.first_seen[key] -= 11
+    failure = classifier.check_pod(crashing)
+    assert (failure.reason, failure.container) == ('CrashLoopBackOff', 'app')
+
+    assert FailureClassifier().check_pod(pod('web-2', state={'waiting': {'reason': 'ContainerCreating'}})) is None
+
+
+def test_restart_limit():
+    classifier = FailureClassifier(max_restarts=3)
+    assert classifier.check_pod(pod('web-1', restartCount=2)) is None
+    assert classifier.check_pod(pod('web-1', restartCount=3)).reason == 'RestartCount'
+    assert FailureClassifier().check_pod(pod('web-1', restartCount=30)) is None
+
+
+def test_progress_deadline_exceeded():
+    deployment = LazyDotDict({'metadata': {'name': 'web', 'generation': 2}, 'status': {
+        'observedGeneration': 2, 'conditions': [
+            {'type': 'Progressing', 'status': 'False', 'reason': 'ProgressDeadlineExceeded', 'message': 'slow'}]}})
+    assert FailureClassifier().check_deployment(deployment).reason == 'ProgressDeadlineExceeded'
+
+    # статус еще про предыдущую версию spec
+    deployment.metadata.generation = 3
+    assert FailureClassifier().check_deployment(deployment) is None
+
+
+def test_tracker_checks_only_pods_of_pending_deployments():
+    tracker = RolloutTracker('test', 'update-id=1')
+    tracker.classifier = FailureClassifier(max_restarts=3)
+    tracker.pending.add('web')
+    tracker.handle_event('ReplicaSet', 'ADDED', replica_set('web-abc', 'web'))
+
+    # Pod-задача с тем же update-id упала - ожидание Deployment это не касается
+    job = pod('migrate', phase='Failed', restart_policy='Never',
+              state={'terminated': {'exitCode': 1, 'reason': 'Error', 'startedAt': 't'}})
+    tracker.handle_event('Pod', 'MODIFIED', job)
+    tracker.handle_event('Pod', 'MODIFIED', pod('web-abc-1', owner='web-abc', restartCount=1))
+
+    with pytest.raises(RolloutFailedError) as exc_info:
+        tracker.handle_event('Pod', 'MODIFIED', pod('web-abc-1', owner='web-abc', restartCount=3))
+    assert exc_info.value.name == 'web-abc-1'
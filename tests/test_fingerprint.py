@@ -0,0 +1,79 @@
+import copy
+
+import pytest
+from dotdict import LazyDotDict
+from kube_deploy import resources
+from kube_deploy.resources import FINGERPRINT_ANNOTATION, ConfigMap, Pod, content_fingerprint
+
+import super_apply
+
+
+@pytest.fixture(autouse=True)
+def console(monkeypatch):
+    lines = []
+    monkeypatch.setattr(resources, 'CONSOLE', lambda *args: lines.append(' '.join(map(str, args))))
+    return lines
+
+
+def config_map(data, **labels):
+    return LazyDotDict({'kind': 'ConfigMap', 'metadata': {'name': 'web', 'namespace': 'test', 'labels': labels},
+                        'data': data})
+
+
+def live(doc):
+    """ Объект на сервере после прошлого запуска с тем же документом """
+    live_doc = copy.deepcopy(doc)
+    live_doc.metadata.uid = 'live-uid'
+    live_doc.metadata.resourceVersion = '7'
+    return live_doc
+
+
+def test_fingerprint_is_stable():
+    doc = config_map({'a': '1', 'b': '2'}, app='web')
+    reordered = LazyDotDict({'data': {'b': '2', 'a': '1'}, 'kind': 'ConfigMap',
+                             'metadata': {'labels': {'app': 'web'}, 'namespace': 'test', 'name': 'web'}})
+    assert content_fingerprint(doc) == content_fingerprint(reordered)
+    # update-id меняется при каждом запуске
+    assert content_fingerprint(doc) == content_fingerprint(config_map({'a': '1', 'b': '2'}, app='web',
+                                                                      **{'update-id': 'x'}))
+    assert content_fingerprint(doc) != content_fingerprint(config_map({'a': '1', 'b': '3'}, app='web'))
+
+
+def test_fingerprint_excludes_own_annotation():
+    doc = config_map({'a': '1'})
+    fingerprint = content_fingerprint(doc)
+    super_apply.set_fingerprint(doc)
+    assert doc.metadata.annotations[FINGERPRINT_ANNOTATION] == fingerprint
+    assert content_fingerprint(doc) == fingerprint
+
+
+def test_unchanged_document_is_skipped(console):
+    doc = config_map({'a': '1'})
+    super_apply.set_fingerprint(doc)
+    live_doc = live(doc)
+
+    again = config_map({'a': '1'})
+    super_apply.set_fingerprint(again)
+    assert ConfigMap(again)._is_unchanged(live_doc)
+    assert again.metadata.uid == 'live-uid'
+    assert console == ['# ConfigMap web unchanged, skipped']
+
+
+def test_changed_spec_is_never_skipped():
+    doc = config_map({'a': '1'})
+    super_apply.set_fingerprint(doc)
+    live_doc = live(doc)
+
+    changed = config_map({'a': '2'})
+    super_apply.set_fingerprint(changed)
+    assert not ConfigMap(changed)._is_unchanged(live_doc)
+    # без отпечатка (объект создан не super_apply) - тоже применяем
+    assert not ConfigMap(config_map({'a': '1'}))._is_unchanged(live_doc)
+    assert not ConfigMap(doc)._is_unchanged(None)
+
+
+def test_pod_is_always_reapplied():
+    doc = LazyDotDict({'kind': 'Pod', 'metadata': {'name': 'job', 'namespace': 'test'},
+                       'spec': {'containers': [{'name': 'job', 'image': 'job:1'}]}})
+    super_apply.set_fingerprint(doc)
+    assert not Pod(doc)._is_unchanged(live(doc))
@@ -0,0 +1,76 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+import yaml
+from kube_deploy import manifests
+from kube_deploy.manifests import ManifestCache, load_files
+
+
+def write(path, text):
+    path.write_text(text)
+    return str(path)
+
+
+def test_load_files_keeps_order(tmp_path):
+    files = [write(tmp_path / ('%s.yaml' % i), 'kind: ConfigMap\nmetadata: {name: c%s}\n---\nkind: Service\n' % i)
+             for i in range(3)]
+    result = load_files(files, jobs=1)
+    assert [docs[0]['metadata']['name'] for docs in result] == ['c0', 'c1', 'c2']
+    assert [docs[1]['kind'] for docs in result] == ['Service'] * 3
+
+
+def test_load_files_in_processes(tmp_path, monkeypatch):
+    pools = []
+
+    class RecordingPool(ProcessPoolExecutor):
+        def __init__(self, max_workers):
+            super().__init__(max_workers)
+            pools.append(max_workers)
+
+    # пул процессов - и для маленьких файлов
+    monkeypatch.setattr(manifests, 'PARALLEL_MIN_BYTES', 0)
+    monkeypatch.setattr(manifests, 'ProcessPoolExecutor', RecordingPool)
+    files = [write(tmp_path / ('%s.yaml' % i), 'kind: ConfigMap\nmetadata: {name: c%s}\n' % i) for i in range(4)]
+    result = load_files(files, jobs=2)
+    assert [docs[0]['metadata']['name'] for docs in result] == ['c0', 'c1', 'c2', 'c3']
+    assert pools == [2]
+
+    bad = write(tmp_path / 'bad.yaml', 'kind: ConfigMap\nmetadata: {name: [\n')
+    with pytest.raises(yaml.YAMLError, match='bad.yaml'):
+        load_files(files[:2] + [bad] + files[2:], jobs=2)
+
+
+def test_cache_hits_and_invalidation(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    filename = write(tmp_path / 'a.yaml', 'kind: ConfigMap\n')
+
+    cache = ManifestCache(cache_dir)
+    assert load_files([filename], cache=cache) == [[{'kind': 'ConfigMap'}]]
+    assert (cache.hits, cache.misses) == (0, 1)
+
+    cache = ManifestCache(cache_dir)
+    assert load_files([filename], cache=cache) == [[{'kind': 'ConfigMap'}]]
+    assert (cache.hits, cache.misses) == (1, 0)
+
+    write(tmp_path / 'a.yaml', 'kind: Service\n')
+    cache = ManifestCache(cache_dir)
+    assert load_files([filename], cache=cache) == [[{'kind': 'Service'}]]
+    assert (cache.hits, cache.misses) == (0, 1)
+
+
+def test_cache_eviction(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    files = [write(tmp_path / ('%s.yaml' % i), 'data: %s\n' % ('x' * 1000 * (i + 1))) for i in range(3)]
+    cache = ManifestCache(cache_dir, max_bytes=0)
+    load_files(files, cache=cache)
+    assert os.listdir(cache_dir) == []
+
+
+def test_unwritable_cache_is_skipped(tmp_path):
+    filename = write(tmp_path / 'a.yaml', 'kind: ConfigMap\n')
+    # каталог кеша нельзя создать: на его месте - обычный файл
+    blocker = write(tmp_path / 'home', '')
+    cache = ManifestCache(os.path.join(blocker, '.cache', 'manifests'))
+    assert load_files([filename, filename], cache=cache) == [[{'kind': 'ConfigMap'}]] * 2
+    assert not cache.writable
@@ -0,0 +1,49 @@
+from dotdict import LazyDotDict
+from kube_deploy.backend import Backend, use_backend
+from kube_deploy.controller import NamespaceController
+from kube_deploy.resources import Pod
+
+
+class PagedBackend(Backend):
+    """ Отдает коллекцию из n объектов страницами по limit, как API сервер с continue """
+    name = 'paged'
+
+    def __init__(self, n):
+        super().__init__()
+        self.names = ['pod-%03d' % i for i in range(n)]
+        self.requests = []
+
+    def request(self, method, path, params=None, body=None, content_type='application/json'):
+        self.requests.append(dict(params or {}))
+        start = int(params.get('continue') or 0)
+        end = start + params['limit']
+        page = {'metadata': {'resourceVersion': '42'},
+                'items': [{'metadata': {'name': name}} for name in self.names[start:end]]}
+        if end < len(self.names):
+            page['metadata']['continue'] = str(end)
+        return LazyDotDict(page), 200, {}
+
+
+def test_iter_list_follows_continue():
+    fake = PagedBackend(25)
+    with use_backend(fake):
+        items = list(Pod.iter_list('test', page_size=10, label_selector='app=web'))
+    assert [item.metadata.name for item in items] == fake.names
+    assert all(item.kind == 'Pod' for item in items)
+    assert [(r['limit'], r.get('continue')) for r in fake.requests] == [(10, None), (10, '10'), (10, '20')]
+    assert all(r['labelSelector'] == 'app=web' for r in fake.requests)
+
+
+def test_iter_list_is_lazy():
+    fake = PagedBackend(100)
+    with use_backend(fake):
+        items = Pod.iter_list('test', page_size=10)
+        next(items)
+        assert len(fake.requests) == 1
+
+
+def test_list_names_collects_all_pages():
+    fake = PagedBackend(12)
+    with use_backend(fake):
+        names, resource_version = NamespaceController('test')._list_names(Pod, 'app=web')
+    assert names == set(fake.names) and resource_version == '42'
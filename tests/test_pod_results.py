@@ -0,0 +1,58 @@
+from dotdict import LazyDotDict
+from kube_deploy import resources
+from kube_deploy.backend import Backend, use_backend
+from kube_deploy.options import Options
+from kube_deploy.resources import Pod
+
+import super_apply
+
+
+class JobBackend(Backend):
+    """ Pod, контейнер которого уже завершился с exit_code; лог - одна строка """
+    name = 'job'
+
+    def __init__(self, exit_code):
+        super().__init__()
+        self.exit_code = exit_code
+        self.requests = []
+
+    def request(self, method, path, params=None, body=None, content_type='application/json'):
+        self.requests.append((method, path))
+        state = {'terminated': {'exitCode': self.exit_code, 'startedAt': '2026-01-01T00:00:00Z'}}
+        return LazyDotDict({'metadata': {'name': 'job'}, 'status': {'containerStatuses': [
+            {'name': 'job', 'restartCount': 0, 'containerID': 'c1', 'state': state, 'lastState': {}}]}}), 200, {}
+
+    def stream(self, method, path, params=None, timeout=None, on_open=None):
+        yield b'done\n'
+
+
+def _pod():
+    return Pod(LazyDotDict({'kind': 'Pod', 'metadata': {'name': 'job', 'namespace': 'test'},
+                            'spec': {'containers': [{'name': 'job'}]}}))
+
+
+def _process(monkeypatch, exit_code):
+    monkeypatch.setattr(Options, 'dry_run', False)
+    monkeypatch.setattr(Options, 'log_dir', None)
+    monkeypatch.setattr(Options, 'wait', 60)
+    console = []
+    monkeypatch.setattr(resources, 'CONSOLE', lambda *args: console.append(' '.join(map(str, args))))
+    monkeypatch.setattr(super_apply, 'print_container_log', lambda log, *args, **kwargs: list(log))
+    fake = JobBackend(exit_code)
+    with use_backend(fake):
+        rc = super_apply.process_pod_results(_pod())
+    return rc, console, fake.requests
+
+
+def test_failed_job_returns_exit_code(monkeypatch):
+    rc, console, requests = _process(monkeypatch, 3)
+    assert rc == 3
+    assert [line for line in console if line.startswith('#### Waiting')] == ['#### Waiting for container job/job']
+    # неудачный Pod остается для разбора
+    assert ('DELETE', '/api/v1/namespaces/test/pods/job') not in requests
+
+
+def test_successful_job_is_deleted(monkeypatch):
+    rc, console, requests = _process(monkeypatch, 0)
+    assert rc == 0
+    assert requests[-1] == ('DELETE', '/api/v1/namespaces/test/pods/job')
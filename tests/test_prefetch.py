@@ -0,0 +1,115 @@
+import copy
+import json
+
+import pytest
+from dotdict import LazyDotDict
+from kube_deploy.backend import Backend, use_backend
+from kube_deploy.kube import ApiError
+from kube_deploy.options import Options
+from kube_deploy.resources import LIVE_VIEW, CREATED, UPDATED, UNCHANGED, ConfigMap, prefetch_live_state
+
+
+class FakeBackend(Backend):
+    name = 'fake'
+
+    def __init__(self, objects):
+        super().__init__()
+        self.objects = objects
+        self.requests = []
+
+    def request(self, method, path, params=None, body=None, content_type='application/json'):
+        self.requests.append((method, path, params))
+        if method == 'GET':
+            return LazyDotDict({'metadata': {}, 'items': [dict(obj) for obj in self.objects]}), 200, {}
+        return LazyDotDict(dict(body, metadata=dict(body['metadata'], uid='new-uid'))), 201, {}
+
+
+def config_map(name, **labels):
+    return LazyDotDict({'kind': 'ConfigMap', 'metadata': {'name': name, 'namespace': 'test', 'labels': labels}})
+
+
+def test_prefetch_answers_apply_from_one_list(monkeypatch):
+    monkeypatch.setattr(Options, 'dry_run', False)
+    monkeypatch.setattr(Options, 'overwrite', True)
+    monkeypatch.setattr(Options, 'server_side', False)
+    fake = FakeBackend([{'metadata': {'name': 'a', 'uid': 'uid-a', 'labels': {'app': 'web'}}}])
+    docs = [config_map('a', app='web'), config_map('b', app='web')]
+
+    with use_backend(fake):
+        prefetch_live_state('test', docs)
+        assert fake.requests == [('GET', '/api/v1/namespaces/test/configmaps',
+                                  {'labelSelector': 'app=web', 'limit': 500})]
+        assert LIVE_VIEW.lookup('ConfigMap', 'test', 'a')[1].metadata.uid == 'uid-a'
+        assert LIVE_VIEW.lookup('ConfigMap', 'test', 'b') == (True, None)
+
+        fake.requests = []
+        monkeypatch.setattr(ConfigMap, 'patch', lambda self: None)
+        assert ConfigMap(docs[0])._apply_resource() == UPDATED
+        assert docs[0].metadata.uid == 'uid-a'
+        assert ConfigMap(docs[1])._apply_resource() == CREATED
+        assert [method for method, __, __ in fake.requests] == ['POST']
+
+    # другой backend (кластер) снимок не видит
+    assert LIVE_VIEW.lookup('ConfigMap', 'test', 'a') == (False, None)
+
+
+def test_prefetch_lists_whole_kind_when_apps_differ():
+    fake = FakeBackend([])
+    with use_backend(fake):
+        prefetch_live_state('test', [config_map('a', app='web'), config_map('b')])
+    assert fake.requests == [('GET', '/api/v1/namespaces/test/configmaps', {'labelSelector': None, 'limit': 500})]
+
+
+class ApplyBackend(FakeBackend):
+    """ PATCH apply-patch: 201 для нового объекта, для известного - объект с resourceVersion из live """
+
+    def request(self, method, path, params=None, body=None, content_type='application/json'):
+        if method != 'PATCH':
+            return super().request(method, path, params, body, content_type)
+        self.requests.append((method, path, params))
+        name = path.rsplit('/', 1)[1]
+        for obj in self.objects:
+            if obj['metadata']['name'] == name:
+                return LazyDotDict(copy.deepcopy(obj)), 200, {'Date': 'Thu, 01 Jan 2026 00:00:00 GMT'}
+        body = json.loads(body)
+        return LazyDotDict(dict(body, metadata=dict(body['metadata'], uid='new-uid'))), 201, {}
+
+
+def test_server_side_apply_reports_outcome_by_resource_version(monkeypatch):
+    monkeypatch.setattr(Options, 'dry_run', False)
+    monkeypatch.setattr(Options, 'overwrite', True)
+    monkeypatch.setattr(Options, 'server_side', True)
+    live = {'metadata': {'name': 'a', 'uid': 'uid-a', 'resourceVersion': '7', 'generation': 1,
+                         'labels': {'app': 'web'},
+                         # запись managedFields моложе Date: эвристика сочла бы объект измененным
+                         'managedFields': [{'manager': Options.field_manager, 'operation': 'Apply',
+                                            'time': '2026-01-01T00:00:00Z'}]}}
+    fake = ApplyBackend([live])
+    docs = [config_map('a', app='web'), config_map('b', app='web')]
+
+    with use_backend(fake):
+        prefetch_live_state('test', docs)
+        assert ConfigMap(docs[0])._apply_resource() == UNCHANGED
+        assert ConfigMap(docs[1])._apply_resource() == CREATED
+
+        live['metadata'].update(resourceVersion='8', generation=2)
+        assert ConfigMap(docs[0])._apply_resource() == UPDATED
+
+
+class RacingBackend(FakeBackend):
+    """ Объект каждый раз исчезает к GET и снова появляется к POST """
+
+    def request(self, method, path, params=None, body=None, content_type='application/json'):
+        self.requests.append((method, path, params))
+        raise ApiError(404 if method == 'GET' else 409, 'race')
+
+
+def test_create_conflict_is_retried_once(monkeypatch):
+    monkeypatch.setattr(Options, 'dry_run', False)
+    monkeypatch.setattr(Options, 'overwrite', True)
+    monkeypatch.setattr(Options, 'server_side', False)
+    fake = RacingBackend([])
+    with use_backend(fake):
+        with pytest.raises(ApiError):
+            ConfigMap(config_map('a'))._apply_resource()
+    assert [method for method, __, __ in fake.requests] == ['GET', 'POST', 'GET', 'POST']
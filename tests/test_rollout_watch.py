@@ -0,0 +1,49 @@
+import threading
+import time
+
+from kube_deploy.backend import Backend, use_backend
+from kube_deploy.resources import Pod
+from kube_deploy.rollout import KindWatcher
+
+
+class QuietBackend(Backend):
+    """ watch, в который не приходит ни одного события: stream() ждет, пока соединение не оборвут """
+    name = 'quiet'
+
+    def __init__(self):
+        super().__init__()
+        self.opened = threading.Event()
+        self.aborted = threading.Event()
+
+    def stream(self, method, path, params=None, timeout=None, on_open=None):
+        on_open(self.aborted.set)
+        self.opened.set()
+        if not self.aborted.wait(timeout):
+            return
+        raise ConnectionError('connection aborted')
+        yield
+
+
+def test_stop_aborts_quiet_watch():
+    fake = QuietBackend()
+    events = []
+    with use_backend(fake):
+        watcher = KindWatcher(Pod, 'test', 'app=web', events)
+    watcher.start()
+    assert fake.opened.wait(5)
+
+    start = time.time()
+    watcher.stop()
+    watcher.join(5)
+    assert not watcher.is_alive()
+    assert time.time() - start < 1
+    assert events == []
+
+
+def test_stop_before_stream_opens():
+    fake = QuietBackend()
+    with use_backend(fake):
+        watch = Pod.watch('test')
+    watch.stop()
+    assert list(watch.stream()) == []
+    assert not fake.opened.is_set()
@@ -0,0 +1,107 @@
+import threading
+import time
+
+import pytest
+from dotdict import LazyDotDict
+from kube_deploy.scheduler import ApplyScheduler, DependencyCycleError
+
+import super_apply
+
+
+class Options:
+    app_name = 'web'
+
+
+def _doc(kind, name, app='web', config_maps=()):
+    doc = {'kind': kind, 'metadata': {'name': name, 'labels': {'app': app}}}
+    env_from = [{'configMapRef': {'name': config_map}} for config_map in config_maps]
+    if kind == 'Deployment':
+        doc['spec'] = {'template': {'spec': {'containers': [{'name': 'app', 'envFrom': env_from}]}}}
+    elif kind == 'Pod':
+        doc['spec'] = {'containers': [{'name': 'job', 'envFrom': env_from}]}
+    return LazyDotDict(doc)
+
+
+def _graph(*docs):
+    app = super_apply.AppData(Options)
+    for doc in docs:
+        if doc.kind == 'Deployment':
+            app.index_deployment(doc)
+    rows = sorted([(None, doc) for doc in docs], key=lambda row: super_apply.apply_tier(row[1]))
+    names = ['%s/%s' % (doc.kind, doc.metadata.name) for __, doc in rows]
+    return {names[i]: {names[j] for j in deps} for i, deps in super_apply.build_apply_graph(app, rows).items()}
+
+
+def test_graph_narrows_config_maps_and_deployments():
+    graph = _graph(_doc('Service', 'web'), _doc('Service', 'db', app='db'),
+                   _doc('Deployment', 'web', config_maps=['web-config']), _doc('Deployment', 'db', app='db'),
+                   _doc('ConfigMap', 'web-config'), _doc('ConfigMap', 'db-config'),
+                   _doc('Secret', 'token'), _doc('Pod', 'migrate', config_maps=['db-config']))
+    assert graph == {
+        'ConfigMap/web-config': set(),
+        'ConfigMap/db-config': set(),
+        # неизвестные kind ждут все ConfigMap
+        'Secret/token': {'ConfigMap/web-config', 'ConfigMap/db-config'},
+        'Pod/migrate': {'ConfigMap/db-config'},
+        'Deployment/web': {'ConfigMap/web-config', 'Secret/token', 'Pod/migrate'},
+        'Deployment/db': {'Secret/token', 'Pod/migrate'},
+        'Service/web': {'Deployment/web', 'Secret/token', 'Pod/migrate', 'ConfigMap/web-config',
+                        'ConfigMap/db-config'},
+        'Service/db': {'Deployment/db', 'Secret/token', 'Pod/migrate', 'ConfigMap/web-config',
+                       'ConfigMap/db-config'},
+    }
+
+
+def test_dependencies_run_first():
+    order = []
+    lock = threading.Lock()
+
+    def task(node):
+        time.sleep(0.01 if node == 'a' else 0)
+        with lock:
+            order.append(node)
+
+    ApplyScheduler(4).run(['a', 'b', 'c', 'd'], {2: {0}, 3: {1, 2}}, task)
+    assert order.index('c') > order.index('a')
+    assert order.index('d') > max(order.index('b'), order.index('c'))
+
+    # один поток - исходный порядок
+    order.clear()
+    ApplyScheduler(1).run(['a', 'b', 'c', 'd'], {}, task)
+    assert order == ['a', 'b', 'c', 'd']
+
+
+def test_parallelism_limit():
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def task(node):
+        with lock:
+            running.append(node)
+            peak.append(len(running))
+        time.sleep(0.02)
+        with lock:
+            running.remove(node)
+
+    ApplyScheduler(3).run(list(range(10)), {}, task)
+    assert max(peak) == 3
+
+
+def test_stops_on_first_failure():
+    started = []
+
+    def task(node):
+        started.append(node)
+        if node == 'b':
+            raise RuntimeError('boom')
+
+    with pytest.raises(RuntimeError, match='boom'):
+        ApplyScheduler(1).run(['a', 'b', 'c', 'd'], {3: {0}}, task)
+    assert started == ['a', 'b']
+
+
+def test_dependency_cycle():
+    with pytest.raises(DependencyCycleError) as exc_info:
+        ApplyScheduler(2).run(['a', 'b', 'c'], {0: {1}, 1: {0}}, lambda node: None)
+    assert exc_info.value.args[0] == ['a', 'b']
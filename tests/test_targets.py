@@ -0,0 +1,42 @@
+import threading
+
+from kube_deploy.backend import backend
+from kube_deploy.scheduler import ApplyScheduler
+from kube_deploy.targets import Target, run_targets
+
+
+def make_targets(*namespaces):
+    return [Target(None, namespace, object()) for namespace in namespaces]
+
+
+def test_failure_does_not_abort_other_targets():
+    def task(target):
+        if target.namespace == 'b':
+            raise RuntimeError('boom')
+
+    results = run_targets(make_targets('a', 'b', 'c'), task, parallelism=3)
+    assert [result.ok for result in results] == [True, False, True]
+    assert str(results[1].error) == 'boom'
+
+
+def test_stop_on_failure_skips_remaining_targets():
+    def task(target):
+        raise RuntimeError('boom')
+
+    results = run_targets(make_targets('a', 'b', 'c'), task, parallelism=1, stop_on_failure=True)
+    assert [result.error is not None for result in results] == [True, False, False]
+    assert [result.skipped for result in results] == [False, True, True]
+
+
+def test_scheduler_threads_use_target_backend():
+    seen = {}
+    lock = threading.Lock()
+
+    def task(target):
+        def apply(node):
+            with lock:
+                seen[(target.namespace, node)] = backend() is target.backend
+        ApplyScheduler(2).run([1, 2, 3], {}, apply)
+
+    run_targets(make_targets('a', 'b'), task, parallelism=2)
+    assert len(seen) == 6 and all(seen.values())